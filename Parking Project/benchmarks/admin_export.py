@@ -0,0 +1,106 @@
+"""Throughput of the admin parking-records export, single process vs sharded.
+
+    python benchmarks/admin_export.py --records 200000 --workers 4
+
+Seeds a throwaway SQLite database, then exports every record twice: once as
+a single shard in this process (what a plain loop over the table does), and
+once split into id-range shards written by a process pool, the same
+write_shard()/stitch_admin_export() pair the Celery chord runs. Both outputs
+are read back to check the row count.
+"""
+import argparse
+import gzip
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(app, records):
+    from models import db, ParkingRecord, ParkingSpot, User
+
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'user{i}', 'password': 'x', 'email': f'user{i}@example.com'} for i in range(1000)
+        ])
+        spot_ids = [spot.id for spot in ParkingSpot.query.all()]
+        start = datetime.now() - timedelta(days=365)
+        batch = []
+        for i in range(records):
+            parked_at = start + timedelta(minutes=i)
+            batch.append({
+                'user_id': random.randint(1, 1000),
+                'spot_id': random.choice(spot_ids),
+                'vehicle_number': f'KA01AB{i % 10000:04d}',
+                'parked_at': parked_at,
+                'left_at': parked_at + timedelta(hours=2),
+                'parking_cost': 80.0
+            })
+            if len(batch) == 10000:
+                db.session.execute(ParkingRecord.__table__.insert(), batch)
+                batch = []
+        if batch:
+            db.session.execute(ParkingRecord.__table__.insert(), batch)
+        db.session.commit()
+
+
+def pool_shard(args):
+    from celery_worker import get_flask_app
+    from exports import write_shard
+
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        return write_shard(*args, batch_size=flask_app.config['ADMIN_EXPORT_BATCH_SIZE'])
+
+
+def run(app, job_dir, shard_count, workers):
+    from exports import shard_ranges, start_admin_export, stitch_admin_export, write_shard
+
+    os.makedirs(job_dir)
+    start = time.perf_counter()
+    with app.app_context():
+        ranges = shard_ranges(shard_count)
+        start_admin_export(job_dir, ranges)
+        jobs = [(job_dir, index, first, last) for index, (first, last) in enumerate(ranges)]
+        if workers == 1:
+            shards = [write_shard(*job, batch_size=app.config['ADMIN_EXPORT_BATCH_SIZE']) for job in jobs]
+        else:
+            with ProcessPoolExecutor(workers) as pool:
+                shards = list(pool.map(pool_shard, jobs))
+        manifest = stitch_admin_export(job_dir, shards)
+    elapsed = time.perf_counter() - start
+
+    with gzip.open(os.path.join(job_dir, manifest['file']), 'rt', encoding='utf-8') as f:
+        rows_read = sum(1 for _ in f) - 1
+    assert rows_read == manifest['rows'], (rows_read, manifest['rows'])
+    return elapsed, manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=200000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ['DATABASE_URL'] = f'sqlite:///{tmp}/bench.db'
+
+    from main import create_app, seed_initial_data
+
+    app = create_app()
+    seed_initial_data(app)
+    seed(app, args.records)
+
+    for name, shard_count, workers in (('single', 1, 1), (f'{args.workers} shards', args.workers, args.workers)):
+        elapsed, manifest = run(app, os.path.join(tmp, name.replace(' ', '_')), shard_count, workers)
+        print(f"{name:10} {manifest['rows']:9d} rows  {elapsed:7.2f} s  "
+              f"{manifest['rows'] / elapsed:10.0f} rows/s  {manifest['bytes'] / 1e6:6.1f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""New-lot email fan-out: one SMTP connection per message vs. one per recipient chunk.
+
+    python benchmarks/email_fanout.py --recipients 100000 --chunk-size 500
+
+Messages go to a local SMTP stand-in (benchmarks/smtp_standin.py) started in a
+subprocess. The per-message baseline is timed on --baseline-sample recipients
+and extrapolated.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HTML_BODY = '<html><body>' + ('<p>New parking lot available near you. Book now!</p>' * 60) + '</body></html>'
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'SMTP stand-in did not start on port {port}')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--recipients', type=int, default=100000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    parser.add_argument('--baseline-sample', type=int, default=2000)
+    args = parser.parse_args()
+
+    port = free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'benchmarks', 'smtp_standin.py'), '--port', str(port)],
+                              stdout=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+
+        from flask_mail import Message
+        from main import create_app, mail
+        from tasks import send_messages
+
+        app = create_app({
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': port,
+            'MAIL_USE_TLS': False,
+            'MAIL_DEFAULT_SENDER': 'bench@parkeasy.local',
+        })
+        subject = 'New Parking Lot Available: Bench Lot'
+        body = "New parking lot 'Bench Lot' has been added at Bench Road"
+
+        def message(i):
+            return Message(subject=subject, recipients=[f'user{i}@example.com'], body=body, html=HTML_BODY)
+
+        with app.app_context():
+            start = time.perf_counter()
+            for i in range(args.baseline_sample):
+                mail.send(message(i))
+            baseline_rate = args.baseline_sample / (time.perf_counter() - start)
+
+            start = time.perf_counter()
+            failed = 0
+            for offset in range(0, args.recipients, args.chunk_size):
+                chunk = range(offset, min(offset + args.chunk_size, args.recipients))
+                results = send_messages([message(i) for i in chunk])
+                failed += sum(r['status'] != 'success' for r in results)
+            chunked_elapsed = time.perf_counter() - start
+
+        # Broker bytes: one task per recipient (the old per-message send) vs. one send_email_chunk per chunk
+        per_message = sum(len(json.dumps({'to': f'user{i}@example.com', 'subject': subject, 'body': body,
+                                          'html_body': HTML_BODY})) for i in range(args.recipients))
+        per_chunk = sum(len(json.dumps(['email_payload:new_lot:1:task-id',
+                                        [f'user{i}@example.com' for i in range(o, min(o + args.chunk_size, args.recipients))]]))
+                        for o in range(0, args.recipients, args.chunk_size))
+
+        print(f"recipients: {args.recipients}, chunk size: {args.chunk_size}")
+        print(f"  per-message connection  {baseline_rate:10.1f} msg/s  "
+              f"(~{args.recipients / baseline_rate:.0f}s for all, sampled on {args.baseline_sample})")
+        print(f"  chunked connection      {args.recipients / chunked_elapsed:10.1f} msg/s  "
+              f"({chunked_elapsed:.1f}s, failed={failed})")
+        print(f"  broker payload          {per_message / 1e6:10.1f} MB -> {per_chunk / 1e6:.1f} MB")
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Render cost per recipient for each email type.
+
+    python benchmarks/email_render.py --iterations 2000
+
+"cold" builds a fresh Jinja environment for every message (templates are
+parsed and compiled each time, like rebuilding the old f-strings). "warm"
+uses the module-level environment from emails.py, where templates are
+compiled once per worker and only per-recipient variables are rendered.
+Cold converts the HTML to text with html_to_text; warm renders the .txt
+templates. The inactive reminder reuses a pre-rendered lots fragment (HTML
+and text), as in tasks.py.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import emails  # noqa: E402
+from jinja2 import Environment  # noqa: E402
+
+
+def sample_contexts():
+    lot = SimpleNamespace(lot_name='Central Plaza', address='12 MG Road', pincode='560001',
+                          price_per_hour=40.0, number_of_spots=120)
+    lots = [{'lot_name': f'Lot {i}', 'address': f'{i} Ring Road', 'pincode': '560001',
+             'price_per_hour': 30.0 + i, 'available_spots': 10 + i, 'total_spots': 50}
+            for i in range(20)]
+    lots_html, lots_text = emails.render_fragment('inactive_reminder_lots.html', lots=lots)
+    start = datetime(2026, 9, 1, 9)
+    rows = [{'date': (start + timedelta(days=i)).strftime('%Y-%m-%d'), 'lot_name': f'Lot {i % 5}',
+             'vehicle_number': 'KA01AB1234', 'duration': f'{1 + i % 4:.1f}h', 'cost': 40.0 * (1 + i % 4)}
+            for i in range(15)]
+    stats = {'total_bookings': 15, 'total_spent': 1200.0, 'most_used_lot': 'Lot 1',
+             'avg_duration': '2.5 hours'}
+    return {
+        'new_lot': ('new_lot.html', lambda i: {'lot': lot}),
+        'inactive_reminder': ('inactive_reminder.html',
+                              lambda i: {'name': f'User {i}', 'lots_html': lots_html, 'lots_text': lots_text}),
+        'monthly_report': ('monthly_report.html',
+                           lambda i: {'name': f'User {i}', 'month_name': 'September', 'year': 2026,
+                                      'stats': stats, 'rows': rows}),
+        'parking_reminder': ('parking_reminder.html',
+                             lambda i: {'name': f'User {i}', 'message': 'Your booking ends in 30 minutes.'}),
+    }
+
+
+def cold_render(template_name, **context):
+    env = Environment(loader=emails.env.loader, autoescape=emails.env.autoescape,
+                      trim_blocks=True, lstrip_blocks=True)
+    context.setdefault('sent_on', emails.sent_on())
+    html = env.get_template(template_name).render(**context)
+    return html, emails.html_to_text(html)
+
+
+def per_recipient_us(render, template_name, make_context, iterations):
+    render(template_name, **make_context(0))  # warm-up
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        render(template_name, **make_context(i))
+        samples.append((time.perf_counter() - start) * 1e6)
+    return statistics.mean(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'email':18} {'cold us/msg':>12} {'warm us/msg':>12} {'speedup':>8}")
+    for name, (template_name, make_context) in sample_contexts().items():
+        cold = per_recipient_us(cold_render, template_name, make_context, max(args.iterations // 10, 1))
+        warm = per_recipient_us(emails.render_email, template_name, make_context, args.iterations)
+        print(f"{name:18} {cold:12.1f} {warm:12.1f} {cold / warm:7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""End-to-end load test of the user and admin flows against a throwaway database.
+
+    python benchmarks/load_test.py --clients 8 --duration 30
+    python benchmarks/load_test.py --compare benchmarks/results/20261019-120000-abc1234.json
+
+Runs offline: a temporary SQLite database (or DATABASE_URL), SimpleCache in
+place of Redis, the in-process task executor in place of Celery, and the SMTP
+stand-in for mail. Every client is a Flask test client in its own thread,
+logged in as its own user, running the weighted MIX below; admin summary
+requests go through an admin session. Prints p50/p95/p99 latency and requests
+per second per endpoint and writes them to benchmarks/results/ as JSON, named
+after the time and the git commit, for comparison across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import smtp_standin  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+PASSWORD = 'bench-pass'
+
+# Relative weights of the operations each client picks from
+MIX = [
+    ('search', 30),
+    ('dashboard', 25),
+    ('book_or_release', 25),
+    ('login', 10),
+    ('admin_summary', 10),
+]
+
+
+def seed(app, users, lots, spots_per_lot, history_per_user):
+    from werkzeug.security import generate_password_hash
+    from models import db, ParkingLot, ParkingRecord, ParkingSpot, User
+
+    password = generate_password_hash(PASSWORD)  # one hash for everyone: seeding stays fast
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'load{i}', 'password': password, 'email': f'load{i}@example.com'} for i in range(users)
+        ])
+        for i in range(lots):
+            lot = ParkingLot(lot_name=f'Load Lot {i}', address=f'{i} Load Street', pincode=f'{560000 + i}',
+                             price_per_hour=40.0, number_of_spots=spots_per_lot, is_active=True)
+            db.session.add(lot)
+            db.session.flush()
+            db.session.execute(ParkingSpot.__table__.insert(), [
+                {'spot_number': str(n), 'lot_id': lot.id, 'status': 'A', 'is_active': True}
+                for n in range(1, spots_per_lot + 1)
+            ])
+        db.session.commit()
+
+        user_ids = [row[0] for row in db.session.query(User.id).all()]
+        spot_ids = [row[0] for row in db.session.query(ParkingSpot.id).all()]
+        rng = random.Random(0)
+        now = datetime.now()
+        records = []
+        for user_id in user_ids:
+            for _ in range(history_per_user):
+                parked_at = now - timedelta(days=rng.uniform(1, 90))
+                records.append({'user_id': user_id, 'spot_id': rng.choice(spot_ids), 'vehicle_number': f'KA01LT{user_id:04d}',
+                                'parked_at': parked_at, 'left_at': parked_at + timedelta(hours=rng.uniform(0.5, 6)),
+                                'parking_cost': 80.0})
+        for start in range(0, len(records), 10000):
+            db.session.execute(ParkingRecord.__table__.insert(), records[start:start + 10000])
+        db.session.commit()
+
+
+class Client:
+    def __init__(self, app, index, lots, rng):
+        self.user = app.test_client()
+        self.admin = app.test_client()
+        self.username = f'load{index}'
+        self.lots = lots
+        self.rng = rng
+        self.booking_id = None
+
+    def login(self):
+        return self.user.post('/login', json={'username': self.username, 'password': PASSWORD})
+
+    def search(self):
+        return self.user.get('/api/parking-lots/search', query_string={'q': f'Load Lot {self.rng.randrange(self.lots)}'})
+
+    def dashboard(self):
+        return self.user.get('/api/user/dashboard')
+
+    def book_or_release(self):
+        if self.booking_id is None:
+            response = self.user.post('/api/user/book', json={'lot_id': self.rng.randint(1, self.lots + 1),
+                                                              'vehicle_number': f'KA01LT{self.username[4:]:0>4}'})
+            if response.status_code == 200:
+                self.booking_id = response.get_json()['booking']['id']
+            return 'book', response
+        response = self.user.post('/api/user/release', json={'booking_id': self.booking_id})
+        self.booking_id = None
+        return 'release', response
+
+    def admin_summary(self):
+        return self.admin.get('/api/admin/summary')
+
+
+def run_client(client, deadline, mix, samples):
+    names = [name for name, _ in mix]
+    weights = [weight for _, weight in mix]
+    while time.perf_counter() < deadline:
+        operation = client.rng.choices(names, weights)[0]
+        start = time.perf_counter()
+        result = getattr(client, operation)()
+        elapsed = time.perf_counter() - start
+        name, response = result if isinstance(result, tuple) else (operation, result)
+        samples.append((name, elapsed, response.status_code))
+
+
+def summarize(samples, seconds):
+    from request_timing import percentile
+
+    endpoints = {}
+    for name in sorted({s[0] for s in samples}):
+        times = sorted(s[1] for s in samples if s[0] == name)
+        statuses = [s[2] for s in samples if s[0] == name]
+        endpoints[name] = {
+            'requests': len(times),
+            'rps': round(len(times) / seconds, 2),
+            'p50_ms': round(percentile(times, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(times, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(times, 0.99) * 1000, 2),
+            'max_ms': round(times[-1] * 1000, 2),
+            'rejected': sum(1 for status in statuses if 400 <= status < 500),  # e.g. lot full
+            'errors': sum(1 for status in statuses if status >= 500)
+        }
+    times = sorted(s[1] for s in samples)
+    total = {
+        'requests': len(times),
+        'rps': round(len(times) / seconds, 2),
+        'p50_ms': round(percentile(times, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(times, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(times, 0.99) * 1000, 2),
+        'errors': sum(1 for s in samples if s[2] >= 500)
+    }
+    return endpoints, total
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(endpoints, total, previous=None):
+    print(f"{'endpoint':16} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rejected':>9} {'errors':>7}")
+    for name, row in list(endpoints.items()) + [('total', dict(total, rejected=''))]:
+        line = (f"{name:16} {row['requests']:9d} {row['rps']:8.1f} {row['p50_ms']:8.2f} {row['p95_ms']:8.2f} "
+                f"{row['p99_ms']:8.2f} {row['rejected']!s:>9} {row['errors']:7d}")
+        before = (previous or {}).get('total' if name == 'total' else 'endpoints', {})
+        before = before if name == 'total' else before.get(name)
+        if before:
+            line += (f"   p95 {row['p95_ms'] - before['p95_ms']:+8.2f} ms"
+                     f"  rps {(row['rps'] / before['rps'] - 1) * 100 if before['rps'] else 0:+6.1f}%")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load after warm-up')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--lots', type=int, default=10)
+    parser.add_argument('--spots-per-lot', type=int, default=20)
+    parser.add_argument('--history', type=int, default=50, help='past parking records per user')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--compare', help='earlier results JSON to diff against')
+    parser.add_argument('--no-save', action='store_true')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    server = smtp_standin.start()
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tmp}/load.db')
+    os.environ.update({
+        'CELERY_BROKER_URL': '',  # in-process task executor
+        'CACHE_TYPE': 'SimpleCache',
+        'MAIL_SERVER': '127.0.0.1',
+        'MAIL_PORT': str(server.server_address[1]),
+        'MAIL_USE_TLS': '0',
+        'MAIL_RATE_LIMIT_REDIS_URL': '',
+    })
+
+    from main import create_app, seed_initial_data
+
+    app = create_app({
+        'MAIL_DEFAULT_SENDER': 'noreply@parkeasy.local',
+        'METRICS_DIR': os.path.join(tmp, 'metrics'),
+        'EXPORT_DIR': os.path.join(tmp, 'exports'),
+        'ARCHIVE_DIR': os.path.join(tmp, 'archive'),
+        'PROFILE_DIR': os.path.join(tmp, 'profiles'),
+    })
+    seed_initial_data(app)
+    seed(app, args.users, args.lots, args.spots_per_lot, args.history)
+
+    clients = [Client(app, i % args.users, args.lots, random.Random(args.seed + i)) for i in range(args.clients)]
+    for client in clients:
+        client.login()
+        client.admin.post('/login', json={'username': 'admin', 'password': 'admin123'})
+        client.search()  # warm-up
+
+    samples = []
+    deadline = time.perf_counter() + args.duration
+    threads = [threading.Thread(target=run_client, args=(client, deadline, MIX, samples)) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    endpoints, total = summarize(samples, elapsed)
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print(f"{args.clients} clients, {elapsed:.1f} s, {app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0]}")
+    print_table(endpoints, total, previous)
+
+    if not args.no_save:
+        commit = git_commit()
+        result = {
+            'meta': {
+                'commit': commit,
+                'at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'database': app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0],
+                'args': vars(args),
+                'mix': dict(MIX),
+                'seconds': round(elapsed, 2)
+            },
+            'endpoints': endpoints,
+            'total': total
+        }
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{commit}.json")
+        with open(path, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"results written to {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Sustained send rate against a throttling SMTP provider, with and without the limiter.
+
+    python benchmarks/mail_ratelimit.py --messages 300 --provider-rate 50
+
+The SMTP stand-in plays a provider that allows --provider-rate messages per
+second (burst of one second) and answers "451 rate limit exceeded" beyond that.
+"unlimited" reproduces the old behaviour: send as fast as possible, no retry.
+"limited" goes through the token bucket at the provider rate, with jittered
+retries on 4xx replies.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import ratelimit  # noqa: E402
+import smtp_standin  # noqa: E402
+
+
+def start_provider(rate):
+    server = smtp_standin.start()
+    bucket = ratelimit.TokenBucket(rate, max(1, int(rate)))
+    server.rcpt_reply = lambda: '250 OK' if not bucket.try_take() else '451 4.7.0 Rate limit exceeded, slow down'
+    return server
+
+
+def run(app, messages, config):
+    from tasks import send_messages
+
+    app.config.update(config)
+    ratelimit._mail_limiter = None  # rebuild from the updated config
+    ratelimit._mail_metrics = None
+    with app.app_context():
+        start = time.perf_counter()
+        results = send_messages(list(messages))
+        elapsed = time.perf_counter() - start
+        metrics = ratelimit.get_mail_metrics(app.config).snapshot()
+    sent = sum(1 for r in results if r['status'] == 'success')
+    return sent, len(results) - sent, metrics.get('retried', 0), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=300)
+    parser.add_argument('--provider-rate', type=float, default=50)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/bench.db')
+    from flask_mail import Message
+    from main import create_app
+
+    for name, limited in (('unlimited', False), ('limited', True)):
+        server = start_provider(args.provider_rate)
+        app = create_app({
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_PORT': server.server_address[1],
+            'MAIL_USE_TLS': False,
+            'MAIL_DEFAULT_SENDER': 'noreply@parkeasy.local',
+            'MAIL_RATE_LIMIT_REDIS_URL': '',  # in-memory bucket for a single-process run
+        })
+        messages = [
+            Message(subject='New parking lot', recipients=[f'user{i}@example.com'],
+                    body='New parking lot available', sender='noreply@parkeasy.local')
+            for i in range(args.messages)
+        ]
+        sent, failed, retried, elapsed = run(app, messages, {
+            'MAIL_RATE_PER_SECOND': args.provider_rate if limited else 0,
+            'MAIL_RATE_BURST': 0,
+            'MAIL_RETRY_ATTEMPTS': 5 if limited else 1,
+            'MAIL_RETRY_BASE_SECONDS': 0.2,
+        })
+        server.shutdown()
+        print(f"{name:10} sent {sent:5d}  failed {failed:5d}  retried {retried:4d}  "
+              f"{elapsed:6.2f} s  {sent / elapsed:7.1f} msg/s (provider limit {args.provider_rate:g}/s)")
+
+
+if __name__ == '__main__':
+    main()
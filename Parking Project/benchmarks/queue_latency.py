@@ -0,0 +1,92 @@
+"""Maintenance task latency under a bulk-report backlog, one shared queue vs the routed queues.
+
+    python benchmarks/queue_latency.py --bulk 400 --bulk-ms 20 --probes 10
+
+Models the broker as FIFO queues and each worker as a pool of threads taking
+one message at a time (prefetch 1), so no Redis is needed. The backlog is --bulk
+send_monthly_report_chunk messages of --bulk-ms each; while it drains, a
+free_expired_spots message is sent every --probe-interval seconds and the time
+from send to start is recorded.
+
+"shared" is the old layout: every task on one queue served by --processes
+worker processes. "routed" looks each task up in TASK_ROUTES from
+celery_worker and splits the same processes between a maintenance worker (one
+process) and a bulk-reports worker (the rest).
+
+This is a model, not a Celery run: routing comes from the real table, but the
+queues and workers are simulated, so the latencies are estimates.
+"""
+import argparse
+import os
+import queue
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from celery_worker import TASK_ROUTES  # noqa: E402
+
+
+def work(q):
+    while True:
+        message = q.get()
+        if message is None:
+            return
+        message()
+
+
+def run(routed, bulk, bulk_ms, probes, probe_interval, processes):
+    latencies = []
+    done = threading.Semaphore(0)
+    workers = {'maintenance': 1, 'bulk-reports': processes - 1} if routed else {'celery': processes}
+    queues = {name: queue.Queue() for name in workers}
+    threads = [threading.Thread(target=work, args=(queues[name],), daemon=True)
+               for name, n in workers.items() for _ in range(n)]
+    for thread in threads:
+        thread.start()
+
+    def send(task_name, message):
+        queues[TASK_ROUTES[task_name]['queue'] if routed else 'celery'].put(message)
+
+    def probe(sent_at):
+        def message():
+            latencies.append(time.perf_counter() - sent_at)
+            done.release()
+        return message
+
+    for _ in range(bulk):
+        send('tasks.send_monthly_report_chunk', lambda: time.sleep(bulk_ms / 1000))
+    for _ in range(probes):
+        send('tasks.free_expired_spots', probe(time.perf_counter()))
+        time.sleep(probe_interval)
+    for _ in range(probes):
+        done.acquire()
+
+    for name, n in workers.items():
+        for _ in range(n):
+            queues[name].put(None)
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bulk', type=int, default=400)
+    parser.add_argument('--bulk-ms', type=float, default=20)
+    parser.add_argument('--probes', type=int, default=10)
+    parser.add_argument('--probe-interval', type=float, default=0.2)
+    parser.add_argument('--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"bulk backlog: {args.bulk} x {args.bulk_ms:g} ms on {args.processes} processes")
+    for name, routed in (('shared', False), ('routed', True)):
+        latencies = run(routed, args.bulk, args.bulk_ms, args.probes, args.probe_interval, args.processes)
+        print(f"{name:8} maintenance latency  median {statistics.median(latencies) * 1000:8.1f} ms  "
+              f"max {max(latencies) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
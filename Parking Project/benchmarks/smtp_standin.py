@@ -0,0 +1,93 @@
+"""Minimal local SMTP server that accepts and counts messages without delivering them.
+
+    python benchmarks/smtp_standin.py --port 1025
+    python benchmarks/smtp_standin.py --port 1025 --drop-after 50
+
+Point the app at it with MAIL_SERVER=127.0.0.1 MAIL_PORT=1025 MAIL_USE_TLS=0 in the environment,
+then e.g. `flask --app main drain-outbox`. --drop-after N cuts every connection
+without a reply when message N+1 starts, to exercise reconnects.
+"""
+import argparse
+import socketserver
+import threading
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b'\r\n')
+
+    def handle(self):
+        self.reply('220 localhost ParkEasy SMTP stand-in')
+        received = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors='replace').strip().upper()
+            if command.startswith('MAIL') and received == self.server.drop_after:
+                return  # hang up mid-conversation, like a server dropping an idle or busy client
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith('RCPT'):
+                self.reply(self.server.rcpt_reply())
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                size = 0
+                for data_line in self.rfile:
+                    if data_line in (b'.\r\n', b'.\n'):
+                        break
+                    size += len(data_line)
+                self.server.record(size)
+                received += 1
+                self.reply('250 OK queued')
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:  # MAIL, RSET, NOOP
+                self.reply('250 OK')
+
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, drop_after=None):
+        super().__init__(address, SMTPHandler)
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.messages = 0
+        self.bytes = 0
+        self.connections = 0
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def rcpt_reply(self):
+        return '250 OK'
+
+    def record(self, size):
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+
+
+def start(port=0, drop_after=None):
+    server = SMTPStandIn(('127.0.0.1', port), drop_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=1025)
+    parser.add_argument('--drop-after', type=int, default=None, help='messages per connection before hanging up')
+    args = parser.parse_args()
+    server = SMTPStandIn(('127.0.0.1', args.port), args.drop_after)
+    print(f"SMTP stand-in listening on 127.0.0.1:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"{server.messages} messages over {server.connections} connections")
@@ -0,0 +1,63 @@
+"""Per-task overhead of the Flask app/context setup, measured on a no-op task.
+
+    python benchmarks/task_overhead.py --iterations 200
+
+"before" reproduces the old behaviour: ContextTask and the task body each
+called create_app(). "after" runs a no-op task through the per-process app
+singleton. Both run eagerly (task.apply), so no broker is needed.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def timed(fn, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_URL', f'sqlite:///{tempfile.mkdtemp()}/bench.db')
+
+    from celery_worker import celery, get_flask_app
+    from main import create_app
+    from models import db
+
+    @celery.task(bind=True)
+    def noop(self):
+        flask_app = get_flask_app()
+        with flask_app.app_context():
+            db.session.execute(db.text('SELECT 1'))
+
+    def before():
+        outer_app = create_app()
+        with outer_app.app_context():
+            flask_app = create_app()
+            with flask_app.app_context():
+                db.session.execute(db.text('SELECT 1'))
+
+    def after():
+        noop.apply()
+
+    after()  # build the singleton outside the measurement
+    for name, fn in (('before', before), ('after', after)):
+        samples = timed(fn, args.iterations)
+        print(f"{name:7} mean {statistics.mean(samples):8.3f} ms   "
+              f"p95 {sorted(samples)[int(len(samples) * 0.95) - 1]:8.3f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,158 @@
+import os
+import sys
+import threading
+import time
 from celery import Celery
 from celery.schedules import crontab
+from flask import current_app, has_app_context
+from kombu import Queue
+from local_tasks import submit_local
+from metrics import QUERY_COUNT_BUCKETS, registry, start_query_tracking, stop_query_tracking
+from profiling import should_sample, start_profile, stop_profile
+from celery.signals import before_task_publish, task_postrun, task_prerun, worker_process_init, worker_process_shutdown
+
+# One queue per kind of work, so a monthly-report fan-out never sits in front of
+# the time-critical maintenance tasks or a user's export
+TASK_QUEUES = ('maintenance', 'notifications', 'bulk-reports', 'user-exports')
+
+TASK_ROUTES = {
+    'tasks.free_expired_spots': {'queue': 'maintenance'},
+    'tasks.check_parking_lot_availability': {'queue': 'maintenance'},
+    'tasks.cleanup_old_records': {'queue': 'maintenance'},
+    'tasks.dispatch_email_outbox': {'queue': 'notifications'},
+    'tasks.send_parking_reminder_notification': {'queue': 'notifications'},
+    'tasks.send_instant_new_lot_email': {'queue': 'notifications'},
+    'tasks.send_email_chunk': {'queue': 'notifications'},
+    'tasks.get_inactive_users_today': {'queue': 'notifications'},
+    'tasks.send_daily_inactive_reminder': {'queue': 'bulk-reports'},
+    'tasks.send_inactive_reminder_chunk': {'queue': 'bulk-reports'},
+    'tasks.send_all_monthly_reports': {'queue': 'bulk-reports'},
+    'tasks.send_monthly_report_chunk': {'queue': 'bulk-reports'},
+    'tasks.export_all_parking_records': {'queue': 'bulk-reports'},
+    'tasks.export_parking_records_shard': {'queue': 'bulk-reports'},
+    'tasks.finish_parking_records_export': {'queue': 'bulk-reports'},
+    'tasks.generate_monthly_report': {'queue': 'user-exports'},
+    'tasks.export_user_parking_csv': {'queue': 'user-exports'},
+}
+
+# Worker per queue (celery worker -Q <queue> -c <concurrency> --prefetch-multiplier <n>).
+# Long tasks prefetch one at a time so a busy process does not hold messages an idle one could run.
+QUEUE_WORKERS = {
+    'maintenance': {'concurrency': 1, 'prefetch_multiplier': 1},
+    'notifications': {'concurrency': 4, 'prefetch_multiplier': 4},
+    'bulk-reports': {'concurrency': 2, 'prefetch_multiplier': 1},
+    'user-exports': {'concurrency': 2, 'prefetch_multiplier': 1},
+}
+
+def worker_command(queue):
+    # `flask --app main worker-commands` prints one of these per queue
+    settings = QUEUE_WORKERS[queue]
+    return (f"celery -A celery_worker.celery worker -Q {queue} -c {settings['concurrency']} "
+            f"--prefetch-multiplier {settings['prefetch_multiplier']} -n {queue}@%h --loglevel=info")
+
+# Results are read back for chords and to check a bulk run's chunks (the parent
+# returns their ids); keep them long enough for that, not longer
+RESULT_EXPIRES_SECONDS = 6 * 3600
+
+_flask_app = None
+_flask_app_lock = threading.Lock()
+
+def get_flask_app():
+    # One Flask app per worker process: config, blueprints, extensions and the
+    # DB connection pool are built once and reused by every task
+    global _flask_app
+    if _flask_app is None:
+        with _flask_app_lock:
+            if _flask_app is None:
+                sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+                from main import create_app
+                _flask_app = create_app()
+    return _flask_app
+
+@worker_process_init.connect
+def reset_db_pool_after_fork(**kwargs):
+    # Pooled connections inherited from the parent must not be shared with forked children
+    if _flask_app is not None:
+        from models import db
+        with _flask_app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+@before_task_publish.connect
+def stamp_sent_at(headers=None, **kwargs):
+    # Read back in task_prerun to measure how long the task waited in the queue
+    headers['sent_at'] = time.time()
+
+# task id -> (start time, query tracking start) while the task runs
+_running_tasks = {}
+
+@task_prerun.connect
+def start_task_metrics(task_id=None, task=None, **kwargs):
+    request = task.request
+    sent_at = getattr(request, 'sent_at', None) or (request.headers or {}).get('sent_at')
+    if sent_at and not request.eta:
+        registry.observe('parkeasy_task_queue_wait_seconds', (('task', task.name),), max(0.0, time.time() - sent_at))
+    _running_tasks[task_id] = (time.perf_counter(), start_query_tracking())
+
+@task_postrun.connect
+def record_task_metrics(task_id=None, task=None, retval=None, state=None, **kwargs):
+    started = _running_tasks.pop(task_id, None)
+    if started is None:
+        return
+    runtime = time.perf_counter() - started[0]
+    queries, _ = stop_query_tracking(started[1])
+    labels = (('task', task.name),)
+    registry.observe('parkeasy_task_runtime_seconds', labels, runtime)
+    registry.observe('parkeasy_task_db_queries', labels, queries, QUERY_COUNT_BUCKETS)
+    # Most tasks catch their own errors and return {'status': 'failed'}
+    if state == 'SUCCESS' and isinstance(retval, dict) and retval.get('status') == 'failed':
+        outcome = 'failed'
+    else:
+        outcome = (state or 'unknown').lower()
+    registry.inc('parkeasy_tasks_total', labels + (('outcome', outcome),))
+    config = get_flask_app().config
+    registry.maybe_flush(config['METRICS_DIR'], config['METRICS_FLUSH_SECONDS'])
+
+# task id -> Profile for the sampled tasks (PROFILE_TASK_SAMPLE_RATE)
+_task_profiles = {}
+
+@task_prerun.connect
+def start_task_profile(task_id=None, task=None, **kwargs):
+    config = get_flask_app().config
+    if should_sample(config['PROFILE_TASK_SAMPLE_RATE']):
+        profile = start_profile(task.name, 'sampled', config)
+        if profile is not None:
+            _task_profiles[task_id] = profile
+
+@task_postrun.connect
+def save_task_profile(task_id=None, **kwargs):
+    profile = _task_profiles.pop(task_id, None)
+    if profile is not None:
+        stop_profile(profile, get_flask_app().config)
+
+@worker_process_shutdown.connect
+def flush_task_metrics(**kwargs):
+    if _flask_app is not None:
+        registry.flush(_flask_app.config['METRICS_DIR'])
 
 def make_celery(app_name=__name__):
     celery = Celery(app_name)
     
     # Configure Celery
     celery.conf.update(
-        broker_url='redis://localhost:6379/0',
-        result_backend='redis://localhost:6379/0',
+        # Until init_celery applies the Flask config: what `celery worker` starts with
+        broker_url=os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
+        result_backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'),
         task_serializer='json',
         result_serializer='json',
         accept_content=['json'],
         timezone='Asia/Kolkata',
         enable_utc=True,
+        task_queues=[Queue(name) for name in TASK_QUEUES],
+        task_default_queue='notifications',
+        task_routes=TASK_ROUTES,
+        worker_prefetch_multiplier=1,
+        result_expires=RESULT_EXPIRES_SECONDS,
     )
     
     # Configure Celery Beat schedule for periodic tasks
@@ -22,6 +162,16 @@ def make_celery(app_name=__name__):
             'task': 'tasks.free_expired_spots',
             'schedule': 300.0,  # 5 minutes
         },
+        # Refresh the per-lot occupancy snapshot behind /metrics
+        'check-parking-lot-availability': {
+            'task': 'tasks.check_parking_lot_availability',
+            'schedule': 60.0,
+        },
+        # Send queued outbox emails (also kicked right after rows are written)
+        'dispatch-email-outbox': {
+            'task': 'tasks.dispatch_email_outbox',
+            'schedule': 30.0,
+        },
         # Send daily inactive user reminders at 6 PM
         'daily-inactive-reminder': {
             'task': 'tasks.send_daily_inactive_reminder',
@@ -34,16 +184,22 @@ def make_celery(app_name=__name__):
         },
     }
     
-    # Context-aware task base
+    # Context-aware task base: pushes a fresh app context on the shared app, so each
+    # task gets its own DB session, removed again when the context is torn down
     class ContextTask(celery.Task):
         def __call__(self, *args, **kwargs):
-            import sys
-            import os
-            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-            from main import create_app
-            flask_app = create_app()
+            flask_app = get_flask_app()
             with flask_app.app_context():
                 return self.run(*args, **kwargs)
+        
+        def apply_async(self, args=None, kwargs=None, task_id=None, **options):
+            if uses_broker():
+                return super().apply_async(args, kwargs, task_id=task_id, **options)
+            # No broker: run in this process, with the web app doubling as the worker app
+            global _flask_app
+            if _flask_app is None and has_app_context():
+                _flask_app = current_app._get_current_object()
+            return submit_local(self, args, kwargs, task_id, get_flask_app().config)
     
     celery.Task = ContextTask
     
@@ -52,5 +208,15 @@ def make_celery(app_name=__name__):
 # Create the celery instance
 celery = make_celery('parking_app')
 
+def init_celery(app):
+    # Called by create_app once its overrides are in: the app's CELERY_BROKER_URL,
+    # not the environment at import time, decides between broker and in-process
+    celery.conf.broker_url = app.config['CELERY_BROKER_URL']
+    celery.conf.result_backend = app.config['CELERY_RESULT_BACKEND']
+
+def uses_broker():
+    # CELERY_BROKER_URL= (empty) runs tasks in-process through local_tasks instead
+    return bool(celery.conf.broker_url)
+
 # Import all tasks so they get registered
 from tasks import *
\ No newline at end of file
@@ -0,0 +1,181 @@
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import select
+
+from celery_worker import TASK_QUEUES, worker_command
+from datagen import GENERATED_PASSWORD, generate, history_end
+from models import db, ParkingLot, ParkingSpot, ParkingRecord
+from outbox import outbox_counts
+
+
+def hot_queries():
+    now = datetime.now()
+    month_start = now - timedelta(days=30)
+    return [
+        # book_parking / get_user_stats / dashboard: user's active booking
+        ('active_booking_by_user', select(ParkingRecord.id).where(
+            ParkingRecord.user_id == 1, ParkingRecord.left_at == None)),
+        # manage_lots / view_spots: active session on a spot
+        ('active_booking_by_spot', select(ParkingRecord.id).where(
+            ParkingRecord.spot_id == 1, ParkingRecord.left_at == None)),
+        # free_expired_spots
+        ('expired_active_bookings', select(ParkingRecord.id).where(
+            ParkingRecord.left_at == None, ParkingRecord.parked_at < now - timedelta(hours=24))),
+        # get_user_dashboard_data / get_user_parking_history / get_user_bookings
+        ('user_recent_bookings', select(ParkingRecord.id).where(
+            ParkingRecord.user_id == 1).order_by(ParkingRecord.parked_at.desc()).limit(10)),
+        # get_daily_summary
+        ('user_bookings_in_range', select(ParkingRecord.id).where(
+            ParkingRecord.user_id == 1, ParkingRecord.parked_at >= month_start, ParkingRecord.parked_at < now)),
+        # build_monthly_reports: one chunk of users at a time
+        ('users_bookings_in_range', select(ParkingRecord.id).where(
+            ParkingRecord.user_id.in_([1, 2, 3]), ParkingRecord.parked_at >= month_start, ParkingRecord.parked_at < now)),
+        # get_inactive_users_today / cleanup_old_records
+        ('bookings_in_range', select(ParkingRecord.user_id).where(
+            ParkingRecord.parked_at >= month_start, ParkingRecord.parked_at < now)),
+        # book_parking: first available spot in a lot
+        ('available_spot_in_lot', select(ParkingSpot.id).where(
+            ParkingSpot.lot_id == 1, ParkingSpot.status == 'A', ParkingSpot.is_active == True).limit(1)),
+        # search_parking_lots / get_all_parking_lots availability counts
+        ('active_spots_in_lot', select(ParkingSpot.id).where(
+            ParkingSpot.lot_id == 1, ParkingSpot.is_active == True)),
+        # manage_lots / search_parking_lots / send_daily_inactive_reminder
+        ('active_lots', select(ParkingLot.id).where(ParkingLot.is_active == True)),
+    ]
+
+
+def explain(stmt):
+    connection = db.session.connection()
+    # render_postcompile expands IN lists into individual parameters
+    compiled = stmt.compile(dialect=connection.dialect, compile_kwargs={'render_postcompile': True})
+    if compiled.positional:
+        params = tuple(compiled.params[name] for name in compiled.positiontup)
+    else:
+        params = compiled.params
+
+    if connection.dialect.name == 'sqlite':
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).all()
+        return [row[-1] for row in rows]
+
+    # Tiny tables make the planner prefer sequential scans; ask whether an index path exists at all
+    connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+    rows = connection.exec_driver_sql('EXPLAIN ' + str(compiled), params).all()
+    return [row[0] for row in rows]
+
+
+def full_scans(plan):
+    scans = []
+    for line in plan:
+        # SQLite: "SCAN parking_records", also "USING [COVERING] INDEX ..." (every index entry is read,
+        # e.g. to satisfy ORDER BY); Postgres: "Seq Scan on parking_records"
+        if re.match(r'^SCAN \w+( USING (COVERING )?INDEX \w+)?$', line.strip()) or 'Seq Scan' in line:
+            scans.append(line.strip())
+    return scans
+
+
+def register_commands(app):
+
+    @app.cli.command('check-query-plans')
+    @click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+    def check_query_plans(verbose):
+        """Fail if any hot query falls back to a full table scan."""
+        failures = 0
+        for name, stmt in hot_queries():
+            plan = explain(stmt)
+            scans = full_scans(plan)
+            status = 'FULL SCAN' if scans else 'ok'
+            click.echo(f"{name:28} {status}")
+            if scans or verbose:
+                for line in plan:
+                    click.echo(f"    {line}")
+            failures += bool(scans)
+        db.session.rollback()
+
+        if failures:
+            click.echo(f"❌ {failures} hot queries fall back to a full scan")
+            sys.exit(1)
+        click.echo("✅ All hot queries use an index")
+
+    @app.cli.command('sync-replicas')
+    @click.option('--interval', type=float, default=0, help='Keep copying every N seconds (0 = copy once).')
+    def sync_replicas(interval):
+        """Copy the primary SQLite database onto each replica file (local stand-in for replication)."""
+        primary = db.engine.url
+        replicas = [db.engines[key].url for key in app.config['DB_REPLICA_BINDS']]
+        if primary.get_backend_name() != 'sqlite' or not replicas:
+            click.echo("❌ sync-replicas needs a SQLite DATABASE_URL and DATABASE_REPLICA_URLS")
+            sys.exit(1)
+        if any(url.get_backend_name() != 'sqlite' for url in replicas):
+            click.echo("❌ All DATABASE_REPLICA_URLS must be SQLite files")
+            sys.exit(1)
+
+        while True:
+            source = sqlite3.connect(primary.database)
+            for url in replicas:
+                target = sqlite3.connect(url.database)
+                source.backup(target)
+                target.close()
+            source.close()
+            click.echo(f"✅ Synced {len(replicas)} replica(s) at {datetime.now().strftime('%H:%M:%S')}")
+            if not interval:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('drain-outbox')
+    @click.option('--loop', is_flag=True, help='Keep dispatching instead of stopping when nothing is due.')
+    @click.option('--interval', type=float, default=5, help='Seconds between passes with --loop.')
+    def drain_outbox_command(loop, interval):
+        """Send due email_outbox rows now, e.g. against benchmarks/smtp_standin.py."""
+        from tasks import drain_outbox
+
+        while True:
+            totals = drain_outbox(app.config)
+            counts = outbox_counts()
+            click.echo(f"{datetime.now().strftime('%H:%M:%S')} sent {totals['sent']}, retrying {totals['retrying']}, "
+                       f"failed {totals['failed']} | pending {counts.get('pending', 0)}, "
+                       f"sent total {counts.get('sent', 0)}, failed total {counts.get('failed', 0)}")
+            if not loop:
+                break
+            time.sleep(interval)
+
+    @app.cli.command('worker-commands')
+    def worker_commands():
+        """Print the Celery worker command for each queue (concurrency and prefetch from QUEUE_WORKERS)."""
+        for queue in TASK_QUEUES:
+            click.echo(worker_command(queue))
+
+    @app.cli.command('generate-data')
+    @click.option('--lots', type=int, default=200, show_default=True)
+    @click.option('--spots', type=int, default=20000, show_default=True, help='Total spots, split evenly across the lots.')
+    @click.option('--users', type=int, default=50000, show_default=True)
+    @click.option('--records', type=int, default=1000000, show_default=True, help='Historical parking records.')
+    @click.option('--days', type=int, default=365, show_default=True, help='Days of history the records span.')
+    @click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Last day of history, included in full (default yesterday); fix it to reproduce a dataset exactly.')
+    @click.option('--seed', type=int, default=1, show_default=True)
+    @click.option('--batch-size', type=int, default=10000, show_default=True)
+    def generate_data(lots, spots, users, records, days, end, seed, batch_size):
+        """Add generated lots, spots, users and parking history at production scale."""
+        from main import seed_initial_data
+
+        if lots < 1 or spots < lots or users < 1 or days < 1:
+            click.echo("❌ Need at least one lot, one spot per lot, one user and one day of history")
+            sys.exit(1)
+        seed_initial_data(app)
+
+        started = time.perf_counter()
+
+        def progress(done):
+            elapsed = time.perf_counter() - started
+            click.echo(f"  {done:,}/{records:,} records ({done / elapsed:,.0f}/s)")
+
+        end = history_end(end.date() if end else None)
+        lot_count, user_count = generate(lots, spots, users, records, days=days, seed=seed, end=end,
+                                         batch_size=batch_size, progress=progress if records >= batch_size * 10 else None)
+        click.echo(f"✅ Generated {lot_count} lots, {spots} spots, {user_count} users and {records:,} records "
+                   f"through {(end - timedelta(days=1)).date()} in {time.perf_counter() - started:.1f}s (seed {seed}, password '{GENERATED_PASSWORD}')")
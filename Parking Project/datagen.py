@@ -0,0 +1,184 @@
+import itertools
+import math
+import random
+import string
+from datetime import datetime, time, timedelta
+
+from sqlalchemy import func, select
+from werkzeug.security import generate_password_hash
+
+from models import db, ParkingLot, ParkingRecord, ParkingSpot, User
+
+# Relative arrival rate per hour of day: morning commute, lunch, evening peak
+ARRIVALS_BY_HOUR = (1, 1, 1, 1, 2, 4, 10, 22, 30, 24, 16, 14, 16, 14, 12, 13, 17, 22, 20, 14, 9, 6, 3, 2)
+# Weekends see fewer arrivals (Monday = 0)
+ARRIVALS_BY_WEEKDAY = (1.0, 1.0, 1.0, 1.0, 1.05, 0.7, 0.5)
+
+# Lognormal stay in hours: median ~1.5 h, a long tail of all-day stays.
+# free_expired_spots checks out anything older than 24 h, so nothing stays longer.
+DURATION_MEDIAN_HOURS = 1.5
+DURATION_SIGMA = 1.1
+MAX_DURATION_HOURS = 24
+
+# Zipf exponents: a few lots take most bookings, and frequent parkers outweigh occasional ones
+LOT_POPULARITY_SKEW = 1.1
+USER_ACTIVITY_SKEW = 0.8
+
+PRICES_PER_HOUR = (20.0, 30.0, 40.0, 50.0, 60.0, 80.0, 100.0)
+GENERATED_PASSWORD = 'password123'
+
+
+def zipf_cum_weights(n, skew, rng):
+    # Shuffled so popularity is not simply id order
+    weights = [1 / (rank ** skew) for rank in range(1, n + 1)]
+    rng.shuffle(weights)
+    return list(itertools.accumulate(weights))
+
+
+def split_evenly(total, parts):
+    base, extra = divmod(total, parts)
+    return [base + (1 if i < extra else 0) for i in range(parts)]
+
+
+def vehicle_number(rng):
+    letters = string.ascii_uppercase
+    return (f"{rng.choice(('KA', 'MH', 'DL', 'TN', 'TS', 'GJ'))}{rng.randint(1, 99):02d}"
+            f"{rng.choice(letters)}{rng.choice(letters)}{rng.randint(1, 9999):04d}")
+
+
+def arrival_slots(days, end):
+    # (start of hour, cumulative weight) for every hour of the history
+    first_day = end - timedelta(days=days)
+    slots = []
+    cum_weights = []
+    total = 0
+    for day in range(days):
+        date = first_day + timedelta(days=day)
+        for hour, weight in enumerate(ARRIVALS_BY_HOUR):
+            total += weight * ARRIVALS_BY_WEEKDAY[date.weekday()]
+            slots.append(date + timedelta(hours=hour))
+            cum_weights.append(total)
+    return slots, cum_weights
+
+
+def _max_id(model):
+    return db.session.scalar(select(func.max(model.id))) or 0
+
+
+def _last_number(column, prefix, suffix=''):
+    # Highest n among existing prefix<n>suffix values: numbering continues after it, so
+    # a second run, or a name someone registered by hand, never hits a unique constraint
+    last = 0
+    for value in db.session.scalars(select(column).where(column.like(f'{prefix}%{suffix}'))):
+        number = value[len(prefix):len(value) - len(suffix)]
+        if number.isdigit():
+            last = max(last, int(number))
+    return last
+
+
+def _insert(table, rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        db.session.execute(table.insert(), rows[start:start + batch_size])
+
+
+def generate_lots(rng, lots, spots, batch_size):
+    offset = _max_id(ParkingLot)
+    name_offset = _last_number(ParkingLot.lot_name, 'Lot ')
+    sizes = split_evenly(spots, lots)
+    created_on = datetime.now()
+    _insert(ParkingLot.__table__, [{
+        'lot_name': f'Lot {name_offset + i + 1:06d}',
+        'address': f'{rng.randint(1, 999)} {rng.choice(("Main", "Market", "Station", "Park", "Lake", "Hill"))} Road',
+        'pincode': f'{rng.randint(110001, 855999)}',
+        'price_per_hour': rng.choice(PRICES_PER_HOUR),
+        'number_of_spots': size,
+        'is_active': True,
+        'created_on': created_on
+    } for i, size in enumerate(sizes)], batch_size)
+    lot_rows = db.session.execute(select(ParkingLot.id, ParkingLot.price_per_hour, ParkingLot.number_of_spots)
+                                  .where(ParkingLot.id > offset).order_by(ParkingLot.id)).all()
+
+    spot_offset = _max_id(ParkingSpot)
+    _insert(ParkingSpot.__table__, [
+        {'spot_number': str(n), 'lot_id': lot_id, 'status': 'A', 'is_active': True, 'created_on': created_on}
+        for lot_id, _, size in lot_rows for n in range(1, size + 1)
+    ], batch_size)
+    spot_rows = db.session.execute(select(ParkingSpot.id, ParkingSpot.lot_id)
+                                   .where(ParkingSpot.id > spot_offset).order_by(ParkingSpot.id)).all()
+
+    spots_by_lot = {lot_id: [] for lot_id, _, _ in lot_rows}
+    for spot_id, lot_id in spot_rows:
+        spots_by_lot[lot_id].append(spot_id)
+    # Lots without spots cannot take bookings
+    return [(lot_id, price, spots_by_lot[lot_id]) for lot_id, price, _ in lot_rows if spots_by_lot[lot_id]]
+
+
+def generate_users(rng, users, days, end, batch_size):
+    offset = _max_id(User)
+    name_offset = max(_last_number(User.username, 'user'), _last_number(User.email, 'user', '@example.com'))
+    # Hashing is deliberately slow, so every generated user shares one password
+    password = generate_password_hash(GENERATED_PASSWORD)
+    first_day = end - timedelta(days=days)
+    _insert(User.__table__, [{
+        'username': f'user{name_offset + i + 1}',
+        'password': password,
+        'email': f'user{name_offset + i + 1}@example.com',
+        'fullname': f'Generated User {name_offset + i + 1}',
+        'pincode': f'{rng.randint(110001, 855999)}',
+        'preferred_contact': 'email',
+        'created_on': first_day - timedelta(days=rng.randint(0, 365))
+    } for i in range(users)], batch_size)
+    return [user_id for user_id, in db.session.execute(
+        select(User.id).where(User.id > offset).order_by(User.id)).all()]
+
+
+def generate_records(rng, lots, user_ids, records, days, end, batch_size, progress=None):
+    slots, slot_weights = arrival_slots(days, end)
+    lot_weights = zipf_cum_weights(len(lots), LOT_POPULARITY_SKEW, rng)
+    user_weights = zipf_cum_weights(len(user_ids), USER_ACTIVITY_SKEW, rng)
+    vehicles = {user_id: vehicle_number(rng) for user_id in user_ids}
+    mu = math.log(DURATION_MEDIAN_HOURS)
+
+    done = 0
+    while done < records:
+        n = min(batch_size, records - done)
+        rows = []
+        for slot, lot_index, user_id in zip(rng.choices(slots, cum_weights=slot_weights, k=n),
+                                            rng.choices(range(len(lots)), cum_weights=lot_weights, k=n),
+                                            rng.choices(user_ids, cum_weights=user_weights, k=n)):
+            _, price, spot_ids = lots[lot_index]
+            parked_at = slot + timedelta(seconds=rng.randrange(3600))
+            hours = min(MAX_DURATION_HOURS, max(0.1, rng.lognormvariate(mu, DURATION_SIGMA)))
+            left_at = min(parked_at + timedelta(hours=hours), end)  # history ends at `end`; nothing left active
+            hours = max(0.1, (left_at - parked_at).total_seconds() / 3600)
+            rows.append({
+                'user_id': user_id,
+                'spot_id': spot_ids[rng.randrange(len(spot_ids))],
+                'vehicle_number': vehicles[user_id],
+                'parked_at': parked_at,
+                'left_at': left_at,
+                'parking_cost': round(hours * price, 2)  # as release_parking charges
+            })
+        db.session.execute(ParkingRecord.__table__.insert(), rows)
+        db.session.commit()
+        done += n
+        if progress:
+            progress(done)
+
+
+def history_end(last_day=None):
+    # Midnight after the last day (default yesterday, the last full day), so the
+    # same seed on the same --end gives the same rows
+    last_day = last_day or datetime.now().date() - timedelta(days=1)
+    return datetime.combine(last_day, time()) + timedelta(days=1)
+
+
+def generate(lots, spots, users, records, days=365, seed=1, end=None, batch_size=10000, progress=None):
+    rng = random.Random(seed)
+    end = end or history_end()
+    lot_spots = generate_lots(rng, lots, spots, batch_size)
+    user_ids = generate_users(rng, users, days, end, batch_size)
+    db.session.commit()
+    if records and lot_spots and user_ids:
+        generate_records(rng, lot_spots, user_ids, records, days, end, batch_size, progress)
+    return len(lot_spots), len(user_ids)
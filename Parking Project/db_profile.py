@@ -0,0 +1,83 @@
+import os
+
+from sqlalchemy import event
+
+DEFAULT_DATABASE_URL = 'sqlite:///parking_app.db'
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def configure_database(app):
+    url = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['DB_TUNING'] = os.environ.get('DB_TUNING', '1') != '0'
+
+    # Read replicas for endpoints marked @read_only (comma-separated URLs)
+    replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+    app.config['SQLALCHEMY_BINDS'] = {f'replica_{i}': u for i, u in enumerate(replica_urls)}
+    app.config['DB_REPLICA_BINDS'] = list(app.config['SQLALCHEMY_BINDS'])
+    app.config['DB_REPLICA_STICKY_SECONDS'] = _env_int('DB_REPLICA_STICKY_SECONDS', 30)
+
+    if not app.config['DB_TUNING']:
+        return
+
+    if url.startswith('sqlite'):
+        # Applied on every new connection, see register_sqlite_pragmas()
+        app.config['SQLITE_PRAGMAS'] = {
+            'journal_mode': 'WAL',  # readers no longer block the writer
+            'synchronous': 'NORMAL',  # safe with WAL, avoids an fsync per commit
+            'busy_timeout': _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000),
+            'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+            'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),  # negative = KiB
+            'temp_store': 'MEMORY',
+        }
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': _env_int('DB_POOL_SIZE', 10),
+            'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+            'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': True,
+        }
+
+
+def register_sqlite_pragmas(app, db):
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', set_pragmas)
+
+
+def register_pool_metrics(app, db):
+    # Pool gauges of this process, refreshed whenever the metrics registry is read
+    from metrics import registry
+
+    with app.app_context():
+        engines = dict(db.engines)
+
+    def collect_pool_stats(registry):
+        for bind, engine in engines.items():
+            pool = engine.pool
+            if not hasattr(pool, 'checkedout'):
+                continue  # NullPool/StaticPool keep no counts
+            labels = (('bind', bind or 'default'),)
+            registry.set('parkeasy_db_pool_size', labels, pool.size())
+            registry.set('parkeasy_db_pool_checked_out', labels, pool.checkedout())
+            registry.set('parkeasy_db_pool_overflow', labels, max(0, pool.overflow()))
+
+    registry.add_collector('db_pool', collect_pool_stats)
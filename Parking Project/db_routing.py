@@ -0,0 +1,38 @@
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, session
+from flask_sqlalchemy.session import Session
+
+STICKY_SESSION_KEY = 'db_primary_until'
+
+
+class RoutingSession(Session):
+    # Reads inside an endpoint marked @read_only go to a replica bind;
+    # flushes and everything else stay on the primary.
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() and g.get('db_read_only'):
+            replicas = current_app.config.get('DB_REPLICA_BINDS')
+            if replicas:
+                return self._db.engines[random.choice(replicas)]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def read_only(f):
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        # Read-your-writes: right after a booking change this user keeps reading the primary
+        g.db_read_only = session.get(STICKY_SESSION_KEY, 0) < time.time()
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def use_primary():
+    # Rest of this request reads the primary: the reads decide a write, so replica lag must not
+    g.db_read_only = False
+
+
+def stick_to_primary():
+    if current_app.config.get('DB_REPLICA_BINDS'):
+        session[STICKY_SESSION_KEY] = time.time() + current_app.config['DB_REPLICA_STICKY_SECONDS']
@@ -0,0 +1,100 @@
+import os
+import re
+from datetime import datetime
+from html.parser import HTMLParser
+
+from jinja2 import Environment, FileSystemLoader, TemplateNotFound, select_autoescape
+from markupsafe import Markup
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates', 'emails')
+
+# Compiled once per process and kept: no mtime checks, no eviction
+env = Environment(
+    loader=FileSystemLoader(TEMPLATES_DIR),
+    autoescape=select_autoescape(['html']),
+    auto_reload=False,
+    cache_size=-1,
+    trim_blocks=True,
+    lstrip_blocks=True
+)
+
+# foo.html -> its compiled foo.txt twin, or None when the email has none
+_text_templates = {}
+
+BLOCK_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'tr', 'table', 'ul', 'li', 'br'}
+
+
+class _TextExtractor(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.skip = 0
+        self.href = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('head', 'style', 'script'):
+            self.skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n- ' if tag == 'li' else '\n')
+        elif tag in ('td', 'th'):
+            self.parts.append(' | ')
+        elif tag == 'a':
+            self.href = dict(attrs).get('href')
+
+    def handle_endtag(self, tag):
+        if tag in ('head', 'style', 'script'):
+            self.skip -= 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+        elif tag == 'a':
+            if self.href and self.href != '#':
+                self.parts.append(f' ({self.href})')
+            self.href = None
+
+    def handle_data(self, data):
+        if not self.skip:
+            # Source indentation is not meaningful; only block tags start new lines
+            self.parts.append(re.sub(r'\s+', ' ', data))
+
+    def text(self):
+        lines = (re.sub(r'\s+', ' ', line).strip(' |') for line in ''.join(self.parts).split('\n'))
+        return re.sub(r'\n{3,}', '\n\n', '\n'.join(line.strip() for line in lines)).strip()
+
+
+def html_to_text(html):
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def sent_on():
+    return datetime.now().strftime('%B %d, %Y at %I:%M %p')
+
+
+def _text_template(template_name):
+    if template_name not in _text_templates:
+        try:
+            _text_templates[template_name] = env.get_template(os.path.splitext(template_name)[0] + '.txt')
+        except TemplateNotFound:
+            _text_templates[template_name] = None
+    return _text_templates[template_name]
+
+
+def _render_text(template_name, html, context):
+    # Rendering the .txt template costs about as much as the HTML; parsing the HTML back is far slower
+    text_template = _text_template(template_name)
+    return text_template.render(**context) if text_template else html_to_text(html)
+
+
+def render_fragment(template_name, **context):
+    # Shared pieces (e.g. the lots section) are rendered once: safe markup plus its plain text
+    html = Markup(env.get_template(template_name).render(**context))
+    return html, _render_text(template_name, html, context)
+
+
+def render_email(template_name, **context):
+    context.setdefault('sent_on', sent_on())
+    html = env.get_template(template_name).render(**context)
+    return html, _render_text(template_name, html, context)
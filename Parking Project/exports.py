@@ -0,0 +1,325 @@
+import csv
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from models import ParkingLot, ParkingRecord, ParkingSpot, TaskStatus, User, db
+
+# Bump when the CSV layout changes so finished exports are not reused
+EXPORT_VERSION = 1
+
+EXPORT_HEADER = [
+    'Slot ID',
+    'Spot ID',
+    'Parking Lot Name',
+    'Address',
+    'Vehicle Number',
+    'Parked At',
+    'Left At',
+    'Duration (Hours)',
+    'Cost (₹)',
+    'Remarks'
+]
+
+ADMIN_EXPORT_HEADER = [
+    'Record ID',
+    'User ID',
+    'Username',
+    'Spot ID',
+    'Parking Lot Name',
+    'Vehicle Number',
+    'Parked At',
+    'Left At',
+    'Duration (Hours)',
+    'Cost (₹)',
+    'Status'
+]
+ADMIN_EXPORT_FILE = 'parking_records.csv.gz'
+
+
+def export_query(user_id):
+    # One join, plain columns: no ORM objects and no lazy loads per row
+    return select(
+        ParkingRecord.id,
+        ParkingRecord.spot_id,
+        ParkingLot.lot_name,
+        ParkingLot.address,
+        ParkingLot.pincode,
+        ParkingRecord.vehicle_number,
+        ParkingRecord.parked_at,
+        ParkingRecord.left_at,
+        ParkingRecord.parking_cost
+    ).join(
+        ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).where(
+        ParkingRecord.user_id == user_id
+    ).order_by(ParkingRecord.parked_at.desc(), ParkingRecord.id.desc())
+
+
+def export_row(row):
+    duration_hours = 0
+    if row.left_at:
+        duration_hours = round((row.left_at - row.parked_at).total_seconds() / 3600, 2)
+
+    return [
+        row.id,  # Slot ID
+        row.spot_id,  # Spot ID
+        row.lot_name,  # Parking Lot Name
+        f"{row.address}, {row.pincode}",  # Address
+        row.vehicle_number or 'N/A',  # Vehicle Number
+        row.parked_at.strftime('%Y-%m-%d %H:%M:%S'),  # Parked At
+        row.left_at.strftime('%Y-%m-%d %H:%M:%S') if row.left_at else 'Still Parked',  # Left At
+        duration_hours,  # Duration
+        row.parking_cost or 0,  # Cost
+        f"Status: {'Completed' if row.left_at else 'Active'}"  # Remarks
+    ]
+
+
+def export_fingerprint(user_id):
+    # Content hash of the user's records from one aggregate query, plus the row count
+    row = db.session.execute(
+        select(
+            func.count(ParkingRecord.id).label('bookings'),
+            func.count(ParkingRecord.left_at).label('completed'),
+            func.coalesce(func.sum(ParkingRecord.id), 0).label('id_sum'),
+            func.coalesce(func.sum(ParkingRecord.parking_cost), 0).label('cost_sum'),
+            func.max(ParkingRecord.parked_at).label('last_parked_at'),
+            func.max(ParkingRecord.left_at).label('last_left_at')
+        ).where(ParkingRecord.user_id == user_id)
+    ).one()
+    parts = [EXPORT_VERSION, user_id, row.bookings, row.completed, row.id_sum,
+             f"{float(row.cost_sum):.2f}", row.last_parked_at, row.last_left_at]
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest(), row.bookings
+
+
+def find_reusable_export(user_id, fingerprint, running_within=None):
+    # Latest finished export of exactly these records whose file is still on disk.
+    # With running_within (seconds), a pending or processing export of the same
+    # records that made progress that recently is returned too: join it, don't start another.
+    previous = TaskStatus.query.filter_by(
+        user_id=user_id, task_type='csv_export', fingerprint=fingerprint, status='completed'
+    ).order_by(TaskStatus.id.desc()).first()
+    if previous and previous.result_file_path and os.path.exists(previous.result_file_path):
+        return previous
+    if running_within is None:
+        return None
+    return TaskStatus.query.filter(
+        TaskStatus.user_id == user_id,
+        TaskStatus.task_type == 'csv_export',
+        TaskStatus.fingerprint == fingerprint,
+        TaskStatus.status.in_(('pending', 'processing')),
+        TaskStatus.updated_on >= datetime.utcnow() - timedelta(seconds=running_within)
+    ).order_by(TaskStatus.id.desc()).first()
+
+
+@contextmanager
+def _replacing(path):
+    # Yields a temp path unique to this writer, in path's directory, renamed over
+    # path on success: concurrent writers of the same file never share a temp file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of buffering it
+    def write(self, value):
+        return value
+
+
+def iter_export_csv(user_id, batch_size=1000):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    result = db.session.execute(export_query(user_id).execution_options(yield_per=batch_size))
+    for batch in result.partitions():
+        yield ''.join(writer.writerow(export_row(row)) for row in batch)
+
+
+def write_export(user_id, path, batch_size=1000, on_progress=None):
+    # Streams rows from the cursor straight into a gzip file; memory stays at one batch
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    rows_done = 0
+
+    result = db.session.execute(export_query(user_id).execution_options(yield_per=batch_size))
+    with _replacing(path) as tmp_path, gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_HEADER)
+        for batch in result.partitions():
+            writer.writerows(export_row(row) for row in batch)
+            rows_done += len(batch)
+            if on_progress:
+                on_progress(rows_done)
+
+    # Exports of older versions of the same records are superseded
+    for name in os.listdir(os.path.dirname(path)):
+        stale = os.path.join(os.path.dirname(path), name)
+        if stale != path and name.endswith('.csv.gz'):
+            os.remove(stale)
+    return rows_done
+
+
+def admin_export_query(first_id, last_id):
+    return select(
+        ParkingRecord.id,
+        ParkingRecord.user_id,
+        User.username,
+        ParkingRecord.spot_id,
+        ParkingLot.lot_name,
+        ParkingRecord.vehicle_number,
+        ParkingRecord.parked_at,
+        ParkingRecord.left_at,
+        ParkingRecord.parking_cost
+    ).join(
+        User, ParkingRecord.user_id == User.id
+    ).join(
+        ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).where(
+        ParkingRecord.id.between(first_id, last_id)
+    ).order_by(ParkingRecord.id)
+
+
+def admin_export_row(row):
+    duration_hours = 0
+    if row.left_at:
+        duration_hours = round((row.left_at - row.parked_at).total_seconds() / 3600, 2)
+
+    return [
+        row.id,
+        row.user_id,
+        row.username,
+        row.spot_id,
+        row.lot_name,
+        row.vehicle_number or 'N/A',
+        row.parked_at.strftime('%Y-%m-%d %H:%M:%S'),
+        row.left_at.strftime('%Y-%m-%d %H:%M:%S') if row.left_at else '',
+        duration_hours,
+        row.parking_cost or 0,
+        'Completed' if row.left_at else 'Active'
+    ]
+
+
+def shard_ranges(shard_count):
+    # Equal-width primary key ranges: each shard is an index range scan, no OFFSET
+    first_id, last_id = db.session.execute(
+        select(func.min(ParkingRecord.id), func.max(ParkingRecord.id))
+    ).one()
+    if first_id is None:
+        return []
+    width = max(1, -(-(last_id - first_id + 1) // shard_count))
+    return [(start, min(start + width - 1, last_id)) for start in range(first_id, last_id + 1, width)]
+
+
+def write_shard(job_dir, index, first_id, last_id, batch_size=5000):
+    # One gzip member per shard; members concatenate into a valid .csv.gz later
+    path = os.path.join(job_dir, f'shard-{index:04d}.csv.gz')
+    rows = 0
+
+    result = db.session.execute(admin_export_query(first_id, last_id).execution_options(yield_per=batch_size))
+    with _replacing(path) as tmp_path, gzip.open(tmp_path, 'wt', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        for batch in result.partitions():
+            writer.writerows(admin_export_row(row) for row in batch)
+            rows += len(batch)
+    return {'index': index, 'first_id': first_id, 'last_id': last_id, 'rows': rows, 'path': path}
+
+
+def _save_json(path, data):
+    with _replacing(path) as tmp_path, open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def start_admin_export(job_dir, ranges):
+    os.makedirs(job_dir, exist_ok=True)
+    _save_json(os.path.join(job_dir, 'job.json'), {
+        'created_at': datetime.now().isoformat(),
+        'shards': [{'index': i, 'first_id': first, 'last_id': last} for i, (first, last) in enumerate(ranges)]
+    })
+
+
+def fail_admin_export(job_dir, message):
+    _save_json(os.path.join(job_dir, 'failed.json'), {'message': message, 'failed_at': datetime.now().isoformat()})
+
+
+def stitch_admin_export(job_dir, shards):
+    # Header member followed by every shard in id order, copied byte for byte (no
+    # recompression). The manifest records where each shard starts in the file.
+    path = os.path.join(job_dir, ADMIN_EXPORT_FILE)
+    digest = hashlib.sha256()
+    manifest_shards = []
+
+    with _replacing(path) as tmp_path, open(tmp_path, 'wb') as out:
+        header = gzip.compress((','.join(ADMIN_EXPORT_HEADER) + '\r\n').encode('utf-8'))
+        out.write(header)
+        digest.update(header)
+        for shard in sorted(shards, key=lambda s: s['index']):
+            offset = out.tell()
+            with open(shard['path'], 'rb') as f:
+                while True:
+                    chunk = f.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    digest.update(chunk)
+            manifest_shards.append({
+                'index': shard['index'],
+                'first_id': shard['first_id'],
+                'last_id': shard['last_id'],
+                'rows': shard['rows'],
+                'offset': offset,
+                'bytes': out.tell() - offset
+            })
+
+    manifest = {
+        'file': ADMIN_EXPORT_FILE,
+        'format': 'csv+gzip (multi-member)',
+        'columns': ADMIN_EXPORT_HEADER,
+        'rows': sum(shard['rows'] for shard in shards),
+        'bytes': os.path.getsize(path),
+        'sha256': digest.hexdigest(),
+        'shards': manifest_shards,
+        'completed_at': datetime.now().isoformat()
+    }
+    _save_json(os.path.join(job_dir, 'manifest.json'), manifest)
+
+    for shard in shards:
+        os.remove(shard['path'])
+    return manifest
+
+
+def admin_export_status(job_dir):
+    failed = _load_json(os.path.join(job_dir, 'failed.json'))
+    if failed:
+        return {'status': 'failed', 'message': failed['message']}
+
+    manifest = _load_json(os.path.join(job_dir, 'manifest.json'))
+    if manifest:
+        return {'status': 'completed', 'manifest': manifest}
+
+    job = _load_json(os.path.join(job_dir, 'job.json'))
+    if not job:
+        return {'status': 'pending'}
+    shards_done = len([name for name in os.listdir(job_dir) if name.startswith('shard-') and name.endswith('.csv.gz')])
+    return {'status': 'processing', 'shards_total': len(job['shards']), 'shards_done': shards_done}
@@ -1,8 +1,23 @@
 from flask_caching import Cache
+from flask_migrate import Migrate
 from celery import Celery
 
+from metrics import registry
+
+
+class MeteredCache(Cache):
+    # Counts hits and misses per key family ("user_dashboard_7" -> "user_dashboard")
+
+    def get(self, key, *args, **kwargs):
+        value = super().get(key, *args, **kwargs)
+        family = str(key).split(':', 1)[0].rstrip('_0123456789')
+        registry.inc('parkeasy_cache_requests_total', (('family', family), ('result', 'miss' if value is None else 'hit')))
+        return value
+
+
 # Initialize extensions
-cache = Cache()
+cache = MeteredCache()
+migrate = Migrate()
 
 def make_celery(app):
     
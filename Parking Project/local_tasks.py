@@ -0,0 +1,189 @@
+import atexit
+import threading
+import time
+import uuid
+from concurrent.futures import CancelledError, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from celery.exceptions import TimeoutError as CeleryTimeoutError
+
+# Set in process-pool workers: tasks they queue run inline instead of starting another pool
+_in_local_worker = False
+
+
+class LocalQueueFull(Exception):
+    pass
+
+
+class LocalResult:
+    # The parts of celery.result.AsyncResult the app relies on, backed by a future
+
+    def __init__(self, task_id, task_name, future):
+        self.id = task_id
+        self.task_id = task_id
+        self.name = task_name
+        self.future = future
+
+    @property
+    def state(self):
+        if not self.future.done():
+            return 'STARTED' if self.future.running() else 'PENDING'
+        if self.future.cancelled():
+            return 'REVOKED'
+        return 'FAILURE' if self.future.exception() else 'SUCCESS'
+
+    status = state
+
+    def ready(self):
+        return self.future.done()
+
+    def successful(self):
+        return self.state == 'SUCCESS'
+
+    def failed(self):
+        return self.state == 'FAILURE'
+
+    @property
+    def result(self):
+        if not self.future.done() or self.future.cancelled():
+            return None
+        return self.future.exception() or self.future.result()
+
+    info = result
+
+    def get(self, timeout=None, propagate=True):
+        try:
+            return self.future.result(timeout)
+        except FutureTimeoutError:
+            raise CeleryTimeoutError('The operation timed out.')
+        except CancelledError:
+            raise
+        except Exception as e:
+            if propagate:
+                raise
+            return e
+
+    def forget(self):
+        pass
+
+    def __repr__(self):
+        return f'<LocalResult: {self.id} {self.state}>'
+
+
+def _init_process_worker():
+    global _in_local_worker
+    _in_local_worker = True
+    from celery_worker import reset_db_pool_after_fork
+    reset_db_pool_after_fork()
+
+
+def run_task(task_name, args, kwargs, task_id, sent_at):
+    # Task.apply runs the task with a proper request (self.request.id) in this thread;
+    # sent_at stands in for the header a broker message would carry
+    from celery_worker import celery
+    return celery.tasks[task_name].apply(args, kwargs, task_id=task_id, throw=True,
+                                         headers={'sent_at': sent_at}).result
+
+
+class LocalExecutor:
+    # Runs Celery tasks in a thread or process pool of this process. At most
+    # workers + queue_size tasks are queued or running; submit() waits up to
+    # submit_timeout for a slot and then raises LocalQueueFull.
+
+    def __init__(self, kind='thread', workers=4, queue_size=100, submit_timeout=30):
+        if kind == 'process':
+            self.pool = ProcessPoolExecutor(workers, initializer=_init_process_worker)
+        else:
+            self.pool = ThreadPoolExecutor(workers, thread_name_prefix='local-task')
+        self.kind = kind
+        self.capacity = workers + queue_size
+        self.submit_timeout = submit_timeout
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.closed = False
+
+    def submit(self, task_name, args=None, kwargs=None, task_id=None):
+        if self.closed:
+            raise RuntimeError('Local task executor is shut down')
+        if not self.slots.acquire(timeout=self.submit_timeout):
+            raise LocalQueueFull(f'{self.capacity} local tasks already queued or running')
+        task_id = task_id or str(uuid.uuid4())
+        try:
+            future = self.pool.submit(run_task, task_name, list(args or ()), dict(kwargs or {}), task_id, time.time())
+        except Exception:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.pending.add(future)
+        future.add_done_callback(self._finished)
+        return LocalResult(task_id, task_name, future)
+
+    def _finished(self, future):
+        with self.lock:
+            self.pending.discard(future)
+        self.slots.release()
+
+    def chord(self, header, body):
+        # Same contract as celery.chord: body gets the list of header results once all succeed
+        body_id = str(uuid.uuid4())
+        if not header:
+            self.submit(body.task, [[]] + list(body.args), body.kwargs, task_id=body_id)
+            return body_id
+
+        results = [self.submit(sig.task, sig.args, sig.kwargs) for sig in header]
+        remaining = [len(results)]
+        lock = threading.Lock()
+
+        def header_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            failed = [r for r in results if not r.successful()]
+            if failed:
+                print(f"❌ Local chord {body.task} not run: {len(failed)} of {len(results)} tasks failed")
+                return
+            self.submit(body.task, [[r.result for r in results]] + list(body.args), body.kwargs, task_id=body_id)
+
+        for result in results:
+            result.future.add_done_callback(header_done)
+        return body_id
+
+    def shutdown(self, timeout=30):
+        # Stop taking tasks, give running and queued ones up to timeout to finish
+        self.closed = True
+        with self.lock:
+            pending = list(self.pending)
+        _, not_done = wait(pending, timeout=timeout)
+        if not_done:
+            print(f"⚠️ Local task executor shutting down with {len(not_done)} tasks unfinished")
+        self.pool.shutdown(wait=not not_done, cancel_futures=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_local_executor(config):
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = LocalExecutor(config['LOCAL_TASK_EXECUTOR'], config['LOCAL_TASK_WORKERS'],
+                                          config['LOCAL_TASK_QUEUE_SIZE'], config['LOCAL_TASK_SUBMIT_TIMEOUT'])
+                atexit.register(_executor.shutdown, config['LOCAL_TASK_SHUTDOWN_SECONDS'])
+    return _executor
+
+
+def submit_local(task, args, kwargs, task_id, config):
+    if _in_local_worker:
+        return task.apply(args, kwargs, task_id=task_id or str(uuid.uuid4()))
+    return get_local_executor(config).submit(task.name, args, kwargs, task_id)
+
+
+def run_local_chord(header, body, config):
+    if _in_local_worker:
+        results = [sig.apply(throw=True).result for sig in header]
+        return body.apply((results,)).id
+    return get_local_executor(config).chord(header, body)
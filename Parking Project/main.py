@@ -1,44 +1,126 @@
+import os
 from flask import Flask
 from flask_mail import Mail
 from models import db, Admin, ParkingLot, ParkingSpot
 from werkzeug.security import generate_password_hash
-from extensions import cache, make_celery
+from extensions import cache, migrate, make_celery
+from db_profile import configure_database, register_pool_metrics, register_sqlite_pragmas
+from slow_queries import register_slow_query_log
+from flask_migrate import stamp, upgrade
+from sqlalchemy import inspect
 
 mail = Mail()
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
 
-def create_app():
+
+def create_app(config=None):
     app = Flask(__name__)
 
-    # Database configuration
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///parking_app.db'
+    # Database configuration (DATABASE_URL, pool and SQLite pragma settings from the environment)
+    configure_database(app)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SECRET_KEY'] = 'dev-secret-key-change-in-production'
 
     # Cache configuration (Redis)
-    app.config['CACHE_TYPE'] = 'redis'
+    app.config['CACHE_TYPE'] = os.environ.get('CACHE_TYPE', 'redis')  # SimpleCache for a single process without Redis
     app.config['CACHE_REDIS_URL'] = 'redis://localhost:6379/0'
     app.config['CACHE_DEFAULT_TIMEOUT'] = 300
 
     # Celery + Redis 
-    app.config['CELERY_BROKER_URL'] = 'redis://localhost:6379/0'
-    app.config['CELERY_RESULT_BACKEND'] = 'redis://localhost:6379/0'
+    app.config['CELERY_BROKER_URL'] = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+    app.config['CELERY_RESULT_BACKEND'] = os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
     app.config['CELERY_ACCEPT_CONTENT'] = ['json']
     app.config['CELERY_TASK_SERIALIZER'] = 'json'
     app.config['CELERY_RESULT_SERIALIZER'] = 'json'
     app.config['CELERY_TIMEZONE'] = 'UTC'
 
+    # In-process task executor, used when CELERY_BROKER_URL is empty
+    app.config['LOCAL_TASK_EXECUTOR'] = os.environ.get('LOCAL_TASK_EXECUTOR', 'thread')  # or 'process'
+    app.config['LOCAL_TASK_WORKERS'] = int(os.environ.get('LOCAL_TASK_WORKERS', 4))
+    app.config['LOCAL_TASK_QUEUE_SIZE'] = 100
+    app.config['LOCAL_TASK_SUBMIT_TIMEOUT'] = 30
+    app.config['LOCAL_TASK_SHUTDOWN_SECONDS'] = 30
+
     # Email configuration
-    app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-    app.config['MAIL_PORT'] = 587
-    app.config['MAIL_USE_TLS'] = True
+    app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') != '0'
     app.config['MAIL_USE_SSL'] = False
     app.config['MAIL_USERNAME'] = ''
     app.config['MAIL_PASSWORD'] = ''
     app.config['MAIL_DEFAULT_SENDER'] = ''
 
+    # Outgoing mail rate limit, shared by all workers through Redis (per-process fallback)
+    app.config['MAIL_RATE_PER_SECOND'] = float(os.environ.get('MAIL_RATE_PER_SECOND', 10))  # 0 = unlimited
+    app.config['MAIL_RATE_BURST'] = int(os.environ.get('MAIL_RATE_BURST', 0))  # 0 = one second's worth
+    app.config['MAIL_RATE_LIMIT_REDIS_URL'] = os.environ.get('MAIL_RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['MAIL_RETRY_ATTEMPTS'] = 4  # per message, on 4xx replies
+    app.config['MAIL_RETRY_BASE_SECONDS'] = 1
+    app.config['MAIL_RETRY_MAX_SECONDS'] = 30
+
+    # Bulk emails: recipients per chunk task, and how long the shared body stays in the cache
+    app.config['EMAIL_CHUNK_SIZE'] = 500
+    app.config['EMAIL_PAYLOAD_TTL'] = 24 * 3600
+
+    # Email outbox: rows claimed per dispatcher batch, retried with exponential backoff
+    app.config['OUTBOX_BATCH_SIZE'] = 100
+    app.config['OUTBOX_LEASE_SECONDS'] = 300  # a claimed batch not finished by then is claimed again
+    app.config['OUTBOX_MAX_ATTEMPTS'] = 5
+    app.config['OUTBOX_BACKOFF_BASE'] = 30  # seconds; doubles per attempt
+    app.config['OUTBOX_BACKOFF_MAX'] = 3600
+    app.config['OUTBOX_DISPATCH_SECONDS'] = 25  # time budget of one scheduled dispatch run
+
+    # Monthly reports: one generation (and one queued request) per user and month at a time
+    app.config['MONTHLY_REPORT_LOCK_TIMEOUT'] = 300
+
+    # Retention: completed records older than this are archived, then deleted
+    app.config['RETENTION_DAYS'] = 365
+    app.config['ARCHIVE_DIR'] = os.path.join(app.instance_path, 'archive')
+    app.config['ARCHIVE_BATCH_SIZE'] = 1000
+    app.config['ARCHIVE_BATCH_PAUSE'] = 0.2  # seconds between batches
+
+    # CSV exports: gzip files served from disk, linked from the notification email
+    app.config['EXPORT_DIR'] = os.path.join(app.instance_path, 'exports')
+    app.config['EXPORT_BATCH_SIZE'] = 1000
+    app.config['EXPORT_SYNC_MAX_ROWS'] = 5000  # above this GET /api/user/export.csv hands off to a job
+    app.config['EXPORT_JOIN_RUNNING_SECONDS'] = 600  # a running export of the same records is joined unless stalled this long
+    app.config['ADMIN_EXPORT_SHARDS'] = 8  # id-range shards exported in parallel by the workers
+    app.config['ADMIN_EXPORT_BATCH_SIZE'] = 5000
+    app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL', 'http://localhost:5000')
+
+    # Metrics: every process (web, workers) flushes its counters here; the endpoints add them up
+    app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+    app.config['METRICS_FLUSH_SECONDS'] = 5
+    app.config['SERVER_TIMING_HEADER'] = os.environ.get('SERVER_TIMING_HEADER', '1') != '0'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')  # bearer token for /metrics; empty = open
+    app.config['OCCUPANCY_SNAPSHOT_TTL'] = 600  # lot occupancy written by check_parking_lot_availability
+
+    # Slow-query log: statements slower than this land in a per-process ring buffer with their plan
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))  # 0 = off
+    app.config['SLOW_QUERY_BUFFER'] = 200
+    app.config['SLOW_QUERY_EXPLAIN'] = True
+
+    # Profiler: off unless an admin sends "X-Profile: 1" or a sample rate is set; keeps the newest profiles
+    app.config['PROFILE_DIR'] = os.path.join(app.instance_path, 'profiles')
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # fraction of requests
+    app.config['PROFILE_TASK_SAMPLE_RATE'] = float(os.environ.get('PROFILE_TASK_SAMPLE_RATE', 0))
+    app.config['PROFILE_MAX_PROFILES'] = 100
+    app.config['PROFILE_SAMPLE_INTERVAL'] = 0.005  # seconds between stack samples
+
+    # Overrides (benchmarks, scripts) applied before any extension reads the config
+    if config:
+        app.config.update(config)
+
+    from celery_worker import init_celery
+    init_celery(app)
+
     # Initialize extensions
     db.init_app(app)
+    register_sqlite_pragmas(app, db)
+    register_pool_metrics(app, db)
+    register_slow_query_log(app, db)
+    migrate.init_app(app, db, directory=MIGRATIONS_DIR, render_as_batch=True)
     mail.init_app(app)
     cache.init_app(app)
 
@@ -46,13 +128,23 @@ def create_app():
     from routes import main
     app.register_blueprint(main)
 
+    from commands import register_commands
+    register_commands(app)
+
     return app
 
+def upgrade_database():
+    # Databases created by db.create_all() before migrations existed already match the baseline
+    inspector = inspect(db.engine)
+    if inspector.has_table('users') and not inspector.has_table('alembic_version'):
+        stamp(directory=MIGRATIONS_DIR, revision='0001_baseline')
+    upgrade(directory=MIGRATIONS_DIR)
+
 def seed_initial_data(app):
   
     with app.app_context():
         
-        db.create_all()
+        upgrade_database()
 
        
         if not Admin.query.first():
@@ -0,0 +1,278 @@
+import bisect
+import json
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds; upper bounds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+
+# Per-lot occupancy, written by check_parking_lot_availability so a scrape never queries the database
+OCCUPANCY_SNAPSHOT_KEY = 'metrics:lot_occupancy'
+
+
+class Registry:
+    # Counters and histograms of this process, keyed by (name, labels). Updates
+    # are a dict lookup and an add under one lock; rendering does the rest.
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.collectors = {}
+        self.last_flush = 0
+        self.pid = None
+        self.file_name = None  # <pid>-<token>.json, chosen on this process's first flush
+
+    def add_collector(self, name, collector):
+        # Called before every snapshot to refresh gauges (e.g. pool sizes)
+        self.collectors[name] = collector
+
+    def inc(self, name, labels=(), amount=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self.lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, labels)
+        index = bisect.bisect_left(buckets, value)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1),
+                                                    'sum': 0.0, 'count': 0}
+            histogram['counts'][index] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def snapshot(self):
+        for collector in list(self.collectors.values()):
+            collector(self)
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, list(labels), value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, list(labels), list(h['buckets']), list(h['counts']), h['sum'], h['count']]
+                               for (name, labels), h in self.histograms.items()]
+            }
+
+    def flush(self, directory):
+        # Each process writes its own file; readers add the files up. The token in the
+        # name keeps a later process that reuses the pid from overwriting it.
+        os.makedirs(directory, exist_ok=True)
+        adopted = []
+        if self.pid != os.getpid():
+            if self.pid is not None:
+                # Forked from a process that already flushed: these values are in its file
+                with self.lock:
+                    self.counters.clear()
+                    self.gauges.clear()
+                    self.histograms.clear()
+            self.pid = os.getpid()
+            self.file_name = f'{self.pid}-{uuid.uuid4().hex[:12]}.json'
+            adopted = self.adopt_dead(directory)
+        path = os.path.join(directory, self.file_name)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+        # Only now that the adopted values are in this process's file
+        for claimed in adopted:
+            os.remove(claimed)
+        self.last_flush = time.monotonic()
+
+    def adopt_dead(self, directory):
+        # Folds the counters and histograms of exited processes into this one, so their
+        # files do not pile up. Renaming a file first means only one process adopts it.
+        claimed_files = []
+        for name in os.listdir(directory):
+            pid = _file_pid(name)
+            if pid is None or name == self.file_name or (pid != self.pid and _alive(pid)):
+                continue
+            claimed = os.path.join(directory, f'{name}.{self.file_name}.adopted')
+            try:
+                os.rename(os.path.join(directory, name), claimed)
+                with open(claimed) as f:
+                    snapshot = json.load(f)
+            except FileNotFoundError:
+                continue  # another process adopted it first
+            except (OSError, ValueError):
+                snapshot = None
+            if snapshot:
+                self.merge(snapshot)
+            claimed_files.append(claimed)
+        return claimed_files
+
+    def merge(self, snapshot):
+        # Gauges are left out: they describe a process that is gone
+        with self.lock:
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(label) for label in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for name, labels, buckets, counts, total, count in snapshot['histograms']:
+                key = (name, tuple(tuple(label) for label in labels))
+                histogram = self.histograms.get(key)
+                if histogram is None:
+                    self.histograms[key] = {'buckets': tuple(buckets), 'counts': list(counts),
+                                            'sum': total, 'count': count}
+                elif list(histogram['buckets']) == list(buckets):
+                    histogram['counts'] = [a + b for a, b in zip(histogram['counts'], counts)]
+                    histogram['sum'] += total
+                    histogram['count'] += count
+
+    def maybe_flush(self, directory, interval):
+        if time.monotonic() - self.last_flush >= interval:
+            self.flush(directory)
+
+
+registry = Registry()
+
+
+def _file_pid(name):
+    # "<pid>-<token>.json", or "<pid>.json" as written before the token existed
+    if not name.endswith('.json'):
+        return None
+    pid = name[:-len('.json')].split('-', 1)[0]
+    return int(pid) if pid.isdigit() else None
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+def collect(directory=None):
+    # This process's live values plus the last flush of every other process.
+    # Counters and histograms of exited processes still count; their gauges do not.
+    snapshots = [registry.snapshot()]
+    if directory and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if _file_pid(name) is not None and name != registry.file_name:
+                try:
+                    with open(os.path.join(directory, name)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # replaced mid-read; picked up on the next scrape
+
+    counters = {}
+    gauges = {}
+    histograms = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        pid = snapshot.get('pid')
+        # A file with this process's pid that is not its own is from an exited process
+        if snapshot is snapshots[0] or (pid and pid != os.getpid() and _alive(pid)):
+            for name, labels, value in snapshot.get('gauges', []):
+                key = (name, tuple(tuple(label) for label in labels))
+                gauges[key] = gauges.get(key, 0) + value
+        for name, labels, buckets, counts, total, count in snapshot['histograms']:
+            key = (name, tuple(tuple(label) for label in labels))
+            merged = histograms.get(key)
+            if merged is None or merged['buckets'] != buckets:
+                histograms[key] = {'buckets': buckets, 'counts': list(counts), 'sum': total, 'count': count}
+            else:
+                merged['counts'] = [a + b for a, b in zip(merged['counts'], counts)]
+                merged['sum'] += total
+                merged['count'] += count
+    return counters, gauges, histograms
+
+
+def cache_hit_ratios(counters):
+    totals = {}
+    for (name, labels), value in counters.items():
+        if name == 'parkeasy_cache_requests_total':
+            family, result = dict(labels)['family'], dict(labels)['result']
+            hits, requests = totals.get(family, (0, 0))
+            totals[family] = (hits + (value if result == 'hit' else 0), requests + value)
+    return {('parkeasy_cache_hit_ratio', (('family', family),)): round(hits / requests, 4)
+            for family, (hits, requests) in totals.items() if requests}
+
+
+def occupancy_gauges(snapshot, now):
+    gauges = {('parkeasy_lot_occupancy_snapshot_age_seconds', ()): round(now - snapshot['taken_at'], 1)}
+    for lot in snapshot['lots']:
+        labels = (('lot_id', str(lot['lot_id'])), ('lot', lot['lot_name']))
+        gauges[('parkeasy_lot_spots_occupied', labels)] = lot['occupied_spots']
+        gauges[('parkeasy_lot_spots_free', labels)] = lot['total_spots'] - lot['occupied_spots']
+    return gauges
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_text(counters, gauges, histograms, prefix=''):
+    # Prometheus text exposition format
+    lines = []
+    for kind, values in (('counter', counters), ('gauge', gauges)):
+        for name in sorted({name for name, _ in values if name.startswith(prefix)}):
+            lines.append(f'# TYPE {name} {kind}')
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {value}')
+    for name in sorted({name for name, _ in histograms if name.startswith(prefix)}):
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), h in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(list(h['buckets']) + ['+Inf'], h['counts']):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {round(h["sum"], 6)}')
+            lines.append(f'{name}_count{_labels(labels)} {h["count"]}')
+    return '\n'.join(lines) + '\n'
+
+
+# SQL statements run by the current thread while tracking is on (a task or a
+# request). Nested tracking (a task run inline by another) counts towards both.
+_queries = threading.local()
+
+
+def start_query_tracking():
+    if not getattr(_queries, 'depth', 0):
+        _queries.depth = 0
+        _queries.count = 0
+        _queries.seconds = 0.0
+    _queries.depth += 1
+    return _queries.count, _queries.seconds
+
+
+def stop_query_tracking(start):
+    _queries.depth -= 1
+    return _queries.count - start[0], _queries.seconds - start[1]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_queries, 'depth', 0):
+        _queries.started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_queries, 'depth', 0):
+        _queries.count += 1
+        _queries.seconds += time.perf_counter() - _queries.started
@@ -0,0 +1,108 @@
+"""baseline schema previously created by db.create_all()
+
+Revision ID: 0001_baseline
+Revises: 
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0001_baseline'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('users',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=150), nullable=False),
+    sa.Column('password', sa.String(length=150), nullable=False),
+    sa.Column('email', sa.String(length=200), nullable=False),
+    sa.Column('fullname', sa.String(length=200), nullable=True),
+    sa.Column('address', sa.Text(), nullable=True),
+    sa.Column('pincode', sa.String(length=10), nullable=True),
+    sa.Column('preferred_contact', sa.String(length=10), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('email'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('admin',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=100), nullable=False),
+    sa.Column('password', sa.String(length=100), nullable=False),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_table('parking_lots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('lot_name', sa.String(length=100), nullable=False),
+    sa.Column('address', sa.String(length=255), nullable=False),
+    sa.Column('pincode', sa.String(length=10), nullable=False),
+    sa.Column('price_per_hour', sa.Float(), nullable=False),
+    sa.Column('number_of_spots', sa.Integer(), nullable=False),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('lot_name')
+    )
+    op.create_table('parking_spots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('spot_number', sa.String(length=10), nullable=False),
+    sa.Column('lot_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=1), nullable=True),
+    sa.Column('is_active', sa.Boolean(), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['lot_id'], ['parking_lots.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('task_status',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('task_type', sa.String(length=50), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('result_file_path', sa.String(length=255), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('parking_records',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('vehicle_number', sa.String(length=20), nullable=True),
+    sa.Column('parked_at', sa.DateTime(), nullable=True),
+    sa.Column('left_at', sa.DateTime(), nullable=True),
+    sa.Column('parking_cost', sa.Float(), nullable=True),
+    sa.Column('remarks', sa.String(length=255), nullable=True),
+    sa.ForeignKeyConstraint(['spot_id'], ['parking_spots.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('spot_id', sa.Integer(), nullable=False),
+    sa.Column('reserved_from', sa.DateTime(), nullable=False),
+    sa.Column('reserved_until', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=True),
+    sa.Column('created_on', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['spot_id'], ['parking_spots.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('reservations')
+    op.drop_table('parking_records')
+    op.drop_table('task_status')
+    op.drop_table('parking_spots')
+    op.drop_table('parking_lots')
+    op.drop_table('admin')
+    op.drop_table('users')
@@ -0,0 +1,43 @@
+"""secondary indexes for the booking, history and maintenance queries
+
+Revision ID: 0002_hot_query_indexes
+Revises: 0001_baseline
+Create Date: 2026-10-19 10:05:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0002_hot_query_indexes'
+down_revision = '0001_baseline'
+branch_labels = None
+depends_on = None
+
+ACTIVE = sa.text('left_at IS NULL')
+
+
+def upgrade():
+    op.create_index('ix_parking_lots_is_active', 'parking_lots', ['is_active'], unique=False)
+    op.create_index('ix_parking_spots_lot_status_active', 'parking_spots', ['lot_id', 'status', 'is_active'], unique=False)
+    op.create_index('ix_parking_records_user_parked_at', 'parking_records', ['user_id', 'parked_at'], unique=False)
+    op.create_index('ix_parking_records_spot_id', 'parking_records', ['spot_id'], unique=False)
+    op.create_index('ix_parking_records_parked_at', 'parking_records', ['parked_at'], unique=False)
+    op.create_index('ix_parking_records_active_user', 'parking_records', ['user_id'], unique=False,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+    op.create_index('ix_parking_records_active_spot', 'parking_records', ['spot_id'], unique=False,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+    op.create_index('ix_parking_records_active_parked_at', 'parking_records', ['parked_at'], unique=False,
+                    sqlite_where=ACTIVE, postgresql_where=ACTIVE)
+
+
+def downgrade():
+    op.drop_index('ix_parking_records_active_parked_at', table_name='parking_records')
+    op.drop_index('ix_parking_records_active_spot', table_name='parking_records')
+    op.drop_index('ix_parking_records_active_user', table_name='parking_records')
+    op.drop_index('ix_parking_records_parked_at', table_name='parking_records')
+    op.drop_index('ix_parking_records_spot_id', table_name='parking_records')
+    op.drop_index('ix_parking_records_user_parked_at', table_name='parking_records')
+    op.drop_index('ix_parking_spots_lot_status_active', table_name='parking_spots')
+    op.drop_index('ix_parking_lots_is_active', table_name='parking_lots')
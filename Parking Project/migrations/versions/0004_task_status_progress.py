@@ -0,0 +1,40 @@
+"""job id, fingerprint and progress columns on task_status
+
+Revision ID: 0004_task_status_progress
+Revises: 0003_monthly_reports
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0004_task_status_progress'
+down_revision = '0003_monthly_reports'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('task_status', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('job_id', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('fingerprint', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('rows_done', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('rows_total', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('message', sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('updated_on', sa.DateTime(), nullable=True))
+        batch_op.create_unique_constraint('uq_task_status_job_id', ['job_id'])
+        batch_op.create_index('ix_task_status_user_type_fingerprint', ['user_id', 'task_type', 'fingerprint'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('task_status', schema=None) as batch_op:
+        batch_op.drop_index('ix_task_status_user_type_fingerprint')
+        batch_op.drop_constraint('uq_task_status_job_id', type_='unique')
+        batch_op.drop_column('updated_on')
+        batch_op.drop_column('message')
+        batch_op.drop_column('rows_total')
+        batch_op.drop_column('rows_done')
+        batch_op.drop_column('fingerprint')
+        batch_op.drop_column('job_id')
@@ -0,0 +1,31 @@
+"""bulk fan-out rows in the email outbox
+
+Revision ID: 0006_outbox_fanouts
+Revises: 0005_email_outbox
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0006_outbox_fanouts'
+down_revision = '0005_email_outbox'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('kind', sa.String(length=30), server_default='email', nullable=False))
+        batch_op.add_column(sa.Column('ref_id', sa.Integer(), nullable=True))
+        batch_op.alter_column('recipient', existing_type=sa.String(length=200), nullable=True)
+
+
+def downgrade():
+    op.execute("DELETE FROM email_outbox WHERE kind != 'email'")
+    with op.batch_alter_table('email_outbox', schema=None) as batch_op:
+        batch_op.alter_column('recipient', existing_type=sa.String(length=200), nullable=False)
+        batch_op.drop_column('ref_id')
+        batch_op.drop_column('kind')
@@ -2,8 +2,9 @@ from datetime import datetime
 from werkzeug.security import generate_password_hash
 
 from flask_sqlalchemy import SQLAlchemy
+from db_routing import RoutingSession
 
-db = SQLAlchemy() 
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 # Enum-like class for spot status
 class SpotStatus:
@@ -43,6 +44,9 @@ class Admin(db.Model):
 # ParkingLot: parent table for parking areas
 class ParkingLot(db.Model):
     __tablename__ = 'parking_lots'
+    __table_args__ = (
+        db.Index('ix_parking_lots_is_active', 'is_active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     lot_name = db.Column(db.String(100), unique=True, nullable=False)
@@ -59,6 +63,10 @@ class ParkingLot(db.Model):
 # ParkingSpot: individual spot in a lot
 class ParkingSpot(db.Model):
     __tablename__ = 'parking_spots'
+    # Matches the lot_id + status + is_active filters used for availability counts and booking
+    __table_args__ = (
+        db.Index('ix_parking_spots_lot_status_active', 'lot_id', 'status', 'is_active'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     spot_number = db.Column(db.String(10), nullable=False)
@@ -73,6 +81,20 @@ class ParkingSpot(db.Model):
 # ParkingRecord: tracks parking events
 class ParkingRecord(db.Model):
     __tablename__ = 'parking_records'
+    # Partial indexes over active sessions only (left_at IS NULL), so the
+    # booking path stays O(active) no matter how large the history grows
+    __table_args__ = (
+        db.Index('ix_parking_records_active_user', 'user_id',
+                 sqlite_where=db.text('left_at IS NULL'), postgresql_where=db.text('left_at IS NULL')),
+        db.Index('ix_parking_records_active_spot', 'spot_id',
+                 sqlite_where=db.text('left_at IS NULL'), postgresql_where=db.text('left_at IS NULL')),
+        db.Index('ix_parking_records_active_parked_at', 'parked_at',
+                 sqlite_where=db.text('left_at IS NULL'), postgresql_where=db.text('left_at IS NULL')),
+        # Per-user history ordered/filtered by time (dashboard, history, reports, exports)
+        db.Index('ix_parking_records_user_parked_at', 'user_id', 'parked_at'),
+        db.Index('ix_parking_records_spot_id', 'spot_id'),
+        db.Index('ix_parking_records_parked_at', 'parked_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -86,13 +108,69 @@ class ParkingRecord(db.Model):
 # Optional: Task tracking for async jobs (like CSV or report)
 class TaskStatus(db.Model):
     __tablename__ = 'task_status'
+    __table_args__ = (
+        db.UniqueConstraint('job_id', name='uq_task_status_job_id'),
+        # Finished exports are reused while the user's records are unchanged
+        db.Index('ix_task_status_user_type_fingerprint', 'user_id', 'task_type', 'fingerprint'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     task_type = db.Column(db.String(50))  # e.g., "csv_export", "monthly_report"
-    status = db.Column(db.String(20))  # e.g., "pending", "completed", "failed"
+    status = db.Column(db.String(20))  # e.g., "pending", "processing", "completed", "failed"
     result_file_path = db.Column(db.String(255))
     created_on = db.Column(db.DateTime, default=datetime.utcnow)
+    job_id = db.Column(db.String(64), nullable=True)  # Celery task id
+    fingerprint = db.Column(db.String(64), nullable=True)  # content hash of the exported records
+    rows_done = db.Column(db.Integer, default=0)
+    rows_total = db.Column(db.Integer, nullable=True)
+    message = db.Column(db.String(255), nullable=True)
+    updated_on = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+# MonthlyReport: rendered monthly report per user and month, reused until its records change
+class MonthlyReport(db.Model):
+    __tablename__ = 'monthly_reports'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', name='uq_monthly_reports_user_month'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)  # fingerprint of the month's records
+    is_final = db.Column(db.Boolean, default=False)  # month over and no ongoing bookings: never rebuilt
+    stats = db.Column(db.JSON, nullable=False)
+    html = db.Column(db.Text, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow)
+
+# EmailOutbox: emails written in the same transaction as the change that triggers them,
+# sent later in batches by the outbox dispatcher
+class EmailOutbox(db.Model):
+    __tablename__ = 'email_outbox'
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('ix_email_outbox_claim_token', 'claim_token'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'email': one message to recipient. Anything else is a bulk email to all users that
+    # the dispatcher hands to its fan-out task, e.g. 'new_lot' with the lot's id in ref_id
+    kind = db.Column(db.String(30), nullable=False, default='email', server_default='email')
+    ref_id = db.Column(db.Integer, nullable=True)
+    recipient = db.Column(db.String(200), nullable=True)  # None for fan-out rows
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+    html_body = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    claim_token = db.Column(db.String(36), nullable=True)
+    claimed_until = db.Column(db.DateTime, nullable=True)  # lease; expired claims are picked up again
+    last_error = db.Column(db.String(255), nullable=True)
+    created_on = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_on = db.Column(db.DateTime, nullable=True)
 
 # Reservation: for booking a parking spot
 class Reservation(db.Model):
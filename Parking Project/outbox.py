@@ -0,0 +1,89 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_, select, update
+
+from models import EmailOutbox, db
+
+
+def enqueue_email(to, subject, body, html_body=None):
+    # Added to the caller's session: the email exists only if the caller's change commits
+    message = EmailOutbox(recipient=to, subject=subject, body=body, html_body=html_body,
+                          status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(message)
+    return message
+
+
+def enqueue_fanout(kind, ref_id, subject):
+    # Bulk email to every user (e.g. 'new_lot' announcing lot ref_id), in the caller's
+    # transaction like enqueue_email; the dispatcher starts the fan-out task for it
+    message = EmailOutbox(kind=kind, ref_id=ref_id, subject=subject,
+                          status='pending', attempts=0, next_attempt_at=datetime.utcnow())
+    db.session.add(message)
+    return message
+
+
+def claim_batch(batch_size, lease_seconds):
+    # Claim due rows for this dispatcher. On PostgreSQL/MySQL the candidate select
+    # uses FOR UPDATE SKIP LOCKED so concurrent dispatchers never wait on each
+    # other; the guarded UPDATE keeps claims exclusive on SQLite as well.
+    now = datetime.utcnow()
+    claimable = or_(
+        and_(EmailOutbox.status == 'pending', EmailOutbox.next_attempt_at <= now),
+        and_(EmailOutbox.status == 'sending', EmailOutbox.claimed_until < now)  # dispatcher died mid-batch
+    )
+    ids = db.session.execute(
+        select(EmailOutbox.id).where(claimable).order_by(EmailOutbox.id)
+        .limit(batch_size).with_for_update(skip_locked=True)
+    ).scalars().all()
+    if not ids:
+        db.session.commit()
+        return []
+
+    token = str(uuid.uuid4())
+    db.session.execute(
+        update(EmailOutbox).where(EmailOutbox.id.in_(ids), claimable)
+        .values(status='sending', claim_token=token, claimed_until=now + timedelta(seconds=lease_seconds))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+
+    return EmailOutbox.query.filter_by(claim_token=token, status='sending').order_by(EmailOutbox.id).all()
+
+
+def backoff_seconds(attempts, base_seconds, max_seconds):
+    return min(max_seconds, base_seconds * 2 ** (attempts - 1))
+
+
+def record_results(messages, results, claim_token, max_attempts, backoff_base, backoff_max):
+    # results line up with messages: one entry per message, in order. Rows are only
+    # updated while they still carry the claim_token this dispatcher took: once its
+    # lease ran out and another dispatcher claimed them, that one records the outcome.
+    now = datetime.utcnow()
+    counts = {'sent': 0, 'failed': 0, 'retrying': 0}
+    for message, result in zip(messages, results):
+        attempts = (message.attempts or 0) + 1
+        values = {'attempts': attempts, 'claim_token': None, 'claimed_until': None}
+        if result['status'] == 'success':
+            outcome = 'sent'
+            values.update(status='sent', sent_on=now, last_error=None)
+        elif attempts >= max_attempts:
+            outcome = 'failed'
+            values.update(status='failed', last_error=result.get('message', '')[:255])
+        else:
+            outcome = 'retrying'
+            values.update(status='pending', last_error=result.get('message', '')[:255],
+                          next_attempt_at=now + timedelta(seconds=backoff_seconds(attempts, backoff_base, backoff_max)))
+        updated = db.session.execute(
+            update(EmailOutbox).where(EmailOutbox.id == message.id, EmailOutbox.claim_token == claim_token)
+            .values(**values).execution_options(synchronize_session=False)
+        ).rowcount
+        if updated:
+            counts[outcome] += 1
+    db.session.commit()
+    return counts
+
+
+def outbox_counts():
+    rows = db.session.query(EmailOutbox.status, db.func.count(EmailOutbox.id)).group_by(EmailOutbox.status).all()
+    return {status: count for status, count in rows}
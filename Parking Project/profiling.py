@@ -0,0 +1,158 @@
+import cProfile
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from flask import current_app, g, request, session
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_ID_PATTERN = re.compile(r'^[0-9]{14}-[0-9a-f]{8}$')
+PROFILE_KINDS = {'pstats': '.prof', 'collapsed': '.collapsed'}
+
+# Only one profile per thread: cProfile cannot nest
+_active = threading.local()
+
+
+class StackSampler(threading.Thread):
+    # Samples the target thread's stack every `interval` seconds into
+    # collapsed-stack lines ("outer;inner;leaf count"), the flamegraph input format
+
+    def __init__(self, thread_id, interval):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return '\n'.join(f'{stack} {count}' for stack, count in sorted(self.stacks.items())) + '\n'
+
+
+class Profile:
+    def __init__(self, name, trigger, sample_interval):
+        self.name = name
+        self.trigger = trigger
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler(threading.get_ident(), sample_interval)
+        self.started = time.perf_counter()
+        self.sampler.start()
+        self.profiler.enable()
+
+    def stop(self, directory, max_profiles):
+        self.profiler.disable()
+        duration = time.perf_counter() - self.started
+        collapsed = self.sampler.stop()
+
+        profile_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, profile_id)
+        self.profiler.dump_stats(base + '.prof')
+        with open(base + '.collapsed', 'w') as f:
+            f.write(collapsed)
+        with open(base + '.json.tmp', 'w') as f:
+            json.dump({'id': profile_id, 'name': self.name, 'trigger': self.trigger,
+                       'duration_ms': round(duration * 1000, 2), 'at': datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(base + '.json.tmp', base + '.json')  # the profile is listed once its metadata exists
+        prune_profiles(directory, max_profiles)
+        return profile_id
+
+
+def start_profile(name, trigger, config):
+    if getattr(_active, 'profile', None) is not None:
+        return None
+    _active.profile = Profile(name, trigger, config['PROFILE_SAMPLE_INTERVAL'])
+    return _active.profile
+
+
+def stop_profile(profile, config):
+    _active.profile = None
+    return profile.stop(config['PROFILE_DIR'], config['PROFILE_MAX_PROFILES'])
+
+
+def prune_profiles(directory, max_profiles):
+    # Ids start with a timestamp, so name order is age order
+    ids = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+    for profile_id in ids[:-max_profiles] if len(ids) > max_profiles else []:
+        for suffix in ('.json',) + tuple(PROFILE_KINDS.values()):
+            try:
+                os.remove(os.path.join(directory, profile_id + suffix))
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory, name=None):
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in sorted(os.listdir(directory), reverse=True):
+        if not entry.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, entry)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue  # pruned while listing
+        if name is None or meta['name'] == name:
+            profiles.append(meta)
+    return profiles
+
+
+def profile_path(directory, profile_id, kind):
+    if not PROFILE_ID_PATTERN.match(profile_id) or kind not in PROFILE_KINDS:
+        return None
+    path = os.path.join(directory, profile_id + PROFILE_KINDS[kind])
+    return path if os.path.exists(path) else None
+
+
+def should_sample(rate):
+    return rate > 0 and random.random() < rate
+
+
+def init_profiling(blueprint):
+    # Off unless an admin sends "X-Profile: 1" or PROFILE_SAMPLE_RATE > 0; then
+    # the cost is one header lookup and one config read per request
+
+    @blueprint.before_request
+    def start_request_profile():
+        config = current_app.config
+        if request.headers.get(PROFILE_HEADER) == '1' and session.get('is_admin'):
+            trigger = 'header'
+        elif should_sample(config['PROFILE_SAMPLE_RATE']):
+            trigger = 'sampled'
+        else:
+            return
+        g.profile = start_profile(f'{request.method} {request.endpoint}', trigger, config)
+
+    @blueprint.after_request
+    def save_request_profile(response):
+        profile = g.pop('profile', None)
+        if profile is not None:
+            response.headers['X-Profile-Id'] = stop_profile(profile, current_app.config)
+        return response
+
+    @blueprint.teardown_request
+    def save_failed_request_profile(exc):
+        # The request raised, so after_request never ran: save what was collected
+        profile = g.pop('profile', None)
+        if profile is not None:
+            stop_profile(profile, current_app.config)
@@ -0,0 +1,184 @@
+import math
+import random
+import threading
+import time
+
+import redis
+
+# Refill-and-take in one round trip. Uses the Redis clock so every worker sees
+# the same time; returns how long to wait when there are not enough tokens.
+TOKEN_BUCKET_LUA = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local requested = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= requested then
+    tokens = tokens - requested
+else
+    wait = (requested - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+# After a Redis error, stay on the in-memory fallback this long before trying again
+REDIS_RETRY_SECONDS = 30
+RATE_WINDOW_SECONDS = 60
+RATE_BUCKET_SECONDS = 10
+
+
+class TokenBucket:
+    # Shared through Redis when it is reachable; otherwise each process limits
+    # itself with a local bucket of the same rate
+
+    def __init__(self, rate, capacity, redis_url=None, key='mail:token_bucket'):
+        self.rate = rate
+        self.capacity = capacity
+        self.key = key
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1) if redis_url else None
+        self.script = self.redis.register_script(TOKEN_BUCKET_LUA) if self.redis else None
+        self.redis_down_until = 0
+        self.lock = threading.Lock()
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    @property
+    def backend(self):
+        return 'redis' if self.redis and time.monotonic() >= self.redis_down_until else 'memory'
+
+    def _take_local(self, tokens):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def try_take(self, tokens=1):
+        # 0 when the tokens were taken, otherwise seconds until they will be available
+        if not self.rate:
+            return 0.0
+        if self.backend == 'redis':
+            try:
+                return float(self.script(keys=[self.key], args=[self.rate, self.capacity, tokens]))
+            except redis.RedisError as e:
+                print(f"⚠️ Rate limiter falling back to in-memory bucket: {str(e)}")
+                self.redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+        return self._take_local(tokens)
+
+    def acquire(self, tokens=1, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            wait = self.try_take(tokens)
+            if not wait:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class MailMetrics:
+    # Counters (sent, failed, retried, throttled_ms) plus a per-10s sent
+    # histogram for the send rate; in Redis so all workers add up, in memory otherwise
+
+    def __init__(self, redis_url=None, prefix='mail:metrics'):
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(redis_url, socket_timeout=1) if redis_url else None
+        self.redis_down_until = 0
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.sent_buckets = {}
+
+    def _use_redis(self):
+        return self.redis and time.monotonic() >= self.redis_down_until
+
+    def _redis_failed(self, e):
+        print(f"⚠️ Mail metrics falling back to in-memory counters: {str(e)}")
+        self.redis_down_until = time.monotonic() + REDIS_RETRY_SECONDS
+
+    def incr(self, name, amount=1):
+        bucket = int(time.time() // RATE_BUCKET_SECONDS)
+        if self._use_redis():
+            try:
+                pipe = self.redis.pipeline()
+                pipe.hincrby(self.prefix, name, amount)
+                if name == 'sent':
+                    pipe.incrby(f'{self.prefix}:sent:{bucket}', amount)
+                    pipe.expire(f'{self.prefix}:sent:{bucket}', RATE_WINDOW_SECONDS * 2)
+                pipe.execute()
+                return
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if name == 'sent':
+                self.sent_buckets[bucket] = self.sent_buckets.get(bucket, 0) + amount
+                for old in [b for b in self.sent_buckets if b < bucket - RATE_WINDOW_SECONDS // RATE_BUCKET_SECONDS]:
+                    del self.sent_buckets[old]
+
+    def snapshot(self):
+        # Only whole buckets count towards the rate, so it does not dip at bucket boundaries
+        current = int(time.time() // RATE_BUCKET_SECONDS)
+        buckets = range(current - RATE_WINDOW_SECONDS // RATE_BUCKET_SECONDS, current)
+        if self._use_redis():
+            try:
+                counters = {k.decode(): int(v) for k, v in self.redis.hgetall(self.prefix).items()}
+                recent = self.redis.mget([f'{self.prefix}:sent:{b}' for b in buckets])
+                sent_recent = sum(int(v) for v in recent if v)
+                return dict(counters, send_rate_per_second=round(sent_recent / RATE_WINDOW_SECONDS, 2))
+            except redis.RedisError as e:
+                self._redis_failed(e)
+        with self.lock:
+            sent_recent = sum(self.sent_buckets.get(b, 0) for b in buckets)
+            return dict(self.counters, send_rate_per_second=round(sent_recent / RATE_WINDOW_SECONDS, 2))
+
+
+def retry_delay(attempt, base_seconds, max_seconds):
+    # Full jitter: spreads retries from many workers instead of synchronising them
+    return random.uniform(0, min(max_seconds, base_seconds * 2 ** (attempt - 1)))
+
+
+def broker_queue_depth(broker_url, queues):
+    # Messages waiting in the Redis broker lists; None when the broker is not
+    # Redis (in-process executor, other transports) or not reachable
+    if not broker_url or not broker_url.startswith(('redis://', 'rediss://', 'unix://')):
+        return None
+    try:
+        client = redis.Redis.from_url(broker_url, socket_timeout=1)
+        return {queue: client.llen(queue) for queue in queues}
+    except (redis.RedisError, ValueError):
+        return None
+
+
+_mail_limiter = None
+_mail_metrics = None
+_init_lock = threading.Lock()
+
+
+def get_mail_limiter(config):
+    global _mail_limiter
+    if _mail_limiter is None:
+        with _init_lock:
+            if _mail_limiter is None:
+                rate = config['MAIL_RATE_PER_SECOND']
+                _mail_limiter = TokenBucket(rate, config['MAIL_RATE_BURST'] or max(1, math.ceil(rate)),
+                                            config['MAIL_RATE_LIMIT_REDIS_URL'])
+    return _mail_limiter
+
+
+def get_mail_metrics(config):
+    global _mail_metrics
+    if _mail_metrics is None:
+        with _init_lock:
+            if _mail_metrics is None:
+                _mail_metrics = MailMetrics(config['MAIL_RATE_LIMIT_REDIS_URL'])
+    return _mail_metrics
@@ -0,0 +1,300 @@
+import calendar
+import hashlib
+import time
+from datetime import datetime
+
+from sqlalchemy import and_, func, literal_column, select
+from sqlalchemy.exc import IntegrityError
+
+from emails import render_email
+from extensions import cache
+from models import MonthlyReport, ParkingLot, ParkingRecord, ParkingSpot, User, db
+
+REPORT_ROW_LIMIT = 15
+# Bump when the report layout or statistics change so stored artifacts are rebuilt
+REPORT_VERSION = 1
+# How often the bulk path checks on a report another worker is building
+REPORT_LOCK_POLL_SECONDS = 1
+
+
+def previous_month(today=None):
+    today = today or datetime.now()
+    if today.month == 1:
+        return today.year - 1, 12
+    return today.year, today.month - 1
+
+
+def month_bounds(year, month):
+    first_day = datetime(year, month, 1)
+    if month == 12:
+        return first_day, datetime(year + 1, 1, 1)
+    return first_day, datetime(year, month + 1, 1)
+
+
+def duration_hours(dialect_name):
+    # Hours between parked_at and left_at, computed in the database (NULL while ongoing)
+    if dialect_name == 'sqlite':
+        return (func.julianday(ParkingRecord.left_at) - func.julianday(ParkingRecord.parked_at)) * 24
+    if dialect_name in ('mysql', 'mariadb'):
+        return func.timestampdiff(literal_column('SECOND'), ParkingRecord.parked_at, ParkingRecord.left_at) / 3600.0
+    return func.extract('epoch', ParkingRecord.left_at - ParkingRecord.parked_at) / 3600.0
+
+
+def iter_report_users(chunk_size):
+    # Keyset pagination by id so any number of users streams in bounded chunks
+    last_id = 0
+    while True:
+        chunk = db.session.execute(
+            select(User.id, User.email, User.username, User.fullname)
+            .where(User.id > last_id, User.email != None, User.email != '')
+            .order_by(User.id)
+            .limit(chunk_size)
+        ).all()
+
+        if not chunk:
+            return
+
+        last_id = chunk[-1].id
+        yield chunk
+
+
+def build_monthly_reports(users, first_day, end):
+    # Three grouped queries per chunk of users instead of one query (plus one
+    # lazy load per record) per user
+    user_ids = [user.id for user in users]
+    in_month = and_(
+        ParkingRecord.user_id.in_(user_ids),
+        ParkingRecord.parked_at >= first_day,
+        ParkingRecord.parked_at < end
+    )
+    hours = duration_hours(db.session.get_bind().dialect.name)
+
+    totals = db.session.execute(
+        select(
+            ParkingRecord.user_id,
+            func.count(ParkingRecord.id).label('total_bookings'),
+            func.coalesce(func.sum(ParkingRecord.parking_cost), 0).label('total_spent'),
+            func.coalesce(func.sum(hours), 0).label('total_hours')
+        ).where(in_month).group_by(ParkingRecord.user_id)
+    ).all()
+
+    # Most used lot per user: rank lots by booking count inside each user's partition
+    lot_counts = select(
+        ParkingRecord.user_id,
+        ParkingLot.lot_name,
+        func.row_number().over(
+            partition_by=ParkingRecord.user_id,
+            order_by=(func.count(ParkingRecord.id).desc(), ParkingLot.lot_name)
+        ).label('rank')
+    ).join(
+        ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).where(in_month).group_by(ParkingRecord.user_id, ParkingLot.id, ParkingLot.lot_name).subquery()
+    top_lots = db.session.execute(
+        select(lot_counts.c.user_id, lot_counts.c.lot_name).where(lot_counts.c.rank == 1)
+    ).all()
+
+    # Latest bookings per user, capped with a window rank rather than a query per user
+    ranked = select(
+        ParkingRecord.user_id,
+        ParkingRecord.parked_at,
+        ParkingRecord.vehicle_number,
+        ParkingRecord.parking_cost,
+        hours.label('hours'),
+        ParkingLot.lot_name,
+        func.row_number().over(
+            partition_by=ParkingRecord.user_id,
+            order_by=(ParkingRecord.parked_at.desc(), ParkingRecord.id.desc())
+        ).label('rank')
+    ).join(
+        ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
+    ).join(
+        ParkingLot, ParkingSpot.lot_id == ParkingLot.id
+    ).where(in_month).subquery()
+    recent = db.session.execute(
+        select(ranked).where(ranked.c.rank <= REPORT_ROW_LIMIT).order_by(ranked.c.user_id, ranked.c.rank)
+    ).all()
+
+    totals_by_user = {row.user_id: row for row in totals}
+    top_lot_by_user = {row.user_id: row.lot_name for row in top_lots}
+    rows_by_user = {}
+    for row in recent:
+        rows_by_user.setdefault(row.user_id, []).append({
+            'date': row.parked_at.strftime('%Y-%m-%d'),
+            'lot_name': row.lot_name,
+            'vehicle_number': row.vehicle_number,
+            'duration': f"{row.hours:.1f}h" if row.hours is not None else "Ongoing",
+            'cost': row.parking_cost or 0
+        })
+
+    reports = []
+    for user in users:
+        total = totals_by_user.get(user.id)
+        if total:
+            stats = {
+                'total_bookings': total.total_bookings,
+                'total_spent': float(total.total_spent),
+                'most_used_lot': top_lot_by_user.get(user.id, "N/A"),
+                'avg_duration': f"{float(total.total_hours) / total.total_bookings:.1f} hours"
+            }
+        else:
+            stats = {'total_bookings': 0, 'total_spent': 0, 'most_used_lot': "No bookings", 'avg_duration': "0 hours"}
+
+        reports.append({
+            'user_id': user.id,
+            'email': user.email,
+            'name': user.fullname or user.username,
+            'month': first_day.month,
+            'month_name': calendar.month_name[first_day.month],
+            'year': first_day.year,
+            'stats': stats,
+            'rows': rows_by_user.get(user.id, [])
+        })
+    return reports
+
+
+def report_fingerprints(user_ids, first_day, end):
+    # Content hash of each user's records for the month, from one aggregate query:
+    # counts and ids for added or removed bookings, sums of what the report shows
+    # (cost, hours, spot) and the vehicle range for edited ones.
+    # A month is final once it is over and none of its bookings is still ongoing.
+    hours = duration_hours(db.session.get_bind().dialect.name)
+    rows = db.session.execute(
+        select(
+            ParkingRecord.user_id,
+            func.count(ParkingRecord.id).label('bookings'),
+            func.count(ParkingRecord.left_at).label('completed'),
+            func.coalesce(func.sum(ParkingRecord.id), 0).label('id_sum'),
+            func.coalesce(func.sum(ParkingRecord.parking_cost), 0).label('cost_sum'),
+            func.coalesce(func.sum(hours), 0).label('hours_sum'),
+            func.coalesce(func.sum(ParkingRecord.spot_id), 0).label('spot_sum'),
+            func.min(ParkingRecord.vehicle_number).label('first_vehicle'),
+            func.max(ParkingRecord.vehicle_number).label('last_vehicle'),
+            func.min(ParkingRecord.parked_at).label('first_parked_at'),
+            func.max(ParkingRecord.parked_at).label('last_parked_at'),
+            func.max(ParkingRecord.left_at).label('last_left_at')
+        ).where(
+            ParkingRecord.user_id.in_(user_ids),
+            ParkingRecord.parked_at >= first_day,
+            ParkingRecord.parked_at < end
+        ).group_by(ParkingRecord.user_id)
+    ).all()
+    by_user = {row.user_id: row for row in rows}
+    month_over = end <= datetime.now()
+
+    fingerprints = {}
+    for user_id in user_ids:
+        row = by_user.get(user_id)
+        parts = [REPORT_VERSION, first_day.isoformat()]
+        if row:
+            parts += [row.bookings, row.completed, row.id_sum, f"{float(row.cost_sum):.2f}",
+                      f"{float(row.hours_sum):.1f}", row.spot_sum, row.first_vehicle, row.last_vehicle,
+                      row.first_parked_at, row.last_parked_at, row.last_left_at]
+        content_hash = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()
+        fingerprints[user_id] = (content_hash, month_over and (not row or row.completed == row.bookings))
+    return fingerprints
+
+
+def render_monthly_report(report, content_hash, is_final, artifact=None):
+    html, text = render_email('monthly_report.html', **report)
+    if artifact is None:
+        artifact = MonthlyReport(user_id=report['user_id'], year=report['year'], month=report['month'])
+        db.session.add(artifact)
+    artifact.content_hash = content_hash
+    artifact.is_final = is_final
+    artifact.stats = report['stats']
+    artifact.html = html
+    artifact.text = text
+    artifact.created_on = datetime.utcnow()
+    return artifact
+
+
+def _report_lock_key(user_id, year, month):
+    return f"monthly_report_lock:{user_id}:{year}-{month:02d}"
+
+
+def get_monthly_report(user, year, month, lock_timeout=300):
+    # Stored artifact when the month's records are unchanged, otherwise rebuild it.
+    # Returns None when another worker is already building the same report.
+    artifact = MonthlyReport.query.filter_by(user_id=user.id, year=year, month=month).first()
+    if artifact and artifact.is_final:
+        return artifact
+
+    first_day, end = month_bounds(year, month)
+    content_hash, is_final = report_fingerprints([user.id], first_day, end)[user.id]
+    if artifact and artifact.content_hash == content_hash:
+        return artifact
+
+    # Singleflight: only the worker that wins the lock generates this report
+    lock_key = _report_lock_key(user.id, year, month)
+    if not cache.add(lock_key, 1, timeout=lock_timeout):
+        return None
+    try:
+        report = build_monthly_reports([user], first_day, end)[0]
+        artifact = render_monthly_report(report, content_hash, is_final, artifact)
+        db.session.commit()
+        return artifact
+    except IntegrityError:
+        # Lock expired and another worker stored it first
+        db.session.rollback()
+        return MonthlyReport.query.filter_by(user_id=user.id, year=year, month=month).first()
+    finally:
+        cache.delete(lock_key)
+
+
+def _stored_reports(user_ids, year, month):
+    return {
+        artifact.user_id: artifact
+        for artifact in MonthlyReport.query.filter(
+            MonthlyReport.user_id.in_(user_ids),
+            MonthlyReport.year == year,
+            MonthlyReport.month == month
+        )
+    }
+
+
+def get_monthly_reports(users, year, month, lock_timeout=300):
+    # Batch variant of get_monthly_report: one lookup and one fingerprint query per
+    # chunk, grouped queries only for the users whose artifact is missing or stale.
+    # Reports another worker is building are waited for, then reused or built here
+    # once its lock has expired; only users still locked after lock_timeout are left out.
+    first_day, end = month_bounds(year, month)
+    fingerprints = report_fingerprints([user.id for user in users], first_day, end)
+    artifacts = {}
+    pending = users
+    deadline = time.monotonic() + lock_timeout + REPORT_LOCK_POLL_SECONDS
+    while True:
+        stored = _stored_reports([user.id for user in pending], year, month)
+        stale = []
+        for user in pending:
+            artifact = stored.get(user.id)
+            if artifact and (artifact.is_final or artifact.content_hash == fingerprints[user.id][0]):
+                artifacts[user.id] = artifact
+            else:
+                stale.append(user)
+
+        locked = [user for user in stale if cache.add(_report_lock_key(user.id, year, month), 1, timeout=lock_timeout)]
+        try:
+            if locked:
+                built = {}
+                for report in build_monthly_reports(locked, first_day, end):
+                    content_hash, is_final = fingerprints[report['user_id']]
+                    built[report['user_id']] = render_monthly_report(
+                        report, content_hash, is_final, stored.get(report['user_id'])
+                    )
+                db.session.commit()
+                artifacts.update(built)
+        except IntegrityError:
+            # Lock expired and another worker stored some of them first: picked up next round
+            db.session.rollback()
+        finally:
+            for user in locked:
+                cache.delete(_report_lock_key(user.id, year, month))
+
+        pending = [user for user in stale if user.id not in artifacts]
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(REPORT_LOCK_POLL_SECONDS)
+
+    return [artifacts[user.id] for user in users if user.id in artifacts]
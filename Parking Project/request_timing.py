@@ -0,0 +1,99 @@
+import math
+import threading
+import time
+from collections import deque
+
+from flask import current_app, g, request
+
+from metrics import registry, start_query_tracking, stop_query_tracking
+
+# Requests kept per endpoint for the percentiles
+REQUEST_STATS_WINDOW = 1000
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank
+    if not sorted_values:
+        return 0
+    return sorted_values[min(len(sorted_values), max(1, math.ceil(fraction * len(sorted_values)))) - 1]
+
+
+class RequestStats:
+    # The last `window` requests per endpoint; percentiles are worked out when read,
+    # so recording a request is one append
+
+    def __init__(self, window=REQUEST_STATS_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.totals = {}
+
+    def add(self, endpoint, seconds, queries, sql_seconds):
+        with self.lock:
+            samples = self.samples.get(endpoint)
+            if samples is None:
+                samples = self.samples[endpoint] = deque(maxlen=self.window)
+            samples.append((seconds, queries, sql_seconds))
+            self.totals[endpoint] = self.totals.get(endpoint, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            snapshot = {endpoint: list(samples) for endpoint, samples in self.samples.items()}
+            totals = dict(self.totals)
+
+        rows = []
+        for endpoint, samples in snapshot.items():
+            times = sorted(s[0] for s in samples)
+            queries = [s[1] for s in samples]
+            rows.append({
+                'endpoint': endpoint,
+                'requests': totals[endpoint],
+                'window': len(samples),
+                'p50_ms': round(percentile(times, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(times, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(times, 0.99) * 1000, 2),
+                'max_ms': round(times[-1] * 1000, 2),
+                'avg_queries': round(sum(queries) / len(queries), 2),
+                'max_queries': max(queries),
+                'avg_sql_ms': round(sum(s[2] for s in samples) / len(samples) * 1000, 2)
+            })
+        return rows
+
+
+request_stats = RequestStats()
+
+
+def _finish(status_code):
+    started = g.pop('request_timing', None)
+    if started is None:
+        return None
+    seconds = time.perf_counter() - started[0]
+    queries, sql_seconds = stop_query_tracking(started[1])
+    request_stats.add(f'{request.method} {request.endpoint}', seconds, queries, sql_seconds)
+    registry.observe('parkeasy_http_request_duration_seconds',
+                     (('method', request.method), ('endpoint', request.endpoint), ('status', str(status_code))), seconds)
+    config = current_app.config
+    registry.maybe_flush(config['METRICS_DIR'], config['METRICS_FLUSH_SECONDS'])
+    return seconds, queries, sql_seconds
+
+
+def init_request_timing(blueprint):
+    # Wall time, SQL statement count and SQL time of every request to the blueprint
+
+    @blueprint.before_request
+    def start_request_timing():
+        g.request_timing = (time.perf_counter(), start_query_tracking())
+
+    @blueprint.after_request
+    def add_server_timing(response):
+        timing = _finish(response.status_code)
+        if timing and current_app.config['SERVER_TIMING_HEADER']:
+            seconds, queries, sql_seconds = timing
+            response.headers.add('Server-Timing',
+                                 f'app;dur={seconds * 1000:.1f}, db;dur={sql_seconds * 1000:.1f};desc="{queries} queries"')
+        return response
+
+    @blueprint.teardown_request
+    def finish_request_timing(exc):
+        # Requests that raised skip after_request; still record them and stop tracking
+        _finish(500)
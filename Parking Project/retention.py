@@ -0,0 +1,136 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, select
+
+from models import ParkingRecord, db
+
+ARCHIVE_COLUMNS = [
+    ParkingRecord.id,
+    ParkingRecord.user_id,
+    ParkingRecord.spot_id,
+    ParkingRecord.vehicle_number,
+    ParkingRecord.parked_at,
+    ParkingRecord.left_at,
+    ParkingRecord.parking_cost,
+    ParkingRecord.remarks,
+]
+
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path, checkpoint):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+def _serialize(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _write_batch(archive_dir, rows):
+    # One gzip JSON-lines file per (parked_at date, id range). Re-running the
+    # same batch after a crash overwrites the same files instead of duplicating.
+    first_id, last_id = rows[0].id, rows[-1].id
+    partitions = {}
+    for row in rows:
+        day = row.parked_at.strftime('%Y-%m-%d') if row.parked_at else 'unknown'
+        partitions.setdefault(day, []).append(row)
+
+    for day, day_rows in partitions.items():
+        day_dir = os.path.join(archive_dir, 'parking_records', day)
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f'{first_id:012d}-{last_id:012d}.jsonl.gz')
+        tmp_path = path + '.tmp'
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for row in day_rows:
+                record = {key: _serialize(value) for key, value in row._mapping.items()}
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, path)
+
+
+def _eligible(cutoff):
+    return (
+        ParkingRecord.parked_at < cutoff,
+        ParkingRecord.left_at != None  # Only completed bookings
+    )
+
+
+def _delete_archived(ids):
+    # Exactly the rows written to the archive: a record in the same id range that
+    # became eligible after the batch was read stays for the next run
+    result = db.session.execute(
+        delete(ParkingRecord)
+        .where(ParkingRecord.id.in_(ids))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def archive_old_records(archive_dir, retention_days=365, batch_size=1000, pause_seconds=0.0):
+    os.makedirs(archive_dir, exist_ok=True)
+    checkpoint_path = os.path.join(archive_dir, 'parking_records.checkpoint.json')
+
+    # Resume an interrupted run with its original cutoff so the id checkpoint stays valid
+    checkpoint = _load_checkpoint(checkpoint_path)
+    if checkpoint:
+        cutoff = datetime.fromisoformat(checkpoint['cutoff'])
+    else:
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        checkpoint = {'cutoff': cutoff.isoformat(), 'archived_through': 0, 'deleted_through': 0,
+                      'batch_ids': [], 'archived_count': 0, 'deleted_count': 0}
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+    # Archived but not yet deleted when the previous run stopped
+    if checkpoint['archived_through'] > checkpoint['deleted_through']:
+        checkpoint['deleted_count'] += _delete_archived(checkpoint['batch_ids'])
+        checkpoint['deleted_through'] = checkpoint['archived_through']
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+    while True:
+        rows = db.session.execute(
+            select(*ARCHIVE_COLUMNS)
+            .where(ParkingRecord.id > checkpoint['archived_through'], *_eligible(cutoff))
+            .order_by(ParkingRecord.id)
+            .limit(batch_size)
+        ).all()
+        # Release the read transaction so writers are not held up between batches
+        db.session.commit()
+
+        if not rows:
+            break
+
+        _write_batch(archive_dir, rows)
+        checkpoint['batch_ids'] = [row.id for row in rows]
+        checkpoint['archived_through'] = rows[-1].id
+        checkpoint['archived_count'] += len(rows)
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+        checkpoint['deleted_count'] += _delete_archived(checkpoint['batch_ids'])
+        checkpoint['deleted_through'] = rows[-1].id
+        _save_checkpoint(checkpoint_path, checkpoint)
+
+        if len(rows) < batch_size:
+            break
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    os.remove(checkpoint_path)
+    return {
+        'archived_count': checkpoint['archived_count'],
+        'deleted_count': checkpoint['deleted_count'],
+        'cutoff_date': cutoff.strftime('%Y-%m-%d')
+    }
@@ -1,16 +1,31 @@
 import csv
 import io
-from flask import Blueprint, make_response, request, jsonify, session, render_template, redirect, url_for, flash
+import os
+import time
+import uuid
+from flask import Blueprint, Response, current_app, make_response, send_file, stream_with_context, request, jsonify, session, render_template, redirect, url_for, flash
 from sqlalchemy import func
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import ParkingRecord, db, User, Admin, ParkingLot, ParkingSpot, Reservation
+from models import ParkingRecord, db, User, Admin, ParkingLot, ParkingSpot, Reservation, TaskStatus
 from datetime import datetime, timedelta
 from functools import wraps
-from tasks import send_instant_new_lot_email, generate_monthly_report, send_all_monthly_reports, export_user_parking_csv
+from tasks import kick_outbox, generate_monthly_report, send_all_monthly_reports, export_user_parking_csv, export_all_parking_records
 from celery.result import AsyncResult
+from celery_worker import TASK_QUEUES
 from extensions import cache
+from db_routing import read_only, stick_to_primary, use_primary
+from reports import previous_month
+from outbox import enqueue_fanout, outbox_counts
+from metrics import OCCUPANCY_SNAPSHOT_KEY, cache_hit_ratios, collect, occupancy_gauges, registry, render_text
+from request_timing import init_request_timing, request_stats
+from slow_queries import slow_query_log
+from profiling import init_profiling, list_profiles, profile_path
+from ratelimit import broker_queue_depth, get_mail_limiter, get_mail_metrics
+from exports import admin_export_status, export_fingerprint, find_reusable_export, iter_export_csv
 
 main = Blueprint('main', __name__)
+init_request_timing(main)
+init_profiling(main)
 
 def login_required(role='user'):
     def decorator(f):
@@ -30,6 +45,44 @@ def login_required(role='user'):
         return wrapper
     return decorator
 
+def queue_monthly_report(user_id):
+    # One queued report per user and month: repeated clicks get the task already in flight
+    year, month = previous_month()
+    task_key = f"monthly_report_task:{user_id}:{year}-{month:02d}"
+    task_id = str(uuid.uuid4())
+    if not cache.add(task_key, task_id, timeout=current_app.config['MONTHLY_REPORT_LOCK_TIMEOUT']):
+        existing = cache.get(task_key)
+        if existing:
+            return existing, False
+    try:
+        generate_monthly_report.apply_async(args=[user_id, year, month], task_id=task_id)
+    except Exception:
+        cache.delete(task_key)
+        raise
+    return task_id, True
+
+def get_active_sessions_by_spot(lot_id=None):
+    # Single query over the active-session partial index instead of one lookup per occupied spot
+    query = db.session.query(
+        ParkingRecord.spot_id,
+        ParkingRecord.vehicle_number,
+        ParkingRecord.parked_at,
+        User.username
+    ).outerjoin(
+        User, ParkingRecord.user_id == User.id
+    ).filter(
+        ParkingRecord.left_at == None
+    )
+    
+    if lot_id is not None:
+        query = query.join(
+            ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
+        ).filter(
+            ParkingSpot.lot_id == lot_id
+        )
+    
+    return {record.spot_id: record for record in query.all()}
+
 @main.route('/', methods=['GET'])
 def show_login_form():
     return render_template('Login.html')
@@ -225,6 +278,7 @@ def admin_summary():
 
 @main.route('/api/admin/summary', methods=['GET'])
 @login_required(role='admin')
+@read_only
 def get_admin_summary():
     try:
         from sqlalchemy import func, case
@@ -364,6 +418,7 @@ def admin_users_page():
 
 @main.route('/admin/users/list')
 @login_required()
+@read_only
 def get_users_list():
     try:
         admin_id = session.get('admin_id') or session.get('user_id')
@@ -429,6 +484,7 @@ def get_users_list():
 def manage_lots():
     if request.method == 'GET':
         lots = ParkingLot.query.filter_by(is_active=True).all()
+        active_sessions = get_active_sessions_by_spot()
         result = []
         for lot in lots:
             spots = ParkingSpot.query.filter_by(lot_id=lot.id, is_active=True).all()
@@ -444,15 +500,11 @@ def manage_lots():
                     'is_reserved': spot.status == 'O'
                 }
                 
-                if spot.status == 'O':
-                    current_record = ParkingRecord.query.filter_by(
-                        spot_id=spot.id, 
-                        left_at=None
-                    ).first()
-                    
+                current_record = active_sessions.get(spot.id) if spot.status == 'O' else None
+                if current_record:
                     spot_data.update({
                         'vehicle_no': current_record.vehicle_number,
-                        'user_name': current_record.user.username if current_record.user else 'Unknown',
+                        'user_name': current_record.username or 'Unknown',
                         'timestamp': current_record.parked_at.isoformat() if current_record.parked_at else None
                     })
                 
@@ -502,13 +554,12 @@ def manage_lots():
             )
             db.session.add(spot)
 
+        # The announcement commits with the lot; the outbox dispatcher starts the fan-out,
+        # retrying with backoff while the broker is unavailable
+        enqueue_fanout('new_lot', lot.id, f"🚗 New Parking Lot Available: {lot.lot_name}")
         db.session.commit()
-
-        try:
-            task = send_instant_new_lot_email.delay(lot.id)
-            email_status = "Users are being notified via email!"
-        except Exception as email_error:
-            email_status = "Parking lot created (email notification task failed)"
+        kick_outbox()
+        email_status = "Users are being notified via email!"
 
         response_data = {
             'id': lot.id,
@@ -560,12 +611,13 @@ def trigger_user_monthly_report(user_id):
                 'error': 'User not found'
             }), 404
         
-        task = generate_monthly_report.delay(user_id)
+        task_id, queued = queue_monthly_report(user_id)
         
         return jsonify({
             'success': True,
-            'message': f'Monthly report is being generated for {user.username}',
-            'task_id': task.id
+            'message': f'Monthly report is being generated for {user.username}' if queued
+                       else f'Monthly report for {user.username} was already requested',
+            'task_id': task_id
         }), 200
         
     except Exception as e:
@@ -580,12 +632,13 @@ def request_monthly_report():
     try:
         user_id = session['user_id']
         
-        task = generate_monthly_report.delay(user_id)
+        task_id, queued = queue_monthly_report(user_id)
         
         return jsonify({
             'success': True,
-            'message': 'Your monthly report is being generated and will be sent to your email shortly',
-            'task_id': task.id
+            'message': 'Your monthly report is being generated and will be sent to your email shortly' if queued
+                       else 'Your monthly report was already requested and will be sent to your email shortly',
+            'task_id': task_id
         }), 200
         
     except Exception as e:
@@ -594,6 +647,146 @@ def request_monthly_report():
             'error': 'Failed to generate monthly report. Please try again.'
         }), 500
 
+def admin_export_dir(job_id):
+    # job ids are generated here; anything else must not become a path
+    return os.path.join(current_app.config['EXPORT_DIR'], 'admin', str(uuid.UUID(job_id)))
+
+@main.route('/admin/export/parking-records', methods=['POST'])
+@login_required(role='admin')
+def start_admin_parking_export():
+    try:
+        job_id = str(uuid.uuid4())
+        export_all_parking_records.delay(admin_export_dir(job_id))
+        
+        return jsonify({
+            'success': True,
+            'message': 'Export of all parking records started',
+            'job_id': job_id,
+            'status_url': url_for('main.admin_parking_export_status', job_id=job_id)
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Failed to start export: {str(e)}'
+        }), 500
+
+@main.route('/admin/export/parking-records/<job_id>', methods=['GET'])
+@login_required(role='admin')
+def admin_parking_export_status(job_id):
+    try:
+        job_dir = admin_export_dir(job_id)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Export not found'}), 404
+    
+    status = admin_export_status(job_dir)
+    
+    if request.args.get('download'):
+        if status['status'] != 'completed':
+            return jsonify({'success': False, 'error': 'Export is not ready'}), 404
+        return send_file(
+            os.path.join(job_dir, status['manifest']['file']),
+            mimetype='application/gzip',
+            as_attachment=True,
+            download_name=f"parking_records_{status['manifest']['completed_at'][:10]}.csv.gz",
+            conditional=True
+        )
+    
+    if status['status'] == 'completed':
+        status['download_url'] = url_for('main.admin_parking_export_status', job_id=job_id, download=1)
+    return jsonify(dict(status, success=True, job_id=job_id))
+
+@main.route('/admin/metrics/mail', methods=['GET'])
+@login_required(role='admin')
+def mail_metrics():
+    config = current_app.config
+    limiter = get_mail_limiter(config)
+    outbox = outbox_counts()
+    
+    return jsonify({
+        'success': True,
+        'rate_limit': {
+            'per_second': limiter.rate,
+            'burst': limiter.capacity,
+            'backend': limiter.backend
+        },
+        'sending': get_mail_metrics(config).snapshot(),
+        'queue_depth': {
+            'outbox_pending': outbox.get('pending', 0),
+            'outbox_sending': outbox.get('sending', 0),
+            'outbox_failed': outbox.get('failed', 0),
+            'broker': broker_queue_depth(config['CELERY_BROKER_URL'], TASK_QUEUES)
+        }
+    })
+
+@main.route('/admin/metrics/tasks', methods=['GET'])
+@login_required(role='admin')
+def task_metrics():
+    counters, gauges, histograms = collect(current_app.config['METRICS_DIR'])
+    return Response(render_text(counters, gauges, histograms, prefix='parkeasy_task'), mimetype='text/plain; version=0.0.4')
+
+@main.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Scrape target: built from the metrics files and the cache, never from a database query
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    
+    counters, gauges, histograms = collect(current_app.config['METRICS_DIR'])
+    gauges.update(cache_hit_ratios(counters))
+    try:
+        snapshot = cache.cache.get(OCCUPANCY_SNAPSHOT_KEY)  # the backend directly: not a counted cache request
+    except Exception:
+        snapshot = None
+    if snapshot:
+        gauges.update(occupancy_gauges(snapshot, time.time()))
+    
+    return Response(render_text(counters, gauges, histograms), mimetype='text/plain; version=0.0.4')
+
+@main.route('/admin/metrics/requests', methods=['GET'])
+@login_required(role='admin')
+def request_metrics():
+    # Stats of the process serving this request
+    limit = request.args.get('limit', 10, type=int)
+    rows = request_stats.summary()
+    
+    return jsonify({
+        'success': True,
+        'slowest': sorted(rows, key=lambda r: r['p95_ms'], reverse=True)[:limit],
+        'most_queries': sorted(rows, key=lambda r: (r['avg_queries'], r['max_queries']), reverse=True)[:limit]
+    })
+
+@main.route('/admin/metrics/slow-queries', methods=['GET'])
+@login_required(role='admin')
+def slow_query_report():
+    # Slow statements seen by the process serving this request, grouped by normalized statement
+    limit = request.args.get('limit', 20, type=int)
+    
+    return jsonify({
+        'success': True,
+        'threshold_ms': current_app.config['SLOW_QUERY_MS'],
+        'statements': slow_query_log.aggregate()[:limit],
+        'recent': slow_query_log.recent(limit)
+    })
+
+@main.route('/admin/profiles', methods=['GET'])
+@login_required(role='admin')
+def list_saved_profiles():
+    # ?name=GET main.get_admin_summary or a task name narrows the list
+    return jsonify({
+        'success': True,
+        'profiles': list_profiles(current_app.config['PROFILE_DIR'], request.args.get('name'))
+    })
+
+@main.route('/admin/profiles/<profile_id>/<kind>', methods=['GET'])
+@login_required(role='admin')
+def download_profile(profile_id, kind):
+    # kind: pstats (python -m pstats / snakeviz) or collapsed (flamegraph.pl / speedscope)
+    path = profile_path(current_app.config['PROFILE_DIR'], profile_id, kind)
+    if not path:
+        return jsonify({'success': False, 'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, download_name=os.path.basename(path))
+
 @main.route('/admin/lots/<int:lot_id>', methods=['PUT'])
 @login_required(role='admin')
 def update_lot(lot_id):
@@ -688,6 +881,7 @@ def delete_lot(lot_id):
 def view_spots(lot_id):
     try:
         spots = ParkingSpot.query.filter_by(lot_id=lot_id, is_active=True).all()
+        active_sessions = get_active_sessions_by_spot(lot_id)
         spots_data = []
         
         for spot in spots:
@@ -699,15 +893,12 @@ def view_spots(lot_id):
             }
             
             if spot.status == 'O':
-                current_record = ParkingRecord.query.filter_by(
-                    spot_id=spot.id, 
-                    left_at=None
-                ).first()
+                current_record = active_sessions.get(spot.id)
                 
                 if current_record:
                     spot_data.update({
                         'vehicle_no': current_record.vehicle_number,
-                        'user_name': current_record.user.username if current_record.user else 'Unknown',
+                        'user_name': current_record.username or 'Unknown',
                         'timestamp': current_record.parked_at.isoformat() if current_record.parked_at else None
                     })
             
@@ -777,6 +968,7 @@ def user_search_parking():
 
 @main.route('/api/user/dashboard', methods=['GET'])
 @login_required()
+@read_only
 def get_user_dashboard_data():
     try:
         user_id = session['user_id']
@@ -848,6 +1040,7 @@ def clear_user_cache(user_id):
 
 @main.route('/api/user/daily-summary', methods=['GET'])
 @login_required()
+@read_only
 def get_daily_summary():
     try:
         user_id = session['user_id']
@@ -923,6 +1116,7 @@ def get_daily_summary():
 
 @main.route('/api/user/parking-history', methods=['GET'])
 @login_required()
+@read_only
 def get_user_parking_history():
     try:
         if 'user_id' not in session:
@@ -980,6 +1174,7 @@ def get_user_parking_history():
 
 @main.route('/api/user/stats', methods=['GET'])
 @login_required()
+@read_only
 def get_user_stats():
     try:
         user_id = session['user_id']
@@ -1102,6 +1297,7 @@ def change_user_password():
 
 @main.route('/api/parking-lots/search', methods=['GET'])
 @login_required()
+@read_only
 def search_parking_lots():
     try:
         query = request.args.get('q', '').strip()
@@ -1151,6 +1347,7 @@ def search_parking_lots():
 
 @main.route('/api/parking-lots/all', methods=['GET'])
 @login_required()
+@read_only
 def get_all_parking_lots():
     try:
         lots = ParkingLot.query.filter_by(is_active=True).all()
@@ -1188,6 +1385,7 @@ def get_all_parking_lots():
 
 @main.route('/api/parking-lots/<int:lot_id>', methods=['GET'])
 @login_required()
+@read_only
 def get_parking_lot_details(lot_id):
     try:
         lot = ParkingLot.query.filter_by(id=lot_id, is_active=True).first()
@@ -1233,12 +1431,14 @@ def book_parking():
         vehicle_number = data.get('vehicle_number', '').strip().upper()
         
         if not lot_id:
+            registry.inc('parkeasy_booking_failures_total', (('reason', 'invalid_request'),))
             return jsonify({
                 'success': False, 
                 'message': 'Parking lot ID is required'
             }), 400
             
         if not vehicle_number or len(vehicle_number) < 3:
+            registry.inc('parkeasy_booking_failures_total', (('reason', 'invalid_request'),))
             return jsonify({
                 'success': False, 
                 'message': 'Please enter a valid vehicle number (minimum 3 characters)'
@@ -1250,6 +1450,7 @@ def book_parking():
         ).first()
         
         if active_booking:
+            registry.inc('parkeasy_booking_failures_total', (('reason', 'already_active'),))
             return jsonify({
                 'success': False, 
                 'message': 'You already have an active booking. Please release it first.'
@@ -1257,6 +1458,7 @@ def book_parking():
         
         lot = ParkingLot.query.filter_by(id=lot_id, is_active=True).first()
         if not lot:
+            registry.inc('parkeasy_booking_failures_total', (('reason', 'lot_unavailable'),))
             return jsonify({
                 'success': False, 
                 'message': 'Selected parking lot is not available'
@@ -1269,6 +1471,7 @@ def book_parking():
         ).first()
         
         if not available_spot:
+            registry.inc('parkeasy_booking_failures_total', (('reason', 'no_spots'),))
             return jsonify({
                 'success': False, 
                 'message': 'No available spots in this parking lot'
@@ -1286,6 +1489,8 @@ def book_parking():
         
         db.session.add(parking_record)
         db.session.commit()
+        stick_to_primary()
+        registry.inc('parkeasy_bookings_total', (('lot_id', str(lot.id)),))
         
         return jsonify({
             'success': True,
@@ -1302,6 +1507,7 @@ def book_parking():
         
     except Exception as e:
         db.session.rollback()
+        registry.inc('parkeasy_booking_failures_total', (('reason', 'error'),))
         return jsonify({
             'success': False, 
             'message': 'Failed to book parking spot. Please try again.'
@@ -1328,6 +1534,7 @@ def release_parking():
         ).first()
         
         if not parking_record:
+            registry.inc('parkeasy_release_failures_total', (('reason', 'not_found'),))
             return jsonify({
                 'success': False, 
                 'message': 'No active booking found or booking already released'
@@ -1344,6 +1551,8 @@ def release_parking():
         parking_record.spot.status = 'A'
         
         db.session.commit()
+        stick_to_primary()
+        registry.inc('parkeasy_releases_total', (('lot_id', str(lot.id)),))
         
         return jsonify({
             'success': True,
@@ -1357,6 +1566,7 @@ def release_parking():
         
     except Exception as e:
         db.session.rollback()
+        registry.inc('parkeasy_release_failures_total', (('reason', 'error'),))
         return jsonify({
             'success': False, 
             'message': 'Failed to release parking spot. Please try again.'
@@ -1364,6 +1574,7 @@ def release_parking():
 
 @main.route('/api/user/bookings', methods=['GET'])
 @login_required()
+@read_only
 def get_user_bookings():
     try:
         user_id = session['user_id']
@@ -1409,26 +1620,119 @@ def get_user_bookings():
             'bookings': []
         }), 500
 
+def start_export_job(user_id):
+    use_primary()  # also called from the @read_only download endpoint
+    # Nothing changed since the last export: hand back that file straight away,
+    # or the job still writing it, so repeated clicks share one job
+    fingerprint, record_count = export_fingerprint(user_id)
+    previous = find_reusable_export(user_id, fingerprint, current_app.config['EXPORT_JOIN_RUNNING_SECONDS'])
+    if previous and previous.status != 'completed':
+        return {
+            'success': True,
+            'message': 'An export of your parking history is already running.',
+            'job_id': previous.job_id,
+            'status': previous.status,
+            'status_url': url_for('main.export_status', job_id=previous.job_id)
+        }
+    if previous:
+        return {
+            'success': True,
+            'message': 'Your parking history has not changed since the last export.',
+            'job_id': previous.job_id,
+            'status': 'completed',
+            'record_count': previous.rows_done,
+            'download_url': url_for('main.export_status', job_id=previous.job_id, download=1)
+        }
+    
+    job_id = str(uuid.uuid4())
+    db.session.add(TaskStatus(user_id=user_id, task_type='csv_export', status='pending',
+                              job_id=job_id, fingerprint=fingerprint, rows_done=0, rows_total=record_count))
+    db.session.commit()
+    export_user_parking_csv.apply_async(args=[user_id], task_id=job_id)
+    
+    return {
+        'success': True,
+        'message': 'CSV export started! You will receive an email with a download link when complete.',
+        'job_id': job_id,
+        'status': 'pending',
+        'status_url': url_for('main.export_status', job_id=job_id)
+    }
+
 @main.route('/api/user/export-csv', methods=['POST'])
 @login_required()
 def export_csv():
     try:
-        user_id = session['user_id']
-        
-        job = export_user_parking_csv.delay(user_id)
+        return jsonify(start_export_job(session['user_id']))
         
+    except Exception as e:
+        db.session.rollback()
         return jsonify({
-            'success': True,
-            'message': 'CSV export started! You will receive an email when complete.',
-            'job_id': job.id
-        })
+            'success': False,
+            'message': 'Failed to start export'
+        }), 500
+
+@main.route('/api/user/export.csv', methods=['GET'])
+@login_required()
+@read_only
+def export_csv_download():
+    try:
+        user_id = session['user_id']
+        
+        # Cheap count on the (user_id, parked_at) index decides between direct download and a job
+        record_count = db.session.query(func.count(ParkingRecord.id)).filter(
+            ParkingRecord.user_id == user_id
+        ).scalar()
+        if record_count > current_app.config['EXPORT_SYNC_MAX_ROWS']:
+            return jsonify(start_export_job(user_id)), 202
+        
+        # Rows go from a server-side cursor to the client as they are read (chunked, constant memory)
+        rows = iter_export_csv(user_id, current_app.config['EXPORT_BATCH_SIZE'])
+        response = Response(stream_with_context(rows), mimetype='text/csv')
+        response.headers['Content-Disposition'] = (
+            f"attachment; filename=parking_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        )
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
         
     except Exception as e:
+        db.session.rollback()
         return jsonify({
             'success': False,
-            'message': 'Failed to start export'
+            'message': 'Failed to export CSV'
         }), 500
 
+@main.route('/api/user/export/<job_id>', methods=['GET'])
+@login_required()
+def export_status(job_id):
+    job = TaskStatus.query.filter_by(job_id=job_id, user_id=session['user_id'], task_type='csv_export').first()
+    if not job:
+        return jsonify({'success': False, 'message': 'Export not found'}), 404
+    
+    file_ready = job.status == 'completed' and job.result_file_path and os.path.exists(job.result_file_path)
+    
+    if request.args.get('download'):
+        if not file_ready:
+            return jsonify({'success': False, 'message': 'Export file is not available'}), 404
+        # Served from disk by the WSGI server's file wrapper (sendfile where supported)
+        return send_file(
+            job.result_file_path,
+            mimetype='application/gzip',
+            as_attachment=True,
+            download_name=f"parking_history_{job.created_on.strftime('%Y%m%d_%H%M%S')}.csv.gz",
+            conditional=True
+        )
+    
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status if file_ready or job.status != 'completed' else 'expired',
+        'rows_done': job.rows_done or 0,
+        'rows_total': job.rows_total,
+        'progress': round(100 * (job.rows_done or 0) / job.rows_total) if job.rows_total else (100 if file_ready else 0),
+        'message': job.message,
+        'download_url': url_for('main.export_status', job_id=job.job_id, download=1) if file_ready else None
+    })
+
 @main.route('/reserve/<int:spot_id>', methods=['POST'])
 @login_required()
 def reserve_spot(spot_id):
@@ -1447,6 +1751,7 @@ def reserve_spot(spot_id):
     )
     db.session.add(new_reservation)
     db.session.commit()
+    stick_to_primary()
 
     return jsonify({'message': 'Spot reserved successfully'})
 
@@ -1465,5 +1770,6 @@ def release_spot(spot_id):
     reservation.released_at = datetime.now()
 
     db.session.commit()
+    stick_to_primary()
 
     return jsonify({'message': 'Spot released successfully'})
\ No newline at end of file
@@ -0,0 +1,190 @@
+import hashlib
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from celery import current_task
+from flask import has_request_context, request
+from sqlalchemy import event
+
+from metrics import registry
+
+# A fingerprint is explained again after this long; in between its plan is reused
+EXPLAIN_REUSE_SECONDS = 300
+
+_NORMALIZE = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),               # string literals
+    (re.compile(r'%\(\w+\)s|(?<!:):\w+|\$\d+|%s'), '?'),  # bound parameters of any paramstyle
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),            # numbers
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)'), '(?...)'),  # IN lists of any length
+    (re.compile(r'\s+'), ' '),
+]
+
+
+def normalize_statement(statement):
+    for pattern, replacement in _NORMALIZE:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode()).hexdigest()[:12]
+
+
+def redact(value):
+    # Types and sizes only: parameters carry user data (emails, vehicle numbers)
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__} len={len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def redact_parameters(parameters):
+    if isinstance(parameters, dict):
+        return {key: redact(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) for value in parameters]
+    return redact(parameters)
+
+
+def current_caller():
+    if has_request_context():
+        return f'{request.method} {request.endpoint}'
+    if current_task and current_task.request.id:
+        return current_task.name
+    return 'other'
+
+
+class SlowQueryLog:
+    # Ring buffer of the last `size` slow statements in this process
+
+    def __init__(self, size=200):
+        self.lock = threading.Lock()
+        self.entries = deque(maxlen=size)
+        self.plans = {}
+
+    def resize(self, size):
+        with self.lock:
+            self.entries = deque(self.entries, maxlen=size)
+
+    def add(self, entry):
+        with self.lock:
+            self.entries.append(entry)
+
+    def cached_plan(self, key):
+        with self.lock:
+            plan = self.plans.get(key)
+        if plan and time.monotonic() - plan[0] < EXPLAIN_REUSE_SECONDS:
+            return plan[1]
+        return None
+
+    def store_plan(self, key, plan):
+        with self.lock:
+            if len(self.plans) > 1000:
+                self.plans.clear()
+            self.plans[key] = (time.monotonic(), plan)
+
+    def aggregate(self):
+        with self.lock:
+            entries = list(self.entries)
+
+        groups = {}
+        for entry in entries:
+            group = groups.get(entry['fingerprint'])
+            if group is None:
+                group = groups[entry['fingerprint']] = {
+                    'fingerprint': entry['fingerprint'],
+                    'statement': entry['statement'],
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'callers': {},
+                }
+            group['count'] += 1
+            group['total_ms'] += entry['duration_ms']
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            group['callers'][entry['caller']] = group['callers'].get(entry['caller'], 0) + 1
+            # Entries are oldest first, so these end up describing the latest occurrence
+            group['last_seen'] = entry['at']
+            group['last_parameters'] = entry['parameters']
+            if entry['plan']:
+                group['plan'] = entry['plan']
+
+        rows = []
+        for group in groups.values():
+            group['avg_ms'] = round(group['total_ms'] / group['count'], 2)
+            group['total_ms'] = round(group['total_ms'], 2)
+            rows.append(group)
+        return sorted(rows, key=lambda g: g['total_ms'], reverse=True)
+
+    def recent(self, limit):
+        with self.lock:
+            return list(self.entries)[-limit:][::-1]
+
+
+slow_query_log = SlowQueryLog()
+_explaining = threading.local()
+
+
+def explain(engine, statement, parameters):
+    # On a separate connection: a failing EXPLAIN must not abort the caller's transaction
+    prefix = 'EXPLAIN QUERY PLAN ' if engine.dialect.name == 'sqlite' else 'EXPLAIN '
+    _explaining.active = True
+    try:
+        with engine.connect() as connection:
+            rows = connection.exec_driver_sql(prefix + statement, parameters).all()
+        if engine.dialect.name == 'sqlite':
+            return [row[-1] for row in rows]
+        return [' | '.join(str(value) for value in row) for row in rows]
+    except Exception as e:
+        return [f'EXPLAIN failed: {str(e)}']
+    finally:
+        _explaining.active = False
+
+
+def register_slow_query_log(app, db):
+    threshold = app.config['SLOW_QUERY_MS'] / 1000
+    if threshold <= 0:
+        return
+    slow_query_log.resize(app.config['SLOW_QUERY_BUFFER'])
+    capture_plan = app.config['SLOW_QUERY_EXPLAIN']
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info['slow_query_started'] = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop('slow_query_started', None)
+        if started is None or getattr(_explaining, 'active', False):
+            return
+        elapsed = time.perf_counter() - started
+        if elapsed < threshold:
+            return
+
+        normalized = normalize_statement(statement)
+        key = fingerprint(normalized)
+        caller = current_caller()
+        plan = None
+        if capture_plan and not executemany and normalized.lower().startswith(('select', 'with')):
+            plan = slow_query_log.cached_plan(key)
+            if plan is None:
+                plan = explain(conn.engine, statement, parameters)
+                slow_query_log.store_plan(key, plan)
+
+        slow_query_log.add({
+            'fingerprint': key,
+            'statement': normalized,
+            'parameters': redact_parameters(parameters),
+            'duration_ms': round(elapsed * 1000, 2),
+            'caller': caller,
+            'plan': plan,
+            'at': datetime.now().isoformat(timespec='seconds')
+        })
+        registry.inc('parkeasy_slow_queries_total', (('caller', caller),))
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
@@ -1,20 +1,28 @@
+from flask import current_app
 from flask_mail import Message
-from models import ParkingSpot, User, ParkingLot, ParkingRecord, db
+from models import ParkingSpot, User, ParkingLot, ParkingRecord, TaskStatus, db
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from collections import deque
+from sqlalchemy import case, func, update
 import calendar
-import csv
-import io
-from celery_worker import celery
-
-# Import Flask app and mail from main module
-def get_flask_app():
-    import sys
-    import os
-    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-    from main import create_app
-    return create_app()
+import os
+import smtplib
+import time
+from celery import chord, group
+from celery_worker import celery, get_flask_app, uses_broker
+from extensions import cache
+from emails import html_to_text, render_email, render_fragment
+from markupsafe import Markup
+from retention import archive_old_records
+from local_tasks import run_local_chord
+from metrics import OCCUPANCY_SNAPSHOT_KEY
+from outbox import claim_batch, enqueue_email, record_results
+from ratelimit import get_mail_limiter, get_mail_metrics, retry_delay
+from exports import (export_fingerprint, fail_admin_export, find_reusable_export, shard_ranges,
+                     stitch_admin_export, start_admin_export, write_export, write_shard)
+from reports import get_monthly_report, get_monthly_reports, iter_report_users, previous_month
 
+# Flask app comes from the per-process singleton in celery_worker; mail from main
 def get_mail_instance():
     import sys
     import os
@@ -22,7 +30,207 @@ def get_mail_instance():
     from main import mail
     return mail
 
-@celery.task(bind=True)
+def smtp_temporary_failure(e):
+    # 4xx replies mean "try again later": provider throttling, greylisting, full queues
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in e.recipients.values())
+    return isinstance(e, smtplib.SMTPResponseException) and 400 <= e.smtp_code < 500
+
+def close_connection(connection):
+    # quit() raises on a connection the server already dropped; the socket still needs closing
+    if connection.host is None:
+        return
+    try:
+        connection.host.quit()
+    except (smtplib.SMTPException, OSError):
+        connection.host.close()
+
+def send_messages(messages):
+    # Every mail path ends here: one SMTP connection (reconnecting after a dropped
+    # connection), one token from the shared rate limiter per message, and jittered
+    # retries on 4xx replies. Results line up with messages, one per message, and
+    # are always complete: messages that could not go out are reported as failed.
+    mail = get_mail_instance()
+    config = current_app.config
+    limiter = get_mail_limiter(config)
+    metrics = get_mail_metrics(config)
+    pending = deque((msg, 1) for msg in messages)
+    results = []
+    
+    while pending:
+        try:
+            connection = mail.connect().__enter__()  # opened by hand so a dead connection is closed, not quit
+        except Exception as e:
+            while pending:
+                msg, _ = pending.popleft()
+                results.append({'status': 'failed', 'recipient': ', '.join(msg.recipients),
+                                'message': f'connect failed: {str(e)}'})
+                metrics.incr('failed')
+            break
+        
+        try:
+            while pending:
+                msg, attempt = pending.popleft()
+                recipient = ', '.join(msg.recipients)
+                
+                waited = time.monotonic()
+                limiter.acquire()
+                waited = time.monotonic() - waited
+                if waited > 0.001:
+                    metrics.incr('throttled_ms', int(waited * 1000))
+                
+                try:
+                    connection.send(msg)
+                    results.append({'status': 'success', 'recipient': recipient})
+                    metrics.incr('sent')
+                except smtplib.SMTPServerDisconnected as e:
+                    # Not accepted before the drop: send it again over a new connection
+                    if attempt < config['MAIL_RETRY_ATTEMPTS']:
+                        metrics.incr('retried')
+                        pending.appendleft((msg, attempt + 1))
+                    else:
+                        results.append({'status': 'failed', 'recipient': recipient, 'message': str(e)})
+                        metrics.incr('failed')
+                    break
+                except Exception as e:
+                    if smtp_temporary_failure(e) and attempt < config['MAIL_RETRY_ATTEMPTS']:
+                        metrics.incr('retried')
+                        time.sleep(retry_delay(attempt, config['MAIL_RETRY_BASE_SECONDS'], config['MAIL_RETRY_MAX_SECONDS']))
+                        pending.appendleft((msg, attempt + 1))
+                        continue
+                    results.append({'status': 'failed', 'recipient': recipient, 'message': str(e)})
+                    metrics.incr('failed')
+        finally:
+            close_connection(connection)
+    
+    return results
+
+def start_fanout(row):
+    # A fan-out row is done once its task is queued; the task chunks the recipients itself
+    try:
+        if row.kind == 'new_lot':
+            send_instant_new_lot_email.delay(row.ref_id)
+        else:
+            return {'status': 'failed', 'message': f'Unknown outbox kind {row.kind}'}
+        return {'status': 'success'}
+    except Exception as e:
+        print(f"❌ Could not queue {row.kind} fan-out {row.ref_id}: {str(e)}")
+        return {'status': 'failed', 'message': str(e)}
+
+def drain_outbox(config, max_seconds=None):
+    # Claims due outbox rows batch by batch; each batch goes out over one SMTP connection
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    totals = {'sent': 0, 'failed': 0, 'retrying': 0}
+    
+    while deadline is None or time.monotonic() < deadline:
+        batch = claim_batch(config['OUTBOX_BATCH_SIZE'], config['OUTBOX_LEASE_SECONDS'])
+        if not batch:
+            break
+        claim_token = batch[0].claim_token
+        
+        emails = [row for row in batch if row.kind == 'email']
+        messages = [
+            Message(
+                subject=row.subject,
+                recipients=[row.recipient],
+                body=row.body,
+                html=row.html_body,
+                sender=config['MAIL_DEFAULT_SENDER']
+            )
+            for row in emails
+        ]
+        try:
+            sent = send_messages(messages) if messages else []
+        except Exception as e:
+            # Count it as a failed attempt for the whole batch so backoff and
+            # OUTBOX_MAX_ATTEMPTS apply, instead of leaving the rows claimed until the lease runs out
+            print(f"❌ Outbox batch failed: {str(e)}")
+            sent = [{'status': 'failed', 'message': str(e)}] * len(emails)
+        results_by_id = {row.id: result for row, result in zip(emails, sent)}
+        results = [results_by_id[row.id] if row.kind == 'email' else start_fanout(row) for row in batch]
+        counts = record_results(batch, results, claim_token, config['OUTBOX_MAX_ATTEMPTS'],
+                                config['OUTBOX_BACKOFF_BASE'], config['OUTBOX_BACKOFF_MAX'])
+        for key in totals:
+            totals[key] += counts[key]
+    
+    return totals
+
+def kick_outbox():
+    # Start a dispatcher right away; if the broker is down the beat schedule picks the rows up
+    try:
+        dispatch_email_outbox.delay()
+    except Exception as e:
+        print(f"⚠️ Could not queue outbox dispatch, leaving it to the schedule: {str(e)}")
+
+def iter_user_email_chunks(chunk_size):
+    # Keyset pagination by id so memory stays bounded for any number of users
+    last_id = 0
+    while True:
+        chunk = db.session.query(User.id, User.email).filter(
+            User.id > last_id,
+            User.email != None,
+            User.email != ''
+        ).order_by(User.id).limit(chunk_size).all()
+        
+        if not chunk:
+            return
+        
+        last_id = chunk[-1].id
+        yield [row.email for row in chunk]
+
+def iter_inactive_user_batches(day_start, day_end, batch_size):
+    # Anti-join on the (user_id, parked_at) index, paged by user id
+    active_that_day = db.session.query(ParkingRecord.id).filter(
+        ParkingRecord.user_id == User.id,
+        ParkingRecord.parked_at >= day_start,
+        ParkingRecord.parked_at < day_end
+    ).exists()
+    
+    last_id = 0
+    while True:
+        batch = db.session.query(User.id, User.email, User.username, User.fullname).filter(
+            User.id > last_id,
+            User.email != None,
+            User.email != '',
+            ~active_that_day
+        ).order_by(User.id).limit(batch_size).all()
+        
+        if not batch:
+            return
+        
+        last_id = batch[-1].id
+        yield batch
+
+def get_lot_availability():
+    # Totals and occupancy for every active lot in one grouped query
+    rows = db.session.query(
+        ParkingLot.id,
+        ParkingLot.lot_name,
+        ParkingLot.address,
+        ParkingLot.pincode,
+        ParkingLot.price_per_hour,
+        func.count(ParkingSpot.id).label('total_spots'),
+        func.coalesce(func.sum(case((ParkingSpot.status == 'O', 1), else_=0)), 0).label('occupied_spots')
+    ).outerjoin(
+        ParkingSpot, (ParkingSpot.lot_id == ParkingLot.id) & (ParkingSpot.is_active == True)
+    ).filter(
+        ParkingLot.is_active == True
+    ).group_by(
+        ParkingLot.id, ParkingLot.lot_name, ParkingLot.address, ParkingLot.pincode, ParkingLot.price_per_hour
+    ).order_by(ParkingLot.id).all()
+    
+    return [{
+        'lot_id': row.id,
+        'lot_name': row.lot_name,
+        'address': row.address,
+        'pincode': row.pincode,
+        'price_per_hour': row.price_per_hour,
+        'total_spots': int(row.total_spots),
+        'occupied_spots': int(row.occupied_spots),
+        'available_spots': int(row.total_spots) - int(row.occupied_spots)
+    } for row in rows]
+
+@celery.task(bind=True, ignore_result=True)
 def free_expired_spots(self):
     
     flask_app = get_flask_app()
@@ -57,53 +265,75 @@ def free_expired_spots(self):
             print(f"❌ Error freeing expired spots: {str(e)}")
             return {'error': str(e)}
         
-@celery.task(bind=True)
-def send_email_task(self, to, subject, body, html_body=None):
-   
-    flask_app = get_flask_app()
-    mail = get_mail_instance()
+@celery.task(bind=True, ignore_result=True)
+def dispatch_email_outbox(self):
     
+    flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            if '@' not in to:
-                print(f"❌ Invalid recipient: {to}")
-                return {'status': 'failed', 'message': 'Invalid email address'}
-            
-            msg = Message(
-                subject=subject,
-                recipients=[to],
-                body=body,
-                html=html_body,
-                sender=flask_app.config['MAIL_DEFAULT_SENDER']
-            )
-            mail.send(msg)
-            print(f"✅ Email sent to {to}")
-            return {'status': 'success', 'recipient': to}
+            totals = drain_outbox(flask_app.config, flask_app.config['OUTBOX_DISPATCH_SECONDS'])
+            if any(totals.values()):
+                print(f"✅ Outbox dispatch: {totals['sent']} sent, {totals['retrying']} retrying, {totals['failed']} failed")
+            return dict(totals, status='success')
             
         except Exception as e:
-            print(f"❌ Failed to send email to {to}: {str(e)}")
+            db.session.rollback()
+            print(f"❌ Error dispatching email outbox: {str(e)}")
             return {'status': 'failed', 'message': str(e)}
 
 @celery.task(bind=True)
-def get_inactive_users_today(self):
+def send_email_chunk(self, payload_key, recipients):
     
     flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            today = datetime.now().date()
+            # Shared subject/body is stored once in the cache, not once per queued message
+            payload = cache.get(payload_key)
+            if not payload:
+                print(f"❌ Email payload {payload_key} expired or missing")
+                return {'status': 'failed', 'message': 'Email payload not found', 'failed_count': len(recipients)}
+            
+            messages = [
+                Message(
+                    subject=payload['subject'],
+                    recipients=[to],
+                    body=payload['body'],
+                    html=payload['html_body'],
+                    sender=flask_app.config['MAIL_DEFAULT_SENDER']
+                )
+                for to in recipients if '@' in to
+            ]
+            invalid = [to for to in recipients if '@' not in to]
             
-            # Get users who have parking records today
-            users_active_today = db.session.query(ParkingRecord.user_id).filter(
-                func.date(ParkingRecord.parked_at) == today
-            ).distinct().subquery()
+            results = send_messages(messages)
+            failed = [r['recipient'] for r in results if r['status'] != 'success']
+            sent_count = len(results) - len(failed)
+            failed += invalid
             
-            # Get users who don't have parking records today
-            inactive_users = User.query.filter(
-                ~User.id.in_(users_active_today)
-            ).all()
+            print(f"✅ Email chunk {payload_key}: {sent_count} sent, {len(failed)} failed")
+            return {
+                'status': 'success' if not failed else 'partial',
+                'sent_count': sent_count,
+                'failed_count': len(failed),
+                'failed_recipients': failed
+            }
             
-            return [{'id': user.id, 'email': user.email, 'username': user.username, 'fullname': user.fullname} 
-                   for user in inactive_users if user.email]
+        except Exception as e:
+            print(f"❌ Failed to send email chunk {payload_key}: {str(e)}")
+            return {'status': 'failed', 'message': str(e), 'failed_count': len(recipients)}
+
+@celery.task(bind=True)
+def get_inactive_users_today(self):
+    
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        try:
+            day_start = datetime.combine(datetime.now().date(), datetime.min.time())
+            day_end = day_start + timedelta(days=1)
+            
+            return [{'id': user.id, 'email': user.email, 'username': user.username, 'fullname': user.fullname}
+                    for batch in iter_inactive_user_batches(day_start, day_end, flask_app.config['EMAIL_CHUNK_SIZE'])
+                    for user in batch]
             
         except Exception as e:
             print(f"❌ Error fetching inactive users: {str(e)}")
@@ -121,96 +351,37 @@ def send_instant_new_lot_email(self, parking_lot_id):
                 print(f"❌ Parking lot {parking_lot_id} not found")
                 return {'status': 'failed', 'message': 'Parking lot not found'}
             
-            # Get all users with email addresses
-            users = User.query.filter(User.email != None, User.email != '').all()
+            subject = f"🚗 New Parking Lot Available: {parking_lot.lot_name}"
+            
+            html_content, text_content = render_email('new_lot.html', lot=parking_lot)
             
-            if not users:
-                print("No users to send emails to")
-                return {'status': 'success', 'sent_count': 0}
+            payload_key = f"email_payload:new_lot:{parking_lot.id}:{self.request.id}"
+            cache.set(payload_key, {
+                'subject': subject,
+                'body': text_content,
+                'html_body': html_content
+            }, timeout=flask_app.config['EMAIL_PAYLOAD_TTL'])
             
-            subject = f"🚗 New Parking Lot Available: {parking_lot.lot_name}"
-            total_spots = parking_lot.number_of_spots
-            
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>New Parking Lot Available</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); 
-                              color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .lot-details {{ background: white; border-radius: 8px; padding: 20px; margin: 20px 0; 
-                                   border-left: 4px solid #667eea; }}
-                    .cta-button {{ display: inline-block; background: #667eea; color: white; 
-                                  padding: 12px 30px; text-decoration: none; border-radius: 5px; 
-                                  margin: 20px 0; }}
-                    .footer {{ text-align: center; color: #666; margin-top: 30px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🚗 New Parking Lot Available!</h1>
-                        <p>A new parking location has been added to our system</p>
-                    </div>
-                    
-                    <div class="content">
-                        <h2>Hello!</h2>
-                        <p>Great news! Our admin has just added a new parking lot to the system. 
-                           Book your spot now before it fills up!</p>
-                        
-                        <div class="lot-details">
-                            <h3>📍 {parking_lot.lot_name}</h3>
-                            <p><strong>Location:</strong> {parking_lot.address}</p>
-                            <p><strong>Pincode:</strong> {parking_lot.pincode}</p>
-                            <p><strong>Price:</strong> ₹{parking_lot.price_per_hour}/hour</p>
-                            <p><strong>Available Spots:</strong> {total_spots} spots available</p>
-                            <p><strong>Added:</strong> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                        </div>
-                        
-                        <div style="text-align: center;">
-                            <a href="#" class="cta-button">🔍 Book Now</a>
-                        </div>
-                        
-                        <p><strong>💡 Tip:</strong> Popular parking lots fill up quickly. Book your spot early!</p>
-                    </div>
-                    
-                    <div class="footer">
-                        <p>This is an automated notification from Parking Management System</p>
-                        <p>📧 Sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            # Send emails to all users
+            # One task per chunk of recipients, each reusing a single SMTP connection
             sent_count = 0
             failed_count = 0
+            chunk_task_ids = []
             
-            for user in users:
+            for recipients in iter_user_email_chunks(flask_app.config['EMAIL_CHUNK_SIZE']):
                 try:
-                    # Queue individual email tasks
-                    send_email_task.delay(
-                        to=user.email,
-                        subject=subject,
-                        body=f"New parking lot '{parking_lot.lot_name}' has been added at {parking_lot.address}",
-                        html_body=html_content
-                    )
-                    sent_count += 1
+                    chunk_task = send_email_chunk.delay(payload_key, recipients)
+                    chunk_task_ids.append(chunk_task.id)
+                    sent_count += len(recipients)
                 except Exception as e:
-                    print(f"❌ Failed to queue email for {user.email}: {str(e)}")
-                    failed_count += 1
+                    print(f"❌ Failed to queue email chunk of {len(recipients)} users: {str(e)}")
+                    failed_count += len(recipients)
             
-            print(f"✅ Instant emails queued for {sent_count} users about new lot: {parking_lot.lot_name}")
+            print(f"✅ Instant emails queued for {sent_count} users in {len(chunk_task_ids)} chunks about new lot: {parking_lot.lot_name}")
             return {
                 'status': 'success',
                 'sent_count': sent_count,
                 'failed_count': failed_count,
+                'chunk_task_ids': chunk_task_ids,
                 'lot_name': parking_lot.lot_name
             }
             
@@ -219,124 +390,102 @@ def send_instant_new_lot_email(self, parking_lot_id):
             return {'status': 'failed', 'message': str(e)}
 
 @celery.task(bind=True)
-def send_daily_inactive_reminder(self):
-   
+def send_inactive_reminder_chunk(self, payload_key, recipients):
+    
     flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            # Get inactive users
-            inactive_users_data = get_inactive_users_today()
+            # Lots section is rendered once per run and shared by every chunk
+            payload = cache.get(payload_key)
+            if not payload:
+                print(f"❌ Email payload {payload_key} expired or missing")
+                return {'status': 'failed', 'message': 'Email payload not found', 'failed_count': len(recipients)}
+            
+            lots_html = Markup(payload['lots_html'])
+            # Payloads queued before lots_text existed: convert the shared fragment once per chunk
+            lots_text = payload.get('lots_text') or html_to_text(lots_html)
+            messages = []
+            for recipient in recipients:
+                # Only the greeting differs per recipient
+                html_content, text_content = render_email('inactive_reminder.html', name=recipient['name'],
+                                                          lots_html=lots_html, lots_text=lots_text)
+                messages.append(Message(
+                    subject=payload['subject'],
+                    recipients=[recipient['email']],
+                    body=text_content,
+                    html=html_content,
+                    sender=flask_app.config['MAIL_DEFAULT_SENDER']
+                ))
             
-            if not inactive_users_data:
-                print("✅ No inactive users found - all users were active today!")
-                return {'status': 'success', 'sent_count': 0, 'message': 'All users were active today'}
+            results = send_messages(messages)
+            failed = [r['recipient'] for r in results if r['status'] != 'success']
+            
+            print(f"✅ Reminder chunk {payload_key}: {len(results) - len(failed)} sent, {len(failed)} failed")
+            return {
+                'status': 'success' if not failed else 'partial',
+                'sent_count': len(results) - len(failed),
+                'failed_count': len(failed),
+                'failed_recipients': failed
+            }
             
-            # Get available parking lots
-            available_lots = ParkingLot.query.filter_by(is_active=True).all()
+        except Exception as e:
+            print(f"❌ Failed to send reminder chunk {payload_key}: {str(e)}")
+            return {'status': 'failed', 'message': str(e), 'failed_count': len(recipients)}
+
+@celery.task(bind=True)
+def send_daily_inactive_reminder(self):
+   
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        try:
+            # Lot availability once, in a single grouped query
+            available_lots = get_lot_availability()
             
             if not available_lots:
                 print("❌ No available parking lots found")
                 return {'status': 'failed', 'message': 'No available parking lots'}
             
-            # Build lots HTML
-            lots_html = ""
+            # Lots section is the same for every recipient: render it once
             try:
-                for lot in available_lots:
-                    total_spots = ParkingSpot.query.filter_by(lot_id=lot.id, is_active=True).count()
-                    occupied_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='O', is_active=True).count()
-                    available_spots = total_spots - occupied_spots
-                    
-                    lots_html += f"""
-                    <div style="background: white; border-radius: 8px; padding: 15px; margin: 10px 0; border-left: 3px solid #28a745;">
-                        <h4 style="margin: 0 0 10px 0; color: #333;">📍 {lot.lot_name}</h4>
-                        <p style="margin: 5px 0; color: #666;">
-                            <strong>Location:</strong> {lot.address} ({lot.pincode})<br>
-                            <strong>Price:</strong> ₹{lot.price_per_hour}/hour<br>
-                            <strong>Available:</strong> {available_spots}/{total_spots} spots
-                        </p>
-                    </div>
-                    """
-                    
+                lots_html, lots_text = render_fragment('inactive_reminder_lots.html', lots=available_lots)
             except Exception as e:
                 print(f"❌ Error building lots HTML: {str(e)}")
-                lots_html = "<p>Error loading parking lot details.</p>"
+                lots_html, lots_text = "<p>Error loading parking lot details.</p>", "Error loading parking lot details."
             
             subject = "🅿️ Don't Miss Out - Parking Spots Available!"
+            day_start = datetime.combine(datetime.now().date(), datetime.min.time())
+            day_end = day_start + timedelta(days=1)
+            
+            payload_key = f"email_payload:inactive_reminder:{day_start.strftime('%Y-%m-%d')}:{self.request.id}"
+            cache.set(payload_key, {'subject': subject, 'lots_html': str(lots_html), 'lots_text': lots_text},
+                      timeout=flask_app.config['EMAIL_PAYLOAD_TTL'])
+            
             sent_count = 0
             failed_count = 0
+            chunk_task_ids = []
             
-            # Send emails to inactive users
-            for user_data in inactive_users_data:
+            # Stream inactive users in id-ordered batches, one email task per batch
+            for batch in iter_inactive_user_batches(day_start, day_end, flask_app.config['EMAIL_CHUNK_SIZE']):
+                recipients = [{'email': user.email, 'name': user.fullname or user.username} for user in batch]
                 try:
-                    html_content = f"""
-                    <!DOCTYPE html>
-                    <html>
-                    <head>
-                        <meta charset="UTF-8">
-                        <title>Parking Reminder</title>
-                        <style>
-                            body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                            .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                            .header {{ background: linear-gradient(135deg, #28a745 0%, #20c997 100%); 
-                                      color: white; padding: 30px; text-align: center; border-radius: 10px 10px 0 0; }}
-                            .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-                            .cta-button {{ display: inline-block; background: #28a745; color: white; 
-                                          padding: 12px 30px; text-decoration: none; border-radius: 5px; 
-                                          margin: 20px 0; }}
-                            .footer {{ text-align: center; color: #666; margin-top: 30px; }}
-                        </style>
-                    </head>
-                    <body>
-                        <div class="container">
-                            <div class="header">
-                                <h1>🅿️ Don't Miss Out!</h1>
-                                <p>Parking spots are available for booking</p>
-                            </div>
-                            
-                            <div class="content">
-                                <h2>Hello {user_data['fullname'] or user_data['username']}!</h2>
-                                <p>We noticed you haven't visited our parking system today. 
-                                   Don't miss out on available parking spots!</p>
-                                
-                                <h3>🚗 Available Parking Lots:</h3>
-                                {lots_html}
-                                
-                                <div style="text-align: center;">
-                                    <a href="#" class="cta-button">🔍 Browse & Book Now</a>
-                                </div>
-                                
-                                <p><strong>⏰ Reminder:</strong> This email is sent daily at 6 PM to users who haven't 
-                                   been active today. Stay ahead and book your parking spot!</p>
-                            </div>
-                            
-                            <div class="footer">
-                                <p>Daily Parking Reminder - Parking Management System</p>
-                                <p>📧 Sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                            </div>
-                        </div>
-                    </body>
-                    </html>
-                    """
-                    
-                    # Queue email task
-                    send_email_task.delay(
-                        to=user_data['email'],
-                        subject=subject,
-                        body=f"Hello {user_data['fullname'] or user_data['username']}, don't miss out on available parking spots!",
-                        html_body=html_content
-                    )
-                    sent_count += 1
-                    
+                    chunk_task = send_inactive_reminder_chunk.delay(payload_key, recipients)
+                    chunk_task_ids.append(chunk_task.id)
+                    sent_count += len(recipients)
                 except Exception as e:
-                    print(f"❌ Error queuing email for user {user_data['username']}: {str(e)}")
-                    failed_count += 1
+                    print(f"❌ Error queuing reminder chunk of {len(recipients)} users: {str(e)}")
+                    failed_count += len(recipients)
+            
+            if not sent_count and not failed_count:
+                print("✅ No inactive users found - all users were active today!")
+                return {'status': 'success', 'sent_count': 0, 'message': 'All users were active today'}
             
-            print(f"✅ Daily reminder emails queued for {sent_count} inactive users")
+            print(f"✅ Daily reminder emails queued for {sent_count} inactive users in {len(chunk_task_ids)} chunks")
             return {
                 'status': 'success',
                 'sent_count': sent_count,
                 'failed_count': failed_count,
-                'inactive_users': len(inactive_users_data)
+                'inactive_users': sent_count + failed_count,
+                'chunk_task_ids': chunk_task_ids
             }
             
         except Exception as e:
@@ -344,10 +493,9 @@ def send_daily_inactive_reminder(self):
             return {'status': 'failed', 'message': str(e)}
 
 @celery.task(bind=True)
-def generate_monthly_report(self, user_id):
+def generate_monthly_report(self, user_id, year=None, month=None):
    
     flask_app = get_flask_app()
-    mail = get_mail_instance()
     
     with flask_app.app_context():
         try:
@@ -357,199 +505,36 @@ def generate_monthly_report(self, user_id):
                 print(f"❌ User {user_id} not found")
                 return {'status': 'failed', 'message': 'User not found'}
             
-            # Get last month's data
-            today = datetime.now()
-            if today.month == 1:
-                last_month = 12
-                last_year = today.year - 1
-            else:
-                last_month = today.month - 1
-                last_year = today.year
-            
-            # Get first and last day of last month
-            first_day = datetime(last_year, last_month, 1)
-            last_day = datetime(last_year, last_month, calendar.monthrange(last_year, last_month)[1], 23, 59, 59)
-            month_name = calendar.month_name[last_month]
-            
-            # Query user's parking records for last month
-            records = db.session.query(ParkingRecord).join(
-                ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
-            ).join(
-                ParkingLot, ParkingSpot.lot_id == ParkingLot.id
-            ).filter(
-                ParkingRecord.user_id == user_id,
-                ParkingRecord.parked_at >= first_day,
-                ParkingRecord.parked_at <= last_day
-            ).all()
+            # Last month by default; served from the stored artifact unless its records changed
+            if year is None or month is None:
+                year, month = previous_month()
+            report = get_monthly_report(user, year, month, flask_app.config['MONTHLY_REPORT_LOCK_TIMEOUT'])
+            month_name = calendar.month_name[month]
             
-            if not records:
-                print(f"📊 No parking records found for user {user.username} in {month_name} {last_year}")
-                # Still send email saying no activity
-                total_bookings = 0
-                total_spent = 0
-                most_used_lot = "No bookings"
-                avg_duration = "0 hours"
-                records_html = "<p style='text-align: center; color: #666;'>No parking activity in this month.</p>"
-            else:
-                # Calculate statistics
-                total_bookings = len(records)
-                total_spent = sum([r.parking_cost or 0 for r in records])
-                
-                # Find most used parking lot
-                lot_usage = {}
-                total_duration = timedelta()
-                
-                for record in records:
-                    lot_name = record.spot.lot.lot_name
-                    lot_usage[lot_name] = lot_usage.get(lot_name, 0) + 1
-                    
-                    # Calculate duration
-                    if record.left_at:
-                        duration = record.left_at - record.parked_at
-                        total_duration += duration
-                
-                most_used_lot = max(lot_usage.items(), key=lambda x: x[1])[0] if lot_usage else "N/A"
-                avg_duration_hours = total_duration.total_seconds() / 3600 / total_bookings if total_bookings > 0 else 0
-                avg_duration = f"{avg_duration_hours:.1f} hours"
-                
-                # Generate records HTML table
-                records_html = """
-                <table style="width: 100%; border-collapse: collapse; margin: 20px 0;">
-                    <thead>
-                        <tr style="background: #f8f9fa;">
-                            <th style="border: 1px solid #ddd; padding: 12px; text-align: left;">Date</th>
-                            <th style="border: 1px solid #ddd; padding: 12px; text-align: left;">Location</th>
-                            <th style="border: 1px solid #ddd; padding: 12px; text-align: left;">Vehicle</th>
-                            <th style="border: 1px solid #ddd; padding: 12px; text-align: left;">Duration</th>
-                            <th style="border: 1px solid #ddd; padding: 12px; text-align: left;">Cost</th>
-                        </tr>
-                    </thead>
-                    <tbody>
-                """
-                
-                for record in records[:15]:  # Show latest 15 records
-                    duration_str = "Ongoing"
-                    if record.left_at:
-                        duration = record.left_at - record.parked_at
-                        hours = duration.total_seconds() / 3600
-                        duration_str = f"{hours:.1f}h"
-                    
-                    records_html += f"""
-                    <tr>
-                        <td style="border: 1px solid #ddd; padding: 8px;">{record.parked_at.strftime('%Y-%m-%d')}</td>
-                        <td style="border: 1px solid #ddd; padding: 8px;">{record.spot.lot.lot_name}</td>
-                        <td style="border: 1px solid #ddd; padding: 8px;">{record.vehicle_number}</td>
-                        <td style="border: 1px solid #ddd; padding: 8px;">{duration_str}</td>
-                        <td style="border: 1px solid #ddd; padding: 8px;">₹{record.parking_cost or 0:.2f}</td>
-                    </tr>
-                    """
-                
-                records_html += "</tbody></table>"
-                
-                if len(records) > 15:
-                    records_html += f"<p style='color: #666; font-style: italic;'>... and {len(records) - 15} more bookings</p>"
-            
-            # Create HTML email content
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>Monthly Parking Report - {month_name} {last_year}</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; margin: 0; padding: 0; }}
-                    .container {{ max-width: 800px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: linear-gradient(135deg, #4a90e2 0%, #7b68ee 100%); 
-                              color: white; padding: 40px; text-align: center; border-radius: 15px 15px 0 0; }}
-                    .content {{ background: #f8f9fa; padding: 40px; border-radius: 0 0 15px 15px; }}
-                    .stats-grid {{ display: flex; flex-wrap: wrap; gap: 20px; margin: 30px 0; }}
-                    .stat-card {{ background: white; border-radius: 12px; padding: 25px; flex: 1; min-width: 200px;
-                                 border-left: 5px solid #4a90e2; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .stat-number {{ font-size: 32px; font-weight: bold; color: #4a90e2; margin: 0; }}
-                    .stat-label {{ color: #666; margin: 5px 0 0 0; font-size: 14px; }}
-                    .section {{ background: white; border-radius: 12px; padding: 30px; margin: 25px 0; 
-                               box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
-                    .footer {{ text-align: center; color: #666; margin-top: 40px; padding: 20px; }}
-                    h2 {{ color: #4a90e2; border-bottom: 2px solid #4a90e2; padding-bottom: 10px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>📊 Monthly Parking Report</h1>
-                        <h2>{month_name} {last_year}</h2>
-                        <p>Your comprehensive parking activity summary</p>
-                    </div>
-                    
-                    <div class="content">
-                        <h2>Hello {user.fullname or user.username}!</h2>
-                        <p>Here's your detailed parking activity report for <strong>{month_name} {last_year}</strong>. 
-                           This automated report helps you track your parking patterns and expenses.</p>
-                        
-                        <div class="stats-grid">
-                            <div class="stat-card">
-                                <p class="stat-number">{total_bookings}</p>
-                                <p class="stat-label">Total Bookings</p>
-                            </div>
-                            <div class="stat-card">
-                                <p class="stat-number">₹{total_spent:.2f}</p>
-                                <p class="stat-label">Total Spent</p>
-                            </div>
-                            <div class="stat-card">
-                                <p class="stat-number" style="font-size: 20px;">{most_used_lot}</p>
-                                <p class="stat-label">Most Used Location</p>
-                            </div>
-                            <div class="stat-card">
-                                <p class="stat-number" style="font-size: 20px;">{avg_duration}</p>
-                                <p class="stat-label">Avg. Duration</p>
-                            </div>
-                        </div>
-                        
-                        <div class="section">
-                            <h2>📋 Booking Details</h2>
-                            {records_html}
-                        </div>
-                        
-                        <div class="section">
-                            <h2>💡 Insights & Tips</h2>
-                            <ul style="line-height: 1.8;">
-                                <li><strong>Peak Usage:</strong> {most_used_lot} was your go-to parking location this month.</li>
-                                <li><strong>Average Cost:</strong> You spent an average of ₹{(total_spent/total_bookings) if total_bookings > 0 else 0:.2f} per booking.</li>
-                                <li><strong>Tip:</strong> Consider booking during off-peak hours for better availability!</li>
-                            </ul>
-                        </div>
-                    </div>
-                    
-                    <div class="footer">
-                        <p><strong>Monthly Parking Report</strong> - Parking Management System</p>
-                        <p>📧 Generated on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                        <p style="font-size: 12px; color: #999;">This report is automatically generated on the 1st of every month</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
+            if report is None:
+                print(f"⏳ Monthly report for {user.username} for {month_name} {year} is already being generated")
+                return {'status': 'in_progress', 'message': 'Monthly report is already being generated'}
+            
+            stats = report.stats
+            if not stats['total_bookings']:
+                print(f"📊 No parking records found for user {user.username} in {month_name} {year}")
             
             # Send email
-            subject = f"📊 Your Monthly Parking Report - {month_name} {last_year}"
+            subject = f"📊 Your Monthly Parking Report - {month_name} {year}"
             
             if user.email:
-                # Use the send_email_task to send the email
-                result = send_email_task.delay(
-                    to=user.email,
-                    subject=subject,
-                    body=f"Your monthly parking report for {month_name} {last_year} is ready!",
-                    html_body=html_content
-                )
-                print(f"✅ Monthly report queued for {user.email} for {month_name} {last_year}")
+                enqueue_email(user.email, subject, report.text, report.html)
+                db.session.commit()
+                kick_outbox()
+                print(f"✅ Monthly report queued for {user.email} for {month_name} {year}")
                 
                 return {
                     'status': 'success',
                     'message': f'Monthly report queued for {user.email}',
                     'stats': {
-                        'total_bookings': total_bookings,
-                        'total_spent': total_spent,
-                        'most_used_lot': most_used_lot
+                        'total_bookings': stats['total_bookings'],
+                        'total_spent': stats['total_spent'],
+                        'most_used_lot': stats['most_used_lot']
                     }
                 }
             else:
@@ -561,37 +546,81 @@ def generate_monthly_report(self, user_id):
             return {'status': 'failed', 'message': str(e)}
 
 @celery.task(bind=True)
-def send_all_monthly_reports(self):
+def send_monthly_report_chunk(self, user_ids, year, month):
     
     flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            # Get all users with email addresses
-            users = User.query.filter(User.email != None, User.email != '').all()
+            users = db.session.query(User.id, User.email, User.username, User.fullname).filter(
+                User.id.in_(user_ids)
+            ).order_by(User.id).all()
+            emails_by_user = {user.id: user.email for user in users}
+            
+            # Stored artifacts where still current; stale or missing ones rebuilt in grouped queries
+            subject = f"📊 Your Monthly Parking Report - {calendar.month_name[month]} {year}"
+            messages = [
+                Message(
+                    subject=subject,
+                    recipients=[emails_by_user[report.user_id]],
+                    body=report.text,
+                    html=report.html,
+                    sender=flask_app.config['MAIL_DEFAULT_SENDER']
+                )
+                for report in get_monthly_reports(users, year, month, flask_app.config['MONTHLY_REPORT_LOCK_TIMEOUT'])
+            ]
             
-            if not users:
-                print("❌ No users with email addresses found")
-                return {'status': 'failed', 'message': 'No users found'}
+            results = send_messages(messages)
+            failed = [r['recipient'] for r in results if r['status'] != 'success']
+            skipped = len(users) - len(messages)
+            
+            print(f"✅ Monthly report chunk {year}-{month:02d}: {len(results) - len(failed)} sent, "
+                  f"{len(failed)} failed, {skipped} still being generated by another worker")
+            return {
+                'status': 'success' if not failed else 'partial',
+                'sent_count': len(results) - len(failed),
+                'failed_count': len(failed),
+                'skipped_count': skipped,
+                'failed_recipients': failed
+            }
+            
+        except Exception as e:
+            print(f"❌ Failed to send monthly report chunk {year}-{month:02d}: {str(e)}")
+            return {'status': 'failed', 'message': str(e), 'failed_count': len(user_ids)}
+
+@celery.task(bind=True)
+def send_all_monthly_reports(self):
+    
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        try:
+            year, month = previous_month()
             
             sent_count = 0
             failed_count = 0
+            chunk_task_ids = []
             
-            # Generate monthly report for each user
-            for user in users:
+            # Stream users with email addresses in id-ordered chunks, one report task per chunk
+            for users in iter_report_users(flask_app.config['EMAIL_CHUNK_SIZE']):
+                user_ids = [user.id for user in users]
                 try:
-                    # Queue individual monthly report tasks
-                    generate_monthly_report.delay(user.id)
-                    sent_count += 1
+                    chunk_task = send_monthly_report_chunk.delay(user_ids, year, month)
+                    chunk_task_ids.append(chunk_task.id)
+                    sent_count += len(user_ids)
                 except Exception as e:
-                    print(f"❌ Failed to queue monthly report for user {user.username}: {str(e)}")
-                    failed_count += 1
+                    print(f"❌ Failed to queue monthly report chunk of {len(user_ids)} users: {str(e)}")
+                    failed_count += len(user_ids)
+            
+            if not sent_count and not failed_count:
+                print("❌ No users with email addresses found")
+                return {'status': 'failed', 'message': 'No users found'}
             
-            print(f"✅ Monthly reports queued for {sent_count} users")
+            print(f"✅ Monthly reports queued for {sent_count} users in {len(chunk_task_ids)} chunks")
             return {
                 'status': 'success',
                 'sent_count': sent_count,
                 'failed_count': failed_count,
-                'total_users': len(users)
+                'total_users': sent_count + failed_count,
+                'chunk_task_ids': chunk_task_ids
             }
             
         except Exception as e:
@@ -602,7 +631,7 @@ def send_all_monthly_reports(self):
 def export_user_parking_csv(self, user_id):
     
     flask_app = get_flask_app()
-    mail = get_mail_instance()
+    job_id = self.request.id
     
     with flask_app.app_context():
         try:
@@ -614,117 +643,148 @@ def export_user_parking_csv(self, user_id):
             
             print(f"📊 Starting CSV export for user: {user.username}")
             
-            # Get all parking records for the user
-            records = db.session.query(ParkingRecord).join(
-                ParkingSpot, ParkingRecord.spot_id == ParkingSpot.id
-            ).join(
-                ParkingLot, ParkingSpot.lot_id == ParkingLot.id
-            ).filter(
-                ParkingRecord.user_id == user_id
-            ).order_by(ParkingRecord.parked_at.desc()).all()
-            
-            print(f"📊 Found {len(records)} parking records")
-            
-            # Create CSV content
-            csv_buffer = io.StringIO()
-            csv_writer = csv.writer(csv_buffer)
-            
-            # Write CSV headers (as per requirements)
-            csv_writer.writerow([
-                'Slot ID',
-                'Spot ID', 
-                'Parking Lot Name',
-                'Address',
-                'Vehicle Number',
-                'Parked At',
-                'Left At',
-                'Duration (Hours)',
-                'Cost (₹)',
-                'Remarks'
-            ])
-            
-            # Write data rows
-            for record in records:
-                # Calculate duration
-                duration_hours = 0
-                if record.left_at:
-                    duration = record.left_at - record.parked_at
-                    duration_hours = round(duration.total_seconds() / 3600, 2)
-                
-                # Create remarks
-                status = "Completed" if record.left_at else "Active"
-                remarks = f"Status: {status}"
+            job = TaskStatus.query.filter_by(job_id=job_id).first()
+            if not job:
+                job = TaskStatus(user_id=user_id, task_type='csv_export', job_id=job_id)
+                db.session.add(job)
+            
+            fingerprint, record_count = export_fingerprint(user_id)
+            job.fingerprint = fingerprint
+            job.rows_total = record_count
+            job.rows_done = 0
+            job.status = 'processing'
+            
+            previous = find_reusable_export(user_id, fingerprint)
+            if previous:
+                # Records unchanged since the last export: point this job at the same file
+                job.result_file_path = previous.result_file_path
+                job.rows_done = previous.rows_done
+                job.status = 'completed'
+                job.message = 'Reused unchanged export'
+                print(f"♻️ Reusing unchanged CSV export for {user.username} ({record_count} records)")
+            else:
+                db.session.commit()
                 
-                csv_writer.writerow([
-                    record.id,  # Slot ID
-                    record.spot.id,  # Spot ID
-                    record.spot.lot.lot_name,  # Parking Lot Name
-                    f"{record.spot.lot.address}, {record.spot.lot.pincode}",  # Address
-                    getattr(record, 'vehicle_number', 'N/A'),  # Vehicle Number
-                    record.parked_at.strftime('%Y-%m-%d %H:%M:%S'),  # Parked At
-                    record.left_at.strftime('%Y-%m-%d %H:%M:%S') if record.left_at else 'Still Parked',  # Left At
-                    duration_hours,  # Duration
-                    record.parking_cost or 0,  # Cost
-                    remarks  # Remarks
-                ])
-            
-            csv_content = csv_buffer.getvalue()
-            csv_buffer.close()
-            
-            # Send email with CSV attachment
-            if user.email:
-                subject = f"Parking History Export - {datetime.now().strftime('%Y-%m-%d')}"
+                # Progress goes through its own connection so the streaming read stays open
+                def report_progress(rows_done):
+                    with db.engine.begin() as connection:
+                        connection.execute(
+                            update(TaskStatus).where(TaskStatus.job_id == job_id)
+                            .values(rows_done=rows_done, updated_on=datetime.utcnow())
+                        )
                 
-                html_content = f"""
-                <h2>🚗 Parking History Export</h2>
-                <p>Hello {user.fullname or user.username},</p>
-                <p>Your parking history CSV export is ready!</p>
-                <p><strong>Total Records:</strong> {len(records)}</p>
-                <p><strong>Export Date:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                <p>The CSV file is attached to this email.</p>
-                <br>
-                <p>Best regards,<br>ParkEasy Team</p>
-                """
+                path = os.path.join(flask_app.config['EXPORT_DIR'], f'user_{user_id}', f'{fingerprint}.csv.gz')
+                rows_done = write_export(user_id, path, flask_app.config['EXPORT_BATCH_SIZE'], report_progress)
                 
-                # Create email message
-                msg = Message(
-                    subject=subject,
-                    recipients=[user.email],
-                    html=html_content,
-                    sender=flask_app.config['MAIL_DEFAULT_SENDER']
+                job = TaskStatus.query.filter_by(job_id=job_id).first()
+                job.result_file_path = path
+                job.rows_done = rows_done
+                job.status = 'completed'
+                print(f"✅ CSV export written for {user.username}: {rows_done} records")
+            
+            # Email a download link instead of attaching the file; the email row
+            # commits together with the completed job
+            if user.email:
+                download_url = f"{flask_app.config['PUBLIC_BASE_URL'].rstrip('/')}/api/user/export/{job_id}?download=1"
+                html_content, text_content = render_email(
+                    'csv_export.html',
+                    name=user.fullname or user.username,
+                    record_count=job.rows_done,
+                    download_url=download_url
                 )
-                
-                # Attach CSV file
-                filename = f"parking_history_{user.username}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                msg.attach(
-                    filename=filename,
-                    content_type='text/csv',
-                    data=csv_content
+                enqueue_email(
+                    user.email,
+                    f"Parking History Export - {datetime.now().strftime('%Y-%m-%d')}",
+                    text_content,
+                    html_content
                 )
-                
-                # Send email
-                mail.send(msg)
-                print(f"✅ CSV export sent to {user.email} with {len(records)} records")
-                
-                return {
-                    'status': 'success',
-                    'message': f'CSV export sent to {user.email}',
-                    'record_count': len(records)
-                }
-            else:
-                print(f"❌ No email address for user {user.username}")
-                return {'status': 'failed', 'message': 'No email address found'}
+            db.session.commit()
+            if user.email:
+                kick_outbox()
+                print(f"✅ CSV export link queued for {user.email}")
+            
+            return {
+                'status': 'success',
+                'message': 'CSV export ready',
+                'job_id': job_id,
+                'record_count': job.rows_done
+            }
                 
         except Exception as e:
             print(f"❌ Error exporting CSV for user {user_id}: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            db.session.rollback()
+            db.session.execute(
+                update(TaskStatus).where(TaskStatus.job_id == job_id)
+                .values(status='failed', message=str(e)[:255], updated_on=datetime.utcnow())
+            )
+            db.session.commit()
             return {'status': 'failed', 'message': str(e)}
 
+@celery.task(bind=True)
+def export_all_parking_records(self, job_dir):
+    
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        try:
+            # Split the id range into shards exported in parallel by the workers, then stitched
+            ranges = shard_ranges(flask_app.config['ADMIN_EXPORT_SHARDS'])
+            start_admin_export(job_dir, ranges)
+            
+            if not ranges:
+                manifest = stitch_admin_export(job_dir, [])
+                print("✅ Admin export finished: no parking records")
+                return {'status': 'success', 'shards': 0, 'rows': manifest['rows']}
+            
+            shard_tasks = [
+                export_parking_records_shard.s(job_dir, index, first_id, last_id)
+                for index, (first_id, last_id) in enumerate(ranges)
+            ]
+            if uses_broker():
+                chord(group(shard_tasks))(finish_parking_records_export.s(job_dir))
+            else:
+                run_local_chord(shard_tasks, finish_parking_records_export.s(job_dir), flask_app.config)
+            
+            print(f"✅ Admin export queued in {len(ranges)} shards")
+            return {'status': 'success', 'shards': len(ranges)}
+            
+        except Exception as e:
+            print(f"❌ Error starting admin export: {str(e)}")
+            fail_admin_export(job_dir, str(e))
+            return {'status': 'failed', 'message': str(e)}
 
+@celery.task(bind=True)
+def export_parking_records_shard(self, job_dir, index, first_id, last_id):
+    
+    flask_app = get_flask_app()
+    with flask_app.app_context():
+        try:
+            shard = write_shard(job_dir, index, first_id, last_id, flask_app.config['ADMIN_EXPORT_BATCH_SIZE'])
+            print(f"✅ Admin export shard {index} ({first_id}-{last_id}): {shard['rows']} records")
+            return dict(shard, status='success')
+            
+        except Exception as e:
+            print(f"❌ Error exporting shard {index} ({first_id}-{last_id}): {str(e)}")
+            return {'status': 'failed', 'index': index, 'message': str(e)}
 
-
-
+@celery.task(bind=True)
+def finish_parking_records_export(self, shards, job_dir):
+    
+    try:
+        failed = [shard for shard in shards if shard['status'] != 'success']
+        if failed:
+            message = f"{len(failed)} shard(s) failed: {failed[0]['message']}"
+            fail_admin_export(job_dir, message)
+            print(f"❌ Admin export failed: {message}")
+            return {'status': 'failed', 'message': message}
+        
+        manifest = stitch_admin_export(job_dir, shards)
+        print(f"✅ Admin export finished: {manifest['rows']} records, {manifest['bytes']} bytes")
+        return {'status': 'success', 'rows': manifest['rows'], 'bytes': manifest['bytes']}
+        
+    except Exception as e:
+        print(f"❌ Error stitching admin export: {str(e)}")
+        fail_admin_export(job_dir, str(e))
+        return {'status': 'failed', 'message': str(e)}
 
 # Additional utility tasks
 @celery.task(bind=True)
@@ -733,18 +793,24 @@ def check_parking_lot_availability(self):
     flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            lots = ParkingLot.query.filter_by(is_active=True).all()
+            lots = get_lot_availability()
             updated_lots = []
             
+            # Occupancy gauges for /metrics, read from the cache at scrape time
+            cache.set(OCCUPANCY_SNAPSHOT_KEY, {
+                'taken_at': time.time(),
+                'lots': [{key: lot[key] for key in ('lot_id', 'lot_name', 'total_spots', 'occupied_spots')} for lot in lots]
+            }, timeout=flask_app.config['OCCUPANCY_SNAPSHOT_TTL'])
+            
             for lot in lots:
-                total_spots = ParkingSpot.query.filter_by(lot_id=lot.id, is_active=True).count()
-                occupied_spots = ParkingSpot.query.filter_by(lot_id=lot.id, status='O', is_active=True).count()
+                total_spots = lot['total_spots']
+                occupied_spots = lot['occupied_spots']
                 
                 if total_spots > 0:
                     availability_percentage = ((total_spots - occupied_spots) / total_spots) * 100
                     updated_lots.append({
-                        'lot_id': lot.id,
-                        'lot_name': lot.lot_name,
+                        'lot_id': lot['lot_id'],
+                        'lot_name': lot['lot_name'],
                         'total_spots': total_spots,
                         'occupied_spots': occupied_spots,
                         'availability_percentage': round(availability_percentage, 2)
@@ -760,31 +826,26 @@ def check_parking_lot_availability(self):
             print(f"❌ Error checking parking lot availability: {str(e)}")
             return {'status': 'failed', 'message': str(e)}
 
-@celery.task(bind=True)
+@celery.task(bind=True, ignore_result=True)
 def cleanup_old_records(self):
    
     flask_app = get_flask_app()
     with flask_app.app_context():
         try:
-            cutoff_date = datetime.now() - timedelta(days=365)
-            
-            old_records = ParkingRecord.query.filter(
-                ParkingRecord.parked_at < cutoff_date,
-                ParkingRecord.left_at != None  # Only completed bookings
-            ).all()
-            
-            deleted_count = len(old_records)
-            
-            for record in old_records:
-                db.session.delete(record)
-            
-            db.session.commit()
-            print(f"✅ Cleaned up {deleted_count} old parking records")
+            # Stream old completed records to gzip archives, then delete them in id-range batches
+            result = archive_old_records(
+                archive_dir=flask_app.config['ARCHIVE_DIR'],
+                retention_days=flask_app.config['RETENTION_DAYS'],
+                batch_size=flask_app.config['ARCHIVE_BATCH_SIZE'],
+                pause_seconds=flask_app.config['ARCHIVE_BATCH_PAUSE']
+            )
+            print(f"✅ Archived {result['archived_count']} and cleaned up {result['deleted_count']} old parking records")
             
             return {
                 'status': 'success',
-                'deleted_count': deleted_count,
-                'cutoff_date': cutoff_date.strftime('%Y-%m-%d')
+                'archived_count': result['archived_count'],
+                'deleted_count': result['deleted_count'],
+                'cutoff_date': result['cutoff_date']
             }
             
         except Exception as e:
@@ -792,7 +853,7 @@ def cleanup_old_records(self):
             print(f"❌ Error cleaning up old records: {str(e)}")
             return {'status': 'failed', 'message': str(e)}
 
-@celery.task(bind=True)
+@celery.task(bind=True, ignore_result=True)
 def send_parking_reminder_notification(self, user_id, message):
     
     flask_app = get_flask_app()
@@ -804,50 +865,15 @@ def send_parking_reminder_notification(self, user_id, message):
             
             subject = "🚗 Parking Reminder"
             
-            html_content = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <meta charset="UTF-8">
-                <title>Parking Reminder</title>
-                <style>
-                    body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
-                    .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
-                    .header {{ background: #007bff; color: white; padding: 20px; text-align: center; border-radius: 10px 10px 0 0; }}
-                    .content {{ background: #f8f9fa; padding: 30px; border-radius: 0 0 10px 10px; }}
-                    .footer {{ text-align: center; color: #666; margin-top: 30px; }}
-                </style>
-            </head>
-            <body>
-                <div class="container">
-                    <div class="header">
-                        <h1>🚗 Parking Reminder</h1>
-                    </div>
-                    
-                    <div class="content">
-                        <h2>Hello {user.fullname or user.username}!</h2>
-                        <p>{message}</p>
-                    </div>
-                    
-                    <div class="footer">
-                        <p>Parking Management System</p>
-                        <p>📧 Sent on {datetime.now().strftime('%B %d, %Y at %I:%M %p')}</p>
-                    </div>
-                </div>
-            </body>
-            </html>
-            """
-            
-            result = send_email_task.delay(
-                to=user.email,
-                subject=subject,
-                body=message,
-                html_body=html_content
-            )
+            html_content, text_content = render_email('parking_reminder.html', name=user.fullname or user.username, message=message)
+            
+            enqueue_email(user.email, subject, text_content, html_content)
+            db.session.commit()
+            kick_outbox()
             
             return {
                 'status': 'success',
-                'message': f'Reminder sent to {user.email}'
+                'message': f'Reminder queued for {user.email}'
             }
             
         except Exception as e:
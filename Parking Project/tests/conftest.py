@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import smtp_standin  # noqa: E402
+
+
+@pytest.fixture
+def make_app(tmp_path):
+    # Offline app: temporary SQLite file, SimpleCache, no broker, in-memory mail limiter
+    from main import create_app, upgrade_database
+    from models import db
+
+    def make(migrate=False, **config):
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path}/test.db',
+            'CACHE_TYPE': 'SimpleCache',
+            'CELERY_BROKER_URL': '',
+            'MAIL_SERVER': '127.0.0.1',
+            'MAIL_USE_TLS': False,
+            'MAIL_DEFAULT_SENDER': 'noreply@parkeasy.local',
+            'MAIL_RATE_PER_SECOND': 0,
+            'MAIL_RATE_LIMIT_REDIS_URL': '',
+            'METRICS_DIR': str(tmp_path / 'metrics'),
+            'PROFILE_DIR': str(tmp_path / 'profiles'),
+            'SLOW_QUERY_MS': 0,
+            **config
+        })
+        with app.app_context():
+            if migrate:
+                upgrade_database()  # the real schema, indexes included
+            else:
+                db.create_all(bind_key=None)  # db is shared: binds another test configured are not set up here
+        return app
+
+    return make
+
+
+@pytest.fixture
+def smtp_server():
+    servers = []
+
+    def start(drop_after=None):
+        server = smtp_standin.start(drop_after=drop_after)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def closed_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
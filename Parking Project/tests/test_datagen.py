@@ -0,0 +1,40 @@
+from datetime import date, datetime
+
+
+def test_end_day_is_included_in_full(make_app):
+    from datagen import generate, history_end
+    from models import db, ParkingRecord
+
+    end = history_end(date(2026, 1, 10))
+    assert end == datetime(2026, 1, 11)
+
+    app = make_app()
+    with app.app_context():
+        generate(lots=3, spots=9, users=5, records=2000, days=2, seed=7, end=end, batch_size=500)
+        first, last_parked, last_left = db.session.query(
+            db.func.min(ParkingRecord.parked_at), db.func.max(ParkingRecord.parked_at),
+            db.func.max(ParkingRecord.left_at)).one()
+
+    assert first >= datetime(2026, 1, 9)
+    assert last_parked.date() == date(2026, 1, 10)
+    assert last_left <= end
+
+
+def test_second_run_adds_to_a_populated_database(make_app):
+    from datagen import generate
+    from models import db, ParkingLot, User
+
+    app = make_app()
+    with app.app_context():
+        # Registered by hand with names the generator would otherwise pick next
+        db.session.add_all([User(username='user2', password='x', email='someone@example.com'),
+                            User(username='driver', password='x', email='user3@example.com'),
+                            ParkingLot(lot_name='Lot 000002', address='Road', pincode='123456',
+                                       price_per_hour=10, number_of_spots=0)])
+        db.session.commit()
+
+        generate(lots=2, spots=4, users=3, records=10, days=2, seed=7, batch_size=500)
+        generate(lots=2, spots=4, users=3, records=10, days=2, seed=7, batch_size=500)
+
+        assert User.query.count() == 8
+        assert ParkingLot.query.count() == 5
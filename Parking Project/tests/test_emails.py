@@ -0,0 +1,24 @@
+import pytest
+
+from email_render import sample_contexts
+
+
+@pytest.mark.parametrize('name', sorted(sample_contexts()))
+def test_text_template_matches_html(name):
+    # The .txt templates must say what the HTML says: compare with the text parsed from the HTML
+    from emails import html_to_text, render_email
+
+    template_name, make_context = sample_contexts()[name]
+    html, text = render_email(template_name, sent_on='October 01, 2026 at 09:00 AM', **make_context(1))
+
+    assert text == html_to_text(html)
+
+
+def test_csv_export_text_keeps_the_download_link():
+    from emails import html_to_text, render_email
+
+    html, text = render_email('csv_export.html', sent_on='today', name='Driver & Co', record_count=3,
+                              download_url='https://parkeasy.local/api/user/exports/job-1/download')
+
+    assert text == html_to_text(html)
+    assert 'Hello Driver & Co,' in text  # no HTML escaping in the plain-text part
@@ -0,0 +1,104 @@
+import gzip
+import sqlite3
+from datetime import datetime, timedelta
+
+
+def add_user_with_records(count=1):
+    from models import db, ParkingLot, ParkingRecord, ParkingSpot, User
+
+    user = User(username='driver', password='x', email='driver@example.com')
+    lot = ParkingLot(lot_name='Lot', address='Road', pincode='123456', price_per_hour=10, number_of_spots=1)
+    db.session.add_all([user, lot])
+    db.session.flush()
+    spot = ParkingSpot(spot_number='1', lot_id=lot.id, status='A')
+    db.session.add(spot)
+    db.session.flush()
+    for day in range(1, count + 1):
+        parked_at = datetime.now() - timedelta(days=day)
+        db.session.add(ParkingRecord(user_id=user.id, spot_id=spot.id, parked_at=parked_at,
+                                     left_at=parked_at + timedelta(hours=1), parking_cost=10))
+    db.session.commit()
+    return user.id
+
+
+def login(app, user_id):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+    return client
+
+
+def test_large_export_checks_reuse_on_primary(make_app, tmp_path):
+    # The replica is a copy taken before the last export finished: deciding
+    # reuse there would start a duplicate job instead of returning that file
+    from exports import export_fingerprint
+    from models import db, TaskStatus
+
+    primary, replica = tmp_path / 'test.db', tmp_path / 'replica.db'
+    app = make_app(SQLALCHEMY_BINDS={'replica_0': f'sqlite:///{replica}'}, DB_REPLICA_BINDS=['replica_0'],
+                   EXPORT_SYNC_MAX_ROWS=0)
+    with app.app_context():
+        user_id = add_user_with_records()
+
+    source, target = sqlite3.connect(primary), sqlite3.connect(replica)
+    source.backup(target)
+    source.close()
+    target.close()
+
+    export_file = tmp_path / 'export.csv.gz'
+    export_file.write_bytes(b'')
+    with app.app_context():
+        fingerprint, count = export_fingerprint(user_id)
+        db.session.add(TaskStatus(user_id=user_id, task_type='csv_export', status='completed', job_id='finished-job',
+                                  fingerprint=fingerprint, rows_done=count, rows_total=count,
+                                  result_file_path=str(export_file)))
+        db.session.commit()
+
+    response = login(app, user_id).get('/api/user/export.csv')
+
+    assert response.status_code == 202
+    assert response.get_json()['job_id'] == 'finished-job'
+    with app.app_context():
+        assert TaskStatus.query.count() == 1
+
+
+def test_repeated_export_request_joins_the_running_job(make_app):
+    from exports import export_fingerprint
+    from models import db, TaskStatus
+
+    app = make_app()
+    with app.app_context():
+        user_id = add_user_with_records()
+        fingerprint, count = export_fingerprint(user_id)
+        db.session.add(TaskStatus(user_id=user_id, task_type='csv_export', status='processing', job_id='running-job',
+                                  fingerprint=fingerprint, rows_done=0, rows_total=count))
+        db.session.commit()
+
+    response = login(app, user_id).post('/api/user/export-csv')
+
+    assert response.get_json()['job_id'] == 'running-job'
+    assert response.get_json()['status'] == 'processing'
+    with app.app_context():
+        assert TaskStatus.query.count() == 1
+
+
+def test_concurrent_writers_of_one_export_do_not_share_a_temp_file(make_app, tmp_path):
+    # A second job for the same records starts while the first is still writing
+    from exports import write_export
+
+    app = make_app()
+    path = str(tmp_path / 'exports' / 'user_1' / 'same-fingerprint.csv.gz')
+    with app.app_context():
+        user_id = add_user_with_records(3)
+        started = []
+
+        def second_writer_starts(rows_done):
+            if not started:
+                started.append(rows_done)
+                write_export(user_id, path, batch_size=1)
+
+        rows = write_export(user_id, path, batch_size=1, on_progress=second_writer_starts)
+
+    assert rows == 3
+    with gzip.open(path, 'rt') as f:
+        assert len(f.read().splitlines()) == 4  # header and three records
@@ -0,0 +1,16 @@
+def test_app_config_chooses_the_in_process_executor(make_app, monkeypatch):
+    # The environment says Redis; the app config passed to create_app says no broker
+    import celery_worker
+    import tasks
+
+    monkeypatch.setattr(celery_worker.celery.conf, 'broker_url', 'redis://localhost:6379/0')
+    monkeypatch.setattr(celery_worker, '_flask_app', celery_worker._flask_app)
+    submitted = []
+    monkeypatch.setattr(celery_worker, 'submit_local', lambda task, *args: submitted.append(task.name))
+
+    app = make_app()
+    with app.app_context():
+        tasks.dispatch_email_outbox.delay()
+
+    assert not celery_worker.uses_broker()
+    assert submitted == ['tasks.dispatch_email_outbox']
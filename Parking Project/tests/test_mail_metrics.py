@@ -0,0 +1,22 @@
+def admin_client(app):
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['is_admin'] = True
+    return client
+
+
+def test_mail_metrics_without_broker(make_app):
+    # CELERY_BROKER_URL='' is the in-process executor: there is no broker queue to measure
+    app = make_app()
+    response = admin_client(app).get('/admin/metrics/mail')
+
+    assert response.status_code == 200
+    assert response.get_json()['queue_depth']['broker'] is None
+
+
+def test_broker_queue_depth_ignores_non_redis_brokers():
+    from ratelimit import broker_queue_depth
+
+    assert broker_queue_depth('', ('notifications',)) is None
+    assert broker_queue_depth('amqp://guest@localhost//', ('notifications',)) is None
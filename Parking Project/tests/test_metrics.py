@@ -0,0 +1,48 @@
+import json
+import os
+
+
+def dead_pid():
+    from metrics import _alive
+
+    pid = 4000000
+    while _alive(pid):
+        pid += 1
+    return pid
+
+
+def write_snapshot(path, pid, count):
+    with open(path, 'w') as f:
+        json.dump({'pid': pid, 'counters': [['parkeasy_tasks_total', [['task', 'x']], count]],
+                   'gauges': [['parkeasy_db_pool_checked_out', [], 3]], 'histograms': []}, f)
+
+
+def test_files_of_exited_processes_are_adopted_on_startup(tmp_path):
+    from metrics import Registry
+
+    write_snapshot(tmp_path / f'{dead_pid()}-0123456789ab.json', dead_pid(), 5)
+    write_snapshot(tmp_path / f'{dead_pid()}.json', dead_pid(), 2)  # named before the token existed
+    registry = Registry()
+    registry.inc('parkeasy_tasks_total', (('task', 'x'),))
+
+    registry.flush(str(tmp_path))
+
+    assert os.listdir(tmp_path) == [registry.file_name]
+    with open(tmp_path / registry.file_name) as f:
+        snapshot = json.load(f)
+    assert snapshot['counters'] == [['parkeasy_tasks_total', [['task', 'x']], 8]]
+    assert snapshot['gauges'] == []  # gauges describe processes that are gone
+
+
+def test_process_reusing_a_pid_keeps_the_old_counts(tmp_path):
+    # An exited worker had this pid; the new process must neither overwrite nor drop its file's counts
+    from metrics import Registry
+
+    write_snapshot(tmp_path / f'{os.getpid()}-0123456789ab.json', os.getpid(), 5)
+    registry = Registry()
+
+    registry.flush(str(tmp_path))
+
+    assert os.listdir(tmp_path) == [registry.file_name]
+    with open(tmp_path / registry.file_name) as f:
+        assert json.load(f)['counters'] == [['parkeasy_tasks_total', [['task', 'x']], 5]]
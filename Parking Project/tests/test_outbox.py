@@ -0,0 +1,117 @@
+from datetime import datetime
+
+
+def queue_emails(count):
+    from models import db
+    from outbox import enqueue_email
+
+    for i in range(count):
+        enqueue_email(f'user{i}@example.com', f'Test {i}', 'hello')
+    db.session.commit()
+
+
+def outbox_rows():
+    from models import EmailOutbox
+
+    return [(row.status, row.attempts, row.last_error) for row in EmailOutbox.query.order_by(EmailOutbox.id)]
+
+
+def test_unreachable_server_backs_off(make_app, closed_port):
+    from models import EmailOutbox
+    from tasks import drain_outbox
+
+    app = make_app(MAIL_PORT=closed_port)
+    with app.app_context():
+        queue_emails(2)
+        totals = drain_outbox(app.config)
+
+        assert totals == {'sent': 0, 'failed': 0, 'retrying': 2}
+        for status, attempts, last_error in outbox_rows():
+            assert (status, attempts) == ('pending', 1)
+            assert last_error.startswith('connect failed')
+        assert all(row.next_attempt_at > datetime.utcnow() for row in EmailOutbox.query)
+
+
+def test_partial_batch_marks_delivered_rows_sent(make_app, smtp_server):
+    from tasks import drain_outbox
+
+    server = smtp_server(drop_after=2)
+    # No resend on a dropped connection: the interrupted row is left to the outbox backoff
+    app = make_app(MAIL_PORT=server.server_address[1], MAIL_RETRY_ATTEMPTS=1)
+    with app.app_context():
+        queue_emails(3)
+        totals = drain_outbox(app.config)
+
+        assert totals == {'sent': 2, 'failed': 0, 'retrying': 1}
+        assert [row[:2] for row in outbox_rows()] == [('sent', 1), ('sent', 1), ('pending', 1)]
+    assert server.messages == 2
+
+
+def test_unexpected_error_counts_as_attempt(make_app, monkeypatch):
+    import tasks
+
+    def broken(messages):
+        raise RuntimeError('limiter exploded')
+
+    monkeypatch.setattr(tasks, 'send_messages', broken)
+    app = make_app(OUTBOX_MAX_ATTEMPTS=1)
+    with app.app_context():
+        queue_emails(2)
+        totals = tasks.drain_outbox(app.config)
+
+        assert totals == {'sent': 0, 'failed': 2, 'retrying': 0}
+        assert outbox_rows() == [('failed', 1, 'limiter exploded')] * 2
+
+
+def test_new_lot_announcement_waits_out_a_broker_outage(make_app, monkeypatch):
+    import routes
+    import tasks
+    from models import db, EmailOutbox
+
+    monkeypatch.setattr(routes, 'kick_outbox', lambda: None)
+    app = make_app()
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = 1
+        session['is_admin'] = True
+    response = client.post('/admin/lots', json={'lot_name': 'Lot', 'address': 'Road', 'pincode': '123456',
+                                                'price_per_hour': 10, 'number_of_spots': 2})
+    assert response.status_code == 201
+    lot_id = response.get_json()['id']
+
+    queued = []
+
+    def broker_down(lot_id):
+        raise ConnectionError('broker unavailable')
+
+    with app.app_context():
+        assert [(row.kind, row.ref_id, row.status) for row in EmailOutbox.query] == [('new_lot', lot_id, 'pending')]
+
+        monkeypatch.setattr(tasks.send_instant_new_lot_email, 'delay', broker_down)
+        assert tasks.drain_outbox(app.config) == {'sent': 0, 'failed': 0, 'retrying': 1}
+
+        EmailOutbox.query.update({'next_attempt_at': datetime.utcnow()})  # backoff over
+        db.session.commit()
+        monkeypatch.setattr(tasks.send_instant_new_lot_email, 'delay', queued.append)
+        assert tasks.drain_outbox(app.config) == {'sent': 1, 'failed': 0, 'retrying': 0}
+        assert outbox_rows() == [('sent', 2, None)]
+    assert queued == [lot_id]
+
+
+def test_results_after_a_lost_claim_are_not_recorded(make_app):
+    from models import db, EmailOutbox
+    from outbox import claim_batch, record_results
+
+    app = make_app()
+    with app.app_context():
+        queue_emails(1)
+        batch = claim_batch(10, 300)
+        token = batch[0].claim_token
+        # The lease ran out mid-send and another dispatcher claimed the row
+        EmailOutbox.query.update({'claim_token': 'other-dispatcher'})
+        db.session.commit()
+
+        counts = record_results(batch, [{'status': 'success'}], token, 5, 30, 3600)
+
+        assert counts == {'sent': 0, 'failed': 0, 'retrying': 0}
+        assert [(row.status, row.claim_token) for row in EmailOutbox.query] == [('sending', 'other-dispatcher')]
@@ -0,0 +1,16 @@
+import pytest
+
+from commands import explain, full_scans, hot_queries
+
+
+@pytest.mark.parametrize('name', [name for name, _ in hot_queries()])
+def test_hot_query_uses_an_index(make_app, name):
+    from models import db
+
+    app = make_app(migrate=True)
+    with app.app_context():
+        stmt = dict(hot_queries())[name]
+        plan = explain(stmt)
+        db.session.rollback()
+
+    assert not full_scans(plan), '\n'.join(plan)
@@ -0,0 +1,62 @@
+import threading
+from datetime import datetime, timedelta
+
+
+def add_booking(vehicle_number='KA01AB1234'):
+    from models import db, ParkingLot, ParkingRecord, ParkingSpot, User
+
+    user = User(username='driver', password='x', email='driver@example.com')
+    lot = ParkingLot(lot_name='Lot', address='Road', pincode='123456', price_per_hour=10, number_of_spots=1)
+    db.session.add_all([user, lot])
+    db.session.flush()
+    spot = ParkingSpot(spot_number='1', lot_id=lot.id, status='A')
+    db.session.add(spot)
+    db.session.flush()
+    # This month, so the report is never final
+    parked_at = datetime.now().replace(day=1, hour=0, minute=30)
+    record = ParkingRecord(user_id=user.id, spot_id=spot.id, vehicle_number=vehicle_number, parked_at=parked_at,
+                           left_at=parked_at + timedelta(hours=1), parking_cost=10)
+    db.session.add(record)
+    db.session.commit()
+    return user, record
+
+
+def test_edited_record_rebuilds_the_report(make_app):
+    from models import db
+    from reports import get_monthly_reports
+
+    app = make_app()
+    with app.app_context():
+        user, record = add_booking()
+        today = datetime.now()
+        [report] = get_monthly_reports([user], today.year, today.month)
+        assert 'KA01AB1234' in report.text
+
+        record.vehicle_number = 'KA01XY9999'
+        db.session.commit()
+        [report] = get_monthly_reports([user], today.year, today.month)
+
+        assert 'KA01XY9999' in report.text
+
+
+def test_report_locked_by_another_worker_is_waited_for(make_app):
+    from extensions import cache
+    from reports import _report_lock_key, get_monthly_reports
+
+    app = make_app()
+    with app.app_context():
+        user, _ = add_booking()
+        today = datetime.now()
+        lock_key = _report_lock_key(user.id, today.year, today.month)
+        cache.add(lock_key, 1, timeout=60)
+
+        def other_worker_gives_up():
+            with app.app_context():
+                cache.delete(lock_key)
+
+        release = threading.Timer(0.5, other_worker_gives_up)
+        release.start()
+        reports = get_monthly_reports([user], today.year, today.month, lock_timeout=5)
+        release.join()
+
+        assert [report.user_id for report in reports] == [user.id]
@@ -0,0 +1,51 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+
+def archived_ids(archive_dir):
+    ids = []
+    for root, _, files in os.walk(archive_dir):
+        for name in files:
+            if name.endswith('.jsonl.gz'):
+                with gzip.open(os.path.join(root, name), 'rt') as f:
+                    ids.extend(json.loads(line)['id'] for line in f)
+    return sorted(ids)
+
+
+def test_record_released_mid_batch_is_not_deleted_unarchived(make_app, tmp_path, monkeypatch):
+    import retention
+    from models import db, ParkingLot, ParkingRecord, ParkingSpot, User
+
+    app = make_app()
+    with app.app_context():
+        user = User(username='driver', password='x', email='driver@example.com')
+        lot = ParkingLot(lot_name='Lot', address='Road', pincode='123456', price_per_hour=10, number_of_spots=1)
+        db.session.add_all([user, lot])
+        db.session.flush()
+        spot = ParkingSpot(spot_number='1', lot_id=lot.id, status='A')
+        db.session.add(spot)
+        db.session.flush()
+        old = datetime.now() - timedelta(days=400)
+        records = [ParkingRecord(user_id=user.id, spot_id=spot.id, parked_at=old,
+                                 left_at=None if i == 1 else old + timedelta(hours=1)) for i in range(3)]
+        db.session.add_all(records)
+        db.session.commit()
+        ids = [record.id for record in records]
+
+        write_batch = retention._write_batch
+
+        def write_then_release(archive_dir, rows):
+            write_batch(archive_dir, rows)
+            # Released between the batch select and the delete
+            db.session.execute(db.update(ParkingRecord).where(ParkingRecord.id == ids[1])
+                               .values(left_at=datetime.now()))
+            db.session.commit()
+
+        monkeypatch.setattr(retention, '_write_batch', write_then_release)
+        result = retention.archive_old_records(str(tmp_path / 'archive'), retention_days=365)
+
+        assert archived_ids(tmp_path / 'archive') == [ids[0], ids[2]]
+        assert result['deleted_count'] == 2
+        assert [row.id for row in ParkingRecord.query] == [ids[1]]
@@ -0,0 +1,30 @@
+from flask_mail import Message
+
+
+def messages(count):
+    return [Message(subject=f'Test {i}', recipients=[f'user{i}@example.com'], body='hello') for i in range(count)]
+
+
+def test_reconnects_when_server_drops_mid_batch(make_app, smtp_server):
+    from tasks import send_messages
+
+    server = smtp_server(drop_after=2)
+    app = make_app(MAIL_PORT=server.server_address[1])
+    with app.app_context():
+        results = send_messages(messages(5))
+
+    assert [r['status'] for r in results] == ['success'] * 5
+    assert [r['recipient'] for r in results] == [f'user{i}@example.com' for i in range(5)]
+    assert server.messages == 5
+    assert server.connections == 3
+
+
+def test_unreachable_server_fails_every_message(make_app, closed_port):
+    from tasks import send_messages
+
+    app = make_app(MAIL_PORT=closed_port)
+    with app.app_context():
+        results = send_messages(messages(3))
+
+    assert [r['status'] for r in results] == ['failed'] * 3
+    assert all(r['message'].startswith('connect failed') for r in results)